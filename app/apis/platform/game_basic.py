@@ -1,36 +1,53 @@
 import gc
 
+from app.core import EnvConfig
 from app.log import ExceptionLogger
 from app.response import ResponseDict, JSONResponse
 from app.network import BasicAPI
 from app.models import GameModel
+from app.middlewares import StampedeCache
+
+config = EnvConfig.get_config()
+
 
 class GameBasic:
+    # 游戏版本的缓存，过期后 GAME_VERSION_CACHE_STALE_TTL 秒内由一个worker刷新，其他请求返回旧的版本
+    version_cache = StampedeCache('game_version', config.GAME_VERSION_CACHE_TTL, config.GAME_VERSION_CACHE_STALE_TTL)
+
     @ExceptionLogger.handle_program_exception_async
     async def get_game_version(region_id: int) -> ResponseDict:
         '''获取游戏当前版本
         
         如果网络请求失败则从数据库中读取上次存储的数据
-        确保在游戏服务器维护的时候能够获取到数据'''
+        确保在游戏服务器维护的时候能够获取到数据
+
+        结果缓存 GAME_VERSION_CACHE_TTL 秒，只缓存成功的结果'''
         try:
-            result = await BasicAPI.get_game_version(region_id)
-            if result.get('code', None) != 1000:
-                return result
-            if result['data']:
-                data = {
-                    'region_id': region_id,
-                    'version': result['data']['version']
-                }
-                result = await GameModel.update_game_version(region_id, result['data']['version'])
-                if result['code'] != 1000:
-                    return result
-                else:
-                    return JSONResponse.get_success_response(data)
-            else:
-                result = await GameModel.get_game_version(region_id)
-                return result
+            return await GameBasic.version_cache.get_or_load(
+                region_id,
+                lambda: GameBasic.load_game_version(region_id),
+                cacheable=lambda result: result.get('code', None) == 1000
+            )
         except Exception as e:
             raise e
         finally:
             gc.collect()
-        
\ No newline at end of file
+
+    async def load_game_version(region_id: int) -> ResponseDict:
+        "请求接口获取游戏版本并写入数据库"
+        result = await BasicAPI.get_game_version(region_id)
+        if result.get('code', None) != 1000:
+            return result
+        if result['data']:
+            data = {
+                'region_id': region_id,
+                'version': result['data']['version']
+            }
+            result = await GameModel.update_game_version(region_id, result['data']['version'])
+            if result['code'] != 1000:
+                return result
+            else:
+                return JSONResponse.get_success_response(data)
+        else:
+            result = await GameModel.get_game_version(region_id)
+            return result
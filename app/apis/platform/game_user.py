@@ -2,7 +2,7 @@ import gc
 
 from app.log import ExceptionLogger
 from app.response import ResponseDict, JSONResponse
-from app.models import UserModel, ClanModel, UserAccessToken
+from app.models import UserModel, ClanModel, UserAccessToken, UserWriteBuffer
 from app.network import BasicAPI
 from app.utils import UtilityFunctions
 from .user_cache import UserCache
@@ -18,28 +18,18 @@ class GameUser:
         finally:
             gc.collect()
 
-    # @ExceptionLogger.handle_program_exception_async
-    # async def update_user_data(user_data: dict) -> ResponseDict:
-    #     try:
-    #         if user_data.get('user_recent', None):
-    #             celery_app.send_task(
-    #                 name="check_user_recent",
-    #                 args=[user_data['user_recent']]
-    #             )
-    #         if user_data.get('user_basic', None):
-    #             celery_app.send_task(
-    #                 name="check_user_basic",
-    #                 args=[user_data['user_basic']]
-    #             )
-    #         if user_data.get('user_info', None):
-    #             celery_app.send_task(
-    #                 name="check_user_info",
-    #                 args=[user_data['user_info']]
-    #             )
-    #         if user_data.get('user_cache', None):
-    #             await UserCache.update_user_cache_data(user_data['user_cache'])
-    #         return JSONResponse.API_1000_Success
-    #     except Exception as e:
-    #         raise e
-    #     finally:
-    #         gc.collect()
+    @ExceptionLogger.handle_program_exception_async
+    async def update_user_data(user_data: dict) -> ResponseDict:
+        """更新用户的数据
+
+        user_basic/user_info/user_recent 写入写缓冲，由后台任务批量写入数据库
+        """
+        try:
+            if user_data.get('user_cache', None):
+                return JSONResponse.API_7000_InvalidParameter
+            result = await UserWriteBuffer.push(user_data)
+            return result
+        except Exception as e:
+            raise e
+        finally:
+            gc.collect()
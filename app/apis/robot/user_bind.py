@@ -1,9 +1,11 @@
-import json
+import asyncio
 
 from app.log import ExceptionLogger
 from app.response import JSONResponse
-from app.models import BotUserModel, UserAccessToken, UserAccessToken2
-from app.middlewares import RedisConnection
+from app.models import BotUserModel, UserAccessToken, UserAccessToken2, UserWriteBuffer
+from app.middlewares import RedisConnection, BindCache
+from app.network import NegativeCache, OfficialAPI
+from app.utils import UtilityFunctions
 
 class BotUser:
     @ExceptionLogger.handle_program_exception_async
@@ -22,19 +24,12 @@ class BotUser:
             ResponseDict
         '''
         try:
-            # 返回数据的格式
-            data = None
-            redis = RedisConnection.get_connection()
-            key = f"app_bot:bind_cache:{platform}:{user_id}"
-            result = await BotUserModel.get_user_bind(platform, user_id)
-            if result.get('code',None) != 1000:
-                return result
-            else:
-                data = result['data']
-                if data:
-                    await redis.set(name=key, value=json.dumps(result['data']),ex=24*60*60)
-            # 返回结果
-            return JSONResponse.get_success_response(data)
+            # 依次读取进程内缓存和Redis缓存，未命中时只有一个请求读取数据库
+            return await BindCache.get_or_load(
+                platform,
+                user_id,
+                lambda: BotUserModel.get_user_bind(platform, user_id)
+            )
         except Exception as e:
             raise e
         
@@ -56,19 +51,19 @@ class BotUser:
         try:
             # 返回数据的格式
             data = None
-            redis = RedisConnection.get_connection()
-            key = f"app_bot:bind_cache:{user_data['platform']}:{user_data['user_id']}"
-            await redis.delete(key)
             result = await BotUserModel.post_user_bind(user_data)
             if result.get('code',None) != 1000:
                 return result
             else:
                 data = result['data']
-                await redis.set(
-                    name=key, 
-                    value=json.dumps({'account_id': user_data['account_id'], 'region_id': user_data['region_id']}), 
-                    ex=24*60*60
+                # 事务提交后更新缓存，同时让正在读取数据库的请求放弃写回旧数据
+                await BindCache.update(
+                    user_data['platform'],
+                    user_data['user_id'],
+                    {'region_id': user_data['region_id'], 'account_id': user_data['account_id']}
                 )
+                # 新绑定的用户可能之前被记录为不存在或隐藏战绩
+                await NegativeCache.invalidate_user(user_data['account_id'], user_data['region_id'])
             # 返回结果
             return JSONResponse.get_success_response(data)
         except Exception as e:
@@ -106,6 +101,84 @@ class BotUser:
         except Exception as e:
             raise e
             
+    @ExceptionLogger.handle_program_exception_async
+    async def get_user_basic_batch(users: list[tuple[int, int]]):
+        '''批量获取用户的基本信息
+
+        用于bot渲染工会成员列表和对局名单，所有用户的数据通过一次查询获取
+
+        参数:
+            users: [(account_id, region_id), ...]
+
+        返回:
+            ResponseDict，data为和users顺序一致的列表，每一项和 get_user_basic 的返回值相同
+        '''
+        try:
+            # 获取用户相关的access token
+            ac_result = await UserAccessToken.get_ac_value_batch(users)
+            if ac_result.get('code') != 1000:
+                return ac_result
+            # 获取用户的名称和工会数据
+            user_result = await BotUserModel.get_user_data_batch(users)
+            if user_result.get('code') != 1000:
+                return user_result
+            await BotUser.resolve_default_names(users, user_result['data'])
+            data = []
+            for (account_id, region_id), user_data in zip(users, user_result['data']):
+                data.append({
+                    'region_id': region_id,
+                    'user': user_data['user'],
+                    'clan': None if user_data['expired'] else user_data['clan'],
+                    'token': {
+                        'ac': JSONResponse.get_success_response(ac_result['data'].get((account_id, region_id))),
+                        'ac2': UserAccessToken2.get_ac_value_by_id(account_id, region_id)
+                    }
+                })
+            return JSONResponse.get_success_response(data)
+        except Exception as e:
+            raise e
+
+    async def resolve_default_names(users: list[tuple[int, int]], user_list: list[dict]) -> None:
+        '''通过官方接口获取默认名称用户的真实名称
+
+        数据库中不存在或者还没有更新过名称的用户返回的是默认名称，每个服务器每100个用户只需要一次官方接口请求
+
+        获取到的名称通过 UserWriteBuffer 写入数据库，获取失败时保留默认名称
+
+        参数:
+            users: [(account_id, region_id), ...]
+            user_list: get_user_data_batch 返回的数据，直接修改其中的名称
+        '''
+        regions: dict[int, list[int]] = {}
+        for (account_id, region_id), user_data in zip(users, user_list):
+            if user_data['user']['name'] == UtilityFunctions.get_user_default_name(account_id):
+                regions.setdefault(region_id, []).append(account_id)
+        if not regions:
+            return
+        region_ids = list(regions)
+        results = await asyncio.gather(*[
+            OfficialAPI.get_account_info_batch(region_id, regions[region_id], fields='nickname')
+            for region_id in region_ids
+        ])
+        names = {}
+        for region_id, result in zip(region_ids, results):
+            if result.get('status') == 'error':
+                continue
+            for account_id, response in result.items():
+                if response.get('code') != 1000 or not response['data'].get('nickname'):
+                    continue
+                names[(account_id, region_id)] = response['data']['nickname']
+                await UserWriteBuffer.push({
+                    'user_basic': {
+                        'account_id': account_id,
+                        'region_id': region_id,
+                        'nickname': response['data']['nickname']
+                    }
+                })
+        for (account_id, region_id), user_data in zip(users, user_list):
+            if (account_id, region_id) in names:
+                user_data['user']['name'] = names[(account_id, region_id)]
+
     @ExceptionLogger.handle_program_exception_async
     async def get_clan_basic(clan_id: int, region_id: int):
         try:
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class LoadConfig(BaseSettings):
@@ -13,6 +15,32 @@ class LoadConfig(BaseSettings):
     MYSQL_USERNAME: str
     MYSQL_PASSWORD: str
 
+    # MySQL连接池配置
+    MYSQL_POOL_MIN_SIZE: int = 1
+    MYSQL_POOL_MAX_SIZE: int = 10
+    MYSQL_POOL_RECYCLE: int = 3600
+    MYSQL_CONNECT_TIMEOUT: float = 5.0
+    MYSQL_ACQUIRE_TIMEOUT: float = 3.0
+    MYSQL_REAPER_INTERVAL: float = 30.0
+
+    # MySQL只读副本配置，格式为 host:port,host:port
+    MYSQL_REPLICA_HOSTS: Optional[str] = None
+    MYSQL_REPLICA_POOL_MAX_SIZE: int = 10
+    MYSQL_REPLICA_MAX_LAG: float = 5.0
+    MYSQL_REPLICA_CHECK_INTERVAL: float = 10.0
+    MYSQL_READ_YOUR_WRITES_WINDOW: float = 10.0
+
+    # 数据库慢查询记录配置，语句耗时超过阈值(秒)的model方法会记录SQL和EXPLAIN，不包括等待连接的时间
+    DB_SLOW_QUERY_THRESHOLD: float = 0.5
+    DB_SLOW_QUERY_LOG_SIZE: int = 100
+
+    # 用户数据写缓冲配置，按数量或者时间间隔(秒)批量写入数据库
+    WRITE_BUFFER_BATCH_SIZE: int = 500
+    WRITE_BUFFER_FLUSH_INTERVAL: float = 1.0
+    WRITE_BUFFER_CLAIM_IDLE: float = 60.0
+    # 超过投递次数仍然无法写入的数据移入死信Stream
+    WRITE_BUFFER_MAX_DELIVERIES: int = 3
+
     DB_NAME_MAIN: str
     DB_NAME_BOT: str
     DB_NAME_SHIP: str
@@ -30,6 +58,95 @@ class LoadConfig(BaseSettings):
     WG_API_TOKEN: str
     LESTA_API_TOKEN: str
 
+    # 上游接口代理池配置
+    USE_PROXY: bool = False
+    PROXY_CONFIG_PATH: Optional[str] = None
+    PROXY_RELOAD_INTERVAL: float = 10.0
+    PROXY_ERROR_PENALTY: float = 5.0
+    PROXY_EJECT_FAILURES: int = 3
+    PROXY_EJECT_SECONDS: float = 30.0
+
+    # 上游接口连接池配置
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False
+
+    # 上游接口并发限制配置
+    UPSTREAM_MIN_CONCURRENCY: int = 1
+    UPSTREAM_MAX_CONCURRENCY: int = 32
+    UPSTREAM_INITIAL_CONCURRENCY: int = 8
+    UPSTREAM_QUEUE_TIMEOUT: float = 5.0
+
+    # 上游接口熔断器配置
+    BREAKER_WINDOW_SIZE: int = 20
+    BREAKER_MIN_REQUESTS: int = 10
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_OPEN_SECONDS: float = 30.0
+    BREAKER_HALF_OPEN_PROBES: int = 3
+
+    # 上游接口对冲请求配置
+    HEDGE_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_SAMPLES: int = 50
+    HEDGE_SAMPLE_SIZE: int = 500
+    HEDGE_MIN_DELAY: float = 0.05
+    HEDGE_BUDGET_RATIO: float = 0.05
+    HEDGE_MAX_BUDGET: float = 10.0
+
+    # 官方接口批量请求的合并窗口(秒)
+    OFFICIAL_BATCH_WINDOW: float = 0.005
+
+    # 上游接口响应缓存配置(秒)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_ACCOUNT: int = 60
+    RESPONSE_CACHE_TTL_ACCOUNT_CLAN: int = 300
+    RESPONSE_CACHE_TTL_ACCOUNT_SHIPS: int = 60
+    RESPONSE_CACHE_TTL_CLAN: int = 300
+    RESPONSE_CACHE_TTL_ENCYCLOPEDIA: int = 86400
+    RESPONSE_CACHE_STALE_TTL: int = 60
+
+    # 上游接口负缓存配置(秒)
+    NEGATIVE_CACHE_ENABLED: bool = True
+    NEGATIVE_CACHE_TTL_USER_NOT_EXIST: int = 21600
+    NEGATIVE_CACHE_TTL_CLAN_NOT_EXIST: int = 21600
+    NEGATIVE_CACHE_TTL_HIDDEN_PROFILE: int = 3600
+
+    # bot用户绑定信息缓存配置(秒)
+    BIND_CACHE_TTL: int = 86400
+    BIND_CACHE_NEGATIVE_TTL: int = 300
+    BIND_CACHE_LOCAL_SIZE: int = 1024
+    BIND_CACHE_LOCAL_TTL: float = 10.0
+
+    # bot用户和工会基本信息缓存配置(秒)
+    PROFILE_CACHE_LOCAL_SIZE: int = 4096
+    PROFILE_CACHE_LOCAL_TTL: float = 300.0
+    PROFILE_CACHE_STALE_TTL: int = 300
+
+    # 缓存击穿保护配置，STAMPEDE_BETA越大越早刷新，加载锁和等待时间(秒)
+    STAMPEDE_BETA: float = 1.0
+    STAMPEDE_LOCK_TTL: int = 10
+    STAMPEDE_WAIT: float = 1.0
+
+    # 游戏版本缓存配置(秒)，过期后的STALE_TTL内返回旧数据并在后台刷新
+    GAME_VERSION_CACHE_TTL: int = 300
+    GAME_VERSION_CACHE_STALE_TTL: int = 86400
+
+    # 接口限流配置，格式为 limit/period，例如 20/10 表示10秒内最多20次请求
+    RATE_LIMIT_ANONYMOUS: str = '20/10'
+    RATE_LIMIT_BOT: str = '100/10'
+    RATE_LIMIT_APP: str = '40/10'
+    # 单独限流的路径前缀，格式为 path=limit/period,path=limit/period
+    RATE_LIMIT_ROUTES: Optional[str] = None
+    RATE_LIMIT_LOCAL_SIZE: int = 10000
+
+    # IP白名单和黑名单的json文件，为空时使用代码中的列表
+    IP_ACCESS_LIST_PATH: Optional[str] = None
+    IP_ACCESS_LIST_RELOAD_INTERVAL: float = 10.0
+
+    # 接口请求次数统计写入Redis的间隔(秒)
+    API_CALLS_FLUSH_INTERVAL: float = 5.0
+
     class Config:
         env_file = ".env"
 
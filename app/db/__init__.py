@@ -1,7 +1,11 @@
 from .mysql import MysqlConnection
 from .sqlite import SQLiteConnection
+from .replica import ReplicaConnection
+from .session import DatabaseSession
 
 __all__ = [
     'MysqlConnection',
-    'SQLiteConnection'
+    'SQLiteConnection',
+    'ReplicaConnection',
+    'DatabaseSession'
 ]
\ No newline at end of file
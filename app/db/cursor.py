@@ -0,0 +1,24 @@
+import time
+from typing import Optional
+
+from aiomysql.pool import Pool
+from aiomysql.cursors import Cursor
+
+from app.log import QueryLog
+
+
+class TracedCursor(Cursor):
+    '''记录语句耗时的游标
+
+    每条语句的SQL、参数、耗时和行数会记录到当前model方法的调用中，用于统计方法的行数和记录慢查询
+
+    pool为执行语句的副本连接池，由 DatabaseSession 设置，为None时是主库，慢查询的EXPLAIN在同一个连接池中执行
+    '''
+    pool: Optional[Pool] = None
+
+    async def execute(self, query, args=None):
+        start_time = time.monotonic()
+        try:
+            return await super().execute(query, args)
+        finally:
+            QueryLog.record_statement(query, args, time.monotonic() - start_time, self.rowcount, self.pool)
@@ -0,0 +1,43 @@
+class LatencyHistogram:
+    '''延迟直方图
+
+    按照固定的桶(秒)统计延迟分布，桶的计数为累计值(小于等于该桶上限的数量)，格式和Prometheus的histogram一致
+    '''
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        "记录一次延迟(秒)"
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for index, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[index] += 1
+                break
+
+    def get_stats(self) -> dict:
+        '''获取直方图数据
+
+        返回：
+            {count, sum, avg, max, buckets: {le: count}}
+        '''
+        buckets = {}
+        total = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            buckets[str(bucket)] = total
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'avg': round(self.sum / self.count, 4) if self.count else 0,
+            'max': round(self.max, 4),
+            'buckets': buckets
+        }
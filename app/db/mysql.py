@@ -1,3 +1,5 @@
+import time
+import asyncio
 from typing import Optional
 
 import aiomysql
@@ -5,13 +7,56 @@ from aiomysql.pool import Pool
 from aiomysql.connection import Connection
 from aiomysql.cursors import Cursor
 
+from .metrics import LatencyHistogram
 from app.core import EnvConfig
 from app.core import api_logger
 
 
+class MysqlPoolTimeout(aiomysql.DatabaseError):
+    "等待连接池中的空闲连接超时"
+    pass
+
+
+async def acquire_connection(pool: Pool, timeout: float) -> Optional[Connection]:
+    '''从连接池中获取连接，最多等待timeout秒
+
+    超时或者被取消时，如果连接已经取到则放回连接池
+
+    返回：
+        Connection，超时返回None
+    '''
+    def release(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            pool.release(task.result())
+
+    task = asyncio.ensure_future(pool.acquire())
+    try:
+        done, _ = await asyncio.wait([task], timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        task.add_done_callback(release)
+        raise
+    if not done:
+        task.cancel()
+        task.add_done_callback(release)
+        return None
+    return task.result()
+
+
 class MysqlConnection:
-    '''管理MySQL连接'''
+    '''管理MySQL连接
+
+    连接池的大小、获取连接的超时时间以及连接检查的间隔通过配置文件设置
+
+    获取连接超过 MYSQL_ACQUIRE_TIMEOUT 秒时抛出 MysqlPoolTimeout，由 ExceptionLogger 转换为3000的错误返回，避免请求在连接池中无限排队
+
+    后台任务每隔 MYSQL_REAPER_INTERVAL 秒检查一次空闲连接，关闭已经断开的连接
+    '''
     __pool: Optional[Pool] = None
+    __reaper_task: Optional[asyncio.Task] = None
+    __waiters: int = 0
+    __acquire_latency = LatencyHistogram()
+    __stats = {'acquired': 0, 'timeouts': 0, 'reaped': 0}
     
     async def __init_connection(self) -> None:
         "初始化MySQL连接"
@@ -22,10 +67,13 @@ class MysqlConnection:
                 port=config.MYSQL_PORT, 
                 user=config.MYSQL_USERNAME, 
                 password=config.MYSQL_PASSWORD, 
-                pool_recycle=3600, # 设置连接的回收时间
-                autocommit=False   # 禁用隐式事务
-                # 由于禁用了隐式事务，必须确保事务被正确提交或者回滚！
-                # 如果未调用，事务将保持未提交状态，可能会导致死锁或连接超时问题
+                minsize=config.MYSQL_POOL_MIN_SIZE,
+                maxsize=config.MYSQL_POOL_MAX_SIZE,
+                connect_timeout=config.MYSQL_CONNECT_TIMEOUT,
+                pool_recycle=config.MYSQL_POOL_RECYCLE, # 设置连接的回收时间
+                autocommit=True    # 只读查询不需要开启事务
+                # 需要写入的操作通过 DatabaseSession.transaction() 显式开启事务，
+                # 由会话负责提交或者回滚，不要直接在连接上执行写入语句
             )
             api_logger.info('MySQL connection initialization is complete')
         except Exception as e:
@@ -66,7 +114,19 @@ class MysqlConnection:
         "获取一条连接，记得使用完要使用release释放"
         if not self.__pool:
             await self.__init_connection(self)
-        return await self.__pool.acquire()
+        config = EnvConfig.get_config()
+        start_time = time.monotonic()
+        self.__waiters += 1
+        try:
+            conn = await acquire_connection(self.__pool, config.MYSQL_ACQUIRE_TIMEOUT)
+        finally:
+            self.__waiters -= 1
+        if conn is None:
+            self.__stats['timeouts'] += 1
+            raise MysqlPoolTimeout(0, f'Timed out after {config.MYSQL_ACQUIRE_TIMEOUT}s waiting for a MySQL connection')
+        self.__acquire_latency.observe(time.monotonic() - start_time)
+        self.__stats['acquired'] += 1
+        return conn
 
     @classmethod
     async def release_connection(self, conn):
@@ -74,10 +134,66 @@ class MysqlConnection:
         if self.__pool:
             await self.__pool.release(conn)
 
+    @classmethod
+    def start_reaper(self) -> None:
+        "启动检查空闲连接的后台任务"
+        if self.__reaper_task is None or self.__reaper_task.done():
+            self.__reaper_task = asyncio.create_task(self.__reaper(self))
+
+    async def __reaper(self) -> None:
+        "定时检查空闲连接，关闭已经断开的连接"
+        config = EnvConfig.get_config()
+        while True:
+            await asyncio.sleep(config.MYSQL_REAPER_INTERVAL)
+            if not self.__pool or self.__pool.closed:
+                continue
+            try:
+                await self.__reap_idle_connections(self)
+            except Exception as e:
+                api_logger.warning(f'Failed to check the MySQL idle connections: {e}')
+
+    async def __reap_idle_connections(self) -> None:
+        "逐个取出空闲连接并ping，有请求在等待连接时停止检查"
+        pool = self.__pool
+        for _ in range(pool.freesize):
+            if self.__waiters > 0 or pool.freesize == 0:
+                return
+            conn: Connection = await pool.acquire()
+            try:
+                await conn.ping(reconnect=False)
+            except Exception:
+                # 断开的连接直接关闭，释放时连接池不会放回该连接
+                conn.close()
+                self.__stats['reaped'] += 1
+            finally:
+                await pool.release(conn)
+
+    @classmethod
+    def get_pool_stats(self) -> dict:
+        '''获取连接池的使用情况
+
+        返回：
+            {minsize, maxsize, size, in_use, idle, waiters, acquired, timeouts, reaped, acquire_latency}
+        '''
+        pool = self.__pool
+        data = {
+            'minsize': pool.minsize if pool else None,
+            'maxsize': pool.maxsize if pool else None,
+            'size': pool.size if pool else 0,
+            'in_use': (pool.size - pool.freesize) if pool else 0,
+            'idle': pool.freesize if pool else 0,
+            'waiters': self.__waiters
+        }
+        data.update(self.__stats)
+        data['acquire_latency'] = self.__acquire_latency.get_stats()
+        return data
+
     @classmethod
     async def close_mysql(self) -> None:
         "关闭MySQL连接"
         try:
+            if self.__reaper_task:
+                self.__reaper_task.cancel()
             if self.__pool:
                 self.__pool.close()
                 await self.__pool.wait_closed()
@@ -0,0 +1,220 @@
+import random
+import asyncio
+from typing import Optional
+
+import aiomysql
+from aiomysql.pool import Pool
+from aiomysql.connection import Connection
+from aiomysql.cursors import Cursor, DictCursor
+
+from .mysql import MysqlConnection, acquire_connection
+from app.core import EnvConfig, api_logger
+from app.middlewares import RedisConnection
+
+
+class ReplicaConnection:
+    '''管理MySQL只读副本的连接
+
+    副本通过 MYSQL_REPLICA_HOSTS 配置，格式为 host:port,host:port，账号密码和主库相同，每个副本使用单独的连接池
+
+    后台任务每隔 MYSQL_REPLICA_CHECK_INTERVAL 秒检查一次副本的复制延迟，延迟超过 MYSQL_REPLICA_MAX_LAG 秒或者复制未运行的副本不会被使用
+
+    写入操作可以标记一个key(如用户的绑定信息)，在 MYSQL_READ_YOUR_WRITES_WINDOW 秒内读取该key的查询会回到主库，保证能读到刚写入的数据
+
+    标记保存在Redis中，所有worker共享
+    '''
+    KEY_PREFIX = 'app_db:recent_write'
+    __pools: dict[str, Pool] = {}
+    __lag: dict[str, Optional[float]] = {}
+    __monitor_task: Optional[asyncio.Task] = None
+    __stats = {'replica_reads': 0, 'primary_reads': 0, 'sticky_reads': 0, 'timeouts': 0}
+
+    def get_replica_hosts() -> list[tuple[str, int]]:
+        "解析配置中的副本地址"
+        config = EnvConfig.get_config()
+        hosts = []
+        if not config.MYSQL_REPLICA_HOSTS:
+            return hosts
+        for host in config.MYSQL_REPLICA_HOSTS.split(','):
+            host = host.strip()
+            if not host:
+                continue
+            if ':' in host:
+                host, port = host.rsplit(':', 1)
+                hosts.append((host, int(port)))
+            else:
+                hosts.append((host, config.MYSQL_PORT))
+        return hosts
+
+    @classmethod
+    def is_enabled(self) -> bool:
+        return len(self.get_replica_hosts()) > 0
+
+    async def __init_connection(self) -> None:
+        "初始化所有副本的连接池"
+        config = EnvConfig.get_config()
+        for host, port in self.get_replica_hosts():
+            name = f'{host}:{port}'
+            if name in self.__pools:
+                continue
+            try:
+                self.__pools[name] = await aiomysql.create_pool(
+                    host=host,
+                    port=port,
+                    user=config.MYSQL_USERNAME,
+                    password=config.MYSQL_PASSWORD,
+                    minsize=config.MYSQL_POOL_MIN_SIZE,
+                    maxsize=config.MYSQL_REPLICA_POOL_MAX_SIZE,
+                    connect_timeout=config.MYSQL_CONNECT_TIMEOUT,
+                    pool_recycle=config.MYSQL_POOL_RECYCLE,
+                    autocommit=True
+                )
+                # 延迟未知的副本在第一次检查之前不会被使用
+                self.__lag.setdefault(name, None)
+                api_logger.info(f'MySQL replica {name} connection initialization is complete')
+            except Exception as e:
+                api_logger.error(f'Failed to initialize the MySQL replica {name} connection')
+                api_logger.error(e)
+
+    @classmethod
+    def start_monitor(self) -> None:
+        "启动检查副本延迟的后台任务"
+        if not self.is_enabled():
+            return
+        if self.__monitor_task is None or self.__monitor_task.done():
+            self.__monitor_task = asyncio.create_task(self.__monitor(self))
+
+    async def __monitor(self) -> None:
+        config = EnvConfig.get_config()
+        await self.__init_connection(self)
+        while True:
+            for name, pool in list(self.__pools.items()):
+                self.__lag[name] = await self.__get_replica_lag(self, name, pool)
+            await asyncio.sleep(config.MYSQL_REPLICA_CHECK_INTERVAL)
+
+    async def __get_replica_lag(self, name: str, pool: Pool) -> Optional[float]:
+        "获取副本的复制延迟(秒)，复制未运行或者连接失败时返回None"
+        config = EnvConfig.get_config()
+        conn = await acquire_connection(pool, config.MYSQL_ACQUIRE_TIMEOUT)
+        if conn is None:
+            return None
+        try:
+            cur: Cursor = await conn.cursor(DictCursor)
+            try:
+                try:
+                    await cur.execute("SHOW REPLICA STATUS;")
+                except aiomysql.ProgrammingError:
+                    # MySQL 8.0.22 之前的版本
+                    await cur.execute("SHOW SLAVE STATUS;")
+                row = await cur.fetchone()
+            finally:
+                await cur.close()
+            if not row:
+                return None
+            lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+            return float(lag) if lag is not None else None
+        except Exception as e:
+            api_logger.warning(f'Failed to check the MySQL replica {name} lag: {e}')
+            return None
+        finally:
+            pool.release(conn)
+
+    @classmethod
+    async def is_recently_written(self, key: str) -> bool:
+        "key是否在写入后的read-your-writes窗口内，Redis不可用时按照已写入处理"
+        try:
+            redis = RedisConnection.get_connection()
+            return bool(await redis.exists(f'{self.KEY_PREFIX}:{key}'))
+        except Exception as e:
+            api_logger.warning(f'Failed to read the MySQL recent write mark: {e}')
+            return True
+
+    @classmethod
+    async def mark_written(self, key: str) -> None:
+        '''标记key刚被写入，窗口期内读取该key会使用主库
+
+        参数：
+            key: 写入数据的标识
+        '''
+        config = EnvConfig.get_config()
+        if not self.is_enabled() or config.MYSQL_READ_YOUR_WRITES_WINDOW <= 0:
+            return
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.set(f'{self.KEY_PREFIX}:{key}', 1, px=int(config.MYSQL_READ_YOUR_WRITES_WINDOW * 1000))
+        except Exception as e:
+            api_logger.warning(f'Failed to write the MySQL recent write mark: {e}')
+
+    @classmethod
+    async def get_connection(self, sticky_key: str = None) -> tuple[Connection, Optional[Pool]]:
+        '''获取只读查询的连接
+
+        优先使用延迟正常的副本，没有可用副本、获取连接超时或者key在read-your-writes窗口内时使用主库
+
+        参数：
+            sticky_key: 查询数据的标识，和写入时 mark_written 使用的key一致
+
+        返回：
+            (连接, 副本的连接池)，使用主库时连接池为None
+        '''
+        config = EnvConfig.get_config()
+        candidates = [
+            name for name, lag in self.__lag.items()
+            if lag is not None and lag <= config.MYSQL_REPLICA_MAX_LAG and name in self.__pools
+        ]
+        if candidates and sticky_key and await self.is_recently_written(sticky_key):
+            self.__stats['sticky_reads'] += 1
+            candidates = []
+        if candidates:
+            pool = self.__pools[random.choice(candidates)]
+            conn = await acquire_connection(pool, config.MYSQL_ACQUIRE_TIMEOUT)
+            if conn is not None:
+                self.__stats['replica_reads'] += 1
+                return conn, pool
+            self.__stats['timeouts'] += 1
+        self.__stats['primary_reads'] += 1
+        return await MysqlConnection.get_connection(), None
+
+    @classmethod
+    async def release_connection(self, conn: Connection, pool: Optional[Pool]) -> None:
+        "释放连接，pool为None时释放回主库的连接池"
+        if pool is None:
+            await MysqlConnection.release_connection(conn)
+        else:
+            await pool.release(conn)
+
+    @classmethod
+    async def close_replicas(self) -> None:
+        "关闭所有副本的连接"
+        if self.__monitor_task:
+            self.__monitor_task.cancel()
+        for name, pool in list(self.__pools.items()):
+            try:
+                pool.close()
+                await pool.wait_closed()
+            except Exception as e:
+                api_logger.error(f'Failed to close the MySQL replica {name} connection')
+                api_logger.error(e)
+        self.__pools.clear()
+        self.__lag.clear()
+
+    @classmethod
+    def get_replica_stats(self) -> dict:
+        '''获取副本的状态
+
+        返回：
+            {replicas: {host: {lag, size, idle}}, replica_reads, primary_reads, sticky_reads, timeouts}
+        '''
+        config = EnvConfig.get_config()
+        replicas = {}
+        for name, pool in self.__pools.items():
+            lag = self.__lag.get(name)
+            replicas[name] = {
+                'lag': lag,
+                'available': lag is not None and lag <= config.MYSQL_REPLICA_MAX_LAG,
+                'size': pool.size,
+                'idle': pool.freesize
+            }
+        data = {'replicas': replicas}
+        data.update(self.__stats)
+        return data
@@ -0,0 +1,91 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiomysql.connection import Connection
+from aiomysql.cursors import Cursor
+
+from .cursor import TracedCursor
+from .mysql import MysqlConnection
+from .replica import ReplicaConnection
+from app.core import api_logger
+
+
+class DatabaseSession:
+    '''数据库会话(unit of work)
+
+    统一管理连接的获取、事务的提交/回滚以及游标和连接的释放，model中不再需要手动处理
+
+    连接池使用autocommit，只读查询通过 read() 直接执行，不会产生 BEGIN/COMMIT 的往返
+
+    需要写入的操作使用 transaction()，正常退出时提交，出现异常时回滚后继续抛出异常
+
+    只读查询可以通过 read(replica=True) 使用只读副本，写入时通过 sticky_key 标记的数据在短时间内会从主库读取
+
+    用法：
+
+        async with DatabaseSession.read() as cur:
+            await cur.execute(...)
+
+        async with DatabaseSession.transaction() as cur:
+            await cur.execute(...)
+    '''
+    @asynccontextmanager
+    async def read(replica: bool = False, sticky_key: str = None) -> AsyncIterator[Cursor]:
+        '''只读会话
+
+        不开启事务，每条语句单独执行，适用于只有SELECT的操作
+
+        参数：
+            replica: 是否可以使用只读副本，可以接受副本延迟(不超过 MYSQL_REPLICA_MAX_LAG 秒)的查询才能使用
+            sticky_key: 查询数据的标识，和写入时的sticky_key一致，写入后的一段时间内会使用主库
+
+        返回：
+            Cursor
+        '''
+        pool = None
+        if replica and ReplicaConnection.is_enabled():
+            conn, pool = await ReplicaConnection.get_connection(sticky_key)
+        else:
+            conn: Connection = await MysqlConnection.get_connection()
+        cur: Cursor = None
+        try:
+            cur = await conn.cursor(TracedCursor)
+            cur.pool = pool
+            yield cur
+        finally:
+            if cur is not None:
+                await cur.close()
+            await ReplicaConnection.release_connection(conn, pool)
+
+    @asynccontextmanager
+    async def transaction(sticky_key: str = None) -> AsyncIterator[Cursor]:
+        '''事务会话
+
+        退出时提交事务，出现异常(包括任务被取消)时回滚事务
+
+        参数：
+            sticky_key: 写入数据的标识，提交后一段时间内使用该标识的只读查询会使用主库
+
+        返回：
+            Cursor
+        '''
+        conn: Connection = await MysqlConnection.get_connection()
+        cur: Cursor = None
+        try:
+            await conn.begin()
+            cur = await conn.cursor(TracedCursor)
+            yield cur
+            await conn.commit()
+            if sticky_key:
+                await ReplicaConnection.mark_written(sticky_key)
+        except BaseException:
+            try:
+                await conn.rollback()
+            except Exception as e:
+                # 回滚失败时连接已经不可用，释放时连接池会关闭该连接
+                api_logger.warning(f'Failed to rollback the transaction: {e}')
+            raise
+        finally:
+            if cur is not None:
+                await cur.close()
+            await MysqlConnection.release_connection(conn)
@@ -1,7 +1,9 @@
 from .error_log import write_error_info
 from .exception_log import ExceptionLogger
+from .query_log import QueryLog
 
 __all__ = [
     'write_error_info',
-    'ExceptionLogger'
+    'ExceptionLogger',
+    'QueryLog'
 ]
\ No newline at end of file
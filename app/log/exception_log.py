@@ -1,3 +1,4 @@
+import time
 import uuid
 import traceback
 
@@ -8,6 +9,7 @@ import sqlite3
 import redis
 
 from .error_log import write_error_info
+from .query_log import QueryLog
 from app.response import JSONResponse
 
 class ExceptionType:
@@ -74,10 +76,14 @@ class ExceptionLogger:
     
     @staticmethod
     def handle_database_exception_async(func):
-        "负责异步数据库 aiomysql 的异常捕获"
+        "负责异步数据库 aiomysql 的异常捕获，同时记录方法的耗时、行数和慢查询"
         async def wrapper(*args, **kwargs):
+            token = QueryLog.start_trace(func.__qualname__)
+            start_time = time.monotonic()
+            error = True
             try:
                 result = await func(*args, **kwargs)
+                error = False
                 return result
             except aiomysql.ProgrammingError as e:
                 error_id = generate_error_id()
@@ -128,6 +134,8 @@ class ExceptionLogger:
                     error_info = traceback.format_exc()
                 )
                 return JSONResponse.get_error_response(5000,'ProgramError',error_id)
+            finally:
+                QueryLog.finish_trace(token, time.monotonic() - start_time, error)
         return wrapper
     
     @staticmethod
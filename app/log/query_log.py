@@ -0,0 +1,253 @@
+import time
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+from app.core import EnvConfig, api_logger
+
+# 可以执行EXPLAIN的语句类型
+EXPLAIN_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+QUERY_LATENCY = Histogram(
+    'kokomi_db_method_seconds',
+    'Latency of decorated database model methods',
+    ['method'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+QUERY_ROWS = Counter(
+    'kokomi_db_method_rows_total',
+    'Rows returned or affected by decorated database model methods',
+    ['method']
+)
+QUERY_ERRORS = Counter(
+    'kokomi_db_method_errors_total',
+    'Exceptions raised by decorated database model methods',
+    ['method']
+)
+SLOW_QUERIES = Counter(
+    'kokomi_db_slow_queries_total',
+    'Database model method calls whose slowest statement took longer than DB_SLOW_QUERY_THRESHOLD',
+    ['method']
+)
+
+
+class QueryTrace:
+    "一次model方法调用中执行的语句统计"
+    __slots__ = ('method', 'rows', 'statements', 'slowest')
+
+    def __init__(self, method: str):
+        self.method = method
+        self.rows = 0
+        self.statements = 0
+        # (耗时, sql, 参数, 执行语句的副本连接池)，连接池为None时是主库
+        self.slowest: Optional[tuple[float, str, object, object]] = None
+
+    def add_statement(self, elapsed: float, sql: str, args: object, rows: int, pool: object = None) -> None:
+        self.statements += 1
+        if rows and rows > 0:
+            self.rows += rows
+        if self.slowest is None or elapsed > self.slowest[0]:
+            self.slowest = (elapsed, sql, args, pool)
+
+    def merge(self, trace: 'QueryTrace') -> None:
+        "嵌套调用结束时合并到外层调用"
+        self.rows += trace.rows
+        self.statements += trace.statements
+        if trace.slowest and (self.slowest is None or trace.slowest[0] > self.slowest[0]):
+            self.slowest = trace.slowest
+
+
+_current_trace: ContextVar[Optional[QueryTrace]] = ContextVar('query_trace', default=None)
+
+
+def get_params_shape(args: object) -> object:
+    '''获取SQL参数的结构，只保留类型和数量，不记录参数的值
+
+    例如 [1, 'abc', [1, 2]] -> ['int', 'str', 'list[2]']
+    '''
+    def describe(value: object) -> str:
+        if isinstance(value, (list, tuple, set, dict)):
+            return f'{type(value).__name__}[{len(value)}]'
+        return type(value).__name__
+
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {key: describe(value) for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        shape = [describe(value) for value in args[:20]]
+        if len(args) > 20:
+            shape.append(f'...(+{len(args) - 20})')
+        return shape
+    return describe(args)
+
+
+class QueryLog:
+    '''数据库查询的耗时统计和慢查询记录
+
+    ExceptionLogger.handle_database_exception_async 会对每次model方法的调用计时，按方法名统计耗时直方图和返回/影响的行数，通过 /api/v1/root/metrics/ 以Prometheus格式输出
+
+    DatabaseSession 的游标会把每条语句的耗时和行数记录到当前调用中
+
+    最慢的一条语句耗时超过 DB_SLOW_QUERY_THRESHOLD 秒的调用会记录该语句、参数结构以及EXPLAIN的结果，保存在最多 DB_SLOW_QUERY_LOG_SIZE 条的环形缓冲区中
+
+    慢查询按语句的耗时判断，不包括等待连接池的时间，连接池满时不会把所有调用都记录为慢查询
+
+    统计数据保存在当前进程中，多个worker时每个worker单独统计
+    '''
+    __slow_queries: deque = deque(maxlen=100)
+    __summary: dict[str, dict] = {}
+    __explain_tasks: set[asyncio.Task] = set()
+    # 最近执行过EXPLAIN的语句，同一条语句 EXPLAIN_INTERVAL 秒内只执行一次
+    __explained: dict[str, float] = {}
+    EXPLAIN_INTERVAL = 60
+
+    def start_trace(method: str):
+        "开始记录一次方法调用，返回用于 finish_trace 的token"
+        return _current_trace.set(QueryTrace(method))
+
+    def record_statement(sql: str, args: object, elapsed: float, rows: int, pool: object = None) -> None:
+        "记录一条语句的执行情况，不在被装饰的方法中执行时忽略"
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_statement(elapsed, sql, args, rows, pool)
+
+    @classmethod
+    def finish_trace(self, token, elapsed: float, error: bool = False) -> None:
+        '''结束一次方法调用的记录
+
+        参数：
+            token: start_trace 返回的token
+            elapsed: 方法的耗时(秒)
+            error: 方法是否抛出了异常
+        '''
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        if trace is None:
+            return
+        parent = _current_trace.get()
+        if parent is not None:
+            parent.merge(trace)
+        method = trace.method
+        QUERY_LATENCY.labels(method).observe(elapsed)
+        QUERY_ROWS.labels(method).inc(trace.rows)
+        if error:
+            QUERY_ERRORS.labels(method).inc()
+        summary = self.__summary.setdefault(
+            method, {'count': 0, 'errors': 0, 'slow': 0, 'rows': 0, 'sum': 0.0, 'max': 0.0}
+        )
+        summary['count'] += 1
+        summary['errors'] += int(error)
+        summary['rows'] += trace.rows
+        summary['sum'] += elapsed
+        summary['max'] = max(summary['max'], elapsed)
+        config = EnvConfig.get_config()
+        if trace.slowest and trace.slowest[0] >= config.DB_SLOW_QUERY_THRESHOLD:
+            summary['slow'] += 1
+            SLOW_QUERIES.labels(method).inc()
+            self.__record_slow_query(self, trace, elapsed)
+
+    def __record_slow_query(self, trace: QueryTrace, elapsed: float) -> None:
+        config = EnvConfig.get_config()
+        if self.__slow_queries.maxlen != config.DB_SLOW_QUERY_LOG_SIZE:
+            self.__slow_queries = deque(self.__slow_queries, maxlen=config.DB_SLOW_QUERY_LOG_SIZE)
+        entry = {
+            'time': int(time.time()),
+            'method': trace.method,
+            'elapsed': round(elapsed, 4),
+            'rows': trace.rows,
+            'statements': trace.statements,
+            'sql': None,
+            'sql_elapsed': None,
+            'params': None,
+            'explain': None
+        }
+        if trace.slowest:
+            sql_elapsed, sql, args, pool = trace.slowest
+            if isinstance(sql, (bytes, bytearray)):
+                # executemany 批量写入时SQL已经是编码后的完整语句
+                sql = bytes(sql).decode('utf-8', errors='replace')
+            sql = ' '.join(sql.split())
+            entry['sql'] = sql if len(sql) <= 2000 else sql[:2000] + '...'
+            entry['sql_elapsed'] = round(sql_elapsed, 4)
+            entry['params'] = get_params_shape(args)
+            if self.__should_explain(self, entry['sql']):
+                task = asyncio.create_task(self.__explain(entry, sql, args, pool))
+                # 保存任务的引用，避免任务在完成前被回收
+                self.__explain_tasks.add(task)
+                task.add_done_callback(self.__explain_tasks.discard)
+        self.__slow_queries.append(entry)
+
+    def __should_explain(self, sql: str) -> bool:
+        if not sql.upper().startswith(EXPLAIN_STATEMENTS):
+            return False
+        now = time.monotonic()
+        if len(self.__explained) > 1000:
+            self.__explained.clear()
+        if now - self.__explained.get(sql, -self.EXPLAIN_INTERVAL) < self.EXPLAIN_INTERVAL:
+            return False
+        self.__explained[sql] = now
+        return True
+
+    async def __explain(entry: dict, sql: str, args: object, pool: object) -> None:
+        '''在后台执行EXPLAIN并写入慢查询记录，失败时记录错误信息
+
+        在执行语句的连接池(主库或者副本)中执行，连接池没有空闲连接时跳过，避免在数据库繁忙时占用连接
+        '''
+        # app.db 依赖 app.log，这里在使用时导入避免循环导入
+        from app.db import MysqlConnection, ReplicaConnection
+        from app.db.mysql import acquire_connection
+        try:
+            if pool is None:
+                stats = MysqlConnection.get_pool_stats()
+                saturated = stats['waiters'] > 0 or (stats['idle'] == 0 and stats['size'] >= stats['maxsize'])
+            else:
+                saturated = pool.freesize == 0 and pool.size >= pool.maxsize
+            if saturated:
+                entry['explain'] = {'skipped': 'connection pool is saturated'}
+                return
+            if pool is None:
+                conn = await MysqlConnection.get_connection()
+            else:
+                conn = await acquire_connection(pool, EnvConfig.get_config().MYSQL_ACQUIRE_TIMEOUT)
+                if conn is None:
+                    entry['explain'] = {'skipped': 'connection pool is saturated'}
+                    return
+            try:
+                async with conn.cursor() as cur:
+                    await cur.execute('EXPLAIN ' + sql, args)
+                    columns = [column[0] for column in cur.description]
+                    entry['explain'] = [dict(zip(columns, row)) for row in await cur.fetchall()]
+            finally:
+                await ReplicaConnection.release_connection(conn, pool)
+        except Exception as e:
+            api_logger.warning(f'Failed to explain the slow query: {e}')
+            entry['explain'] = {'error': str(e)}
+
+    @classmethod
+    def get_slow_queries(self) -> list[dict]:
+        "获取慢查询记录，最新的在前"
+        return list(reversed(self.__slow_queries))
+
+    @classmethod
+    def get_summary(self) -> dict:
+        '''获取每个方法的耗时统计，按总耗时从大到小排序
+
+        返回：
+            {method: {count, errors, slow, rows, avg, max, sum}}
+        '''
+        data = {}
+        for method, summary in sorted(self.__summary.items(), key=lambda item: item[1]['sum'], reverse=True):
+            data[method] = {
+                'count': summary['count'],
+                'errors': summary['errors'],
+                'slow': summary['slow'],
+                'rows': summary['rows'],
+                'avg': round(summary['sum'] / summary['count'], 4) if summary['count'] else 0,
+                'max': round(summary['max'], 4),
+                'sum': round(summary['sum'], 4)
+            }
+        return data
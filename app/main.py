@@ -9,9 +9,11 @@ from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from app.core import EnvConfig, api_logger
-from app.db import MysqlConnection
+from app.db import MysqlConnection, ReplicaConnection
 from app.response import JSONResponse as API_JSONResponse
-from app.middlewares import RedisConnection, IPAccessListManager, rate_limit
+from app.middlewares import RedisConnection, IPAccessListManager, TieredCache, ApiCallCounter, rate_limit
+from app.network import HttpClientPool
+from app.models import UserWriteBuffer
 
 from app.routers import (
     platform_router, robot_router, recent_1_router, 
@@ -20,10 +22,11 @@ from app.routers import (
 
 
 async def schedule():
+    config = EnvConfig.get_config()
     while True:
-        api_logger.info("API日志数据上传")
-        # 这里实现具体任务
-        await asyncio.sleep(60)  # 每 60 秒执行一次任务
+        await asyncio.sleep(config.API_CALLS_FLUSH_INTERVAL)
+        # 上传接口请求次数的统计数据
+        await ApiCallCounter.flush()
 
 # 应用程序的生命周期
 @asynccontextmanager
@@ -34,15 +37,30 @@ async def lifespan(app: FastAPI):
     await RedisConnection.test_redis()
     # 初始化mysql并测试mysql连接
     await MysqlConnection.test_mysql()
+    # 启动MySQL空闲连接的检查任务
+    MysqlConnection.start_reaper()
+    # 初始化mysql只读副本并启动副本延迟的检查任务
+    ReplicaConnection.start_monitor()
+    # 启动用户数据写缓冲的写入任务
+    UserWriteBuffer.start()
+    # 订阅缓存失效的消息
+    TieredCache.start()
+    # 初始化上游接口的长连接客户端
+    HttpClientPool.init_clients()
     task = asyncio.create_task(schedule())  # 启动定时任务
 
     # 启动 lifespan
     yield
 
-    # 应用关闭时释放连接
+    # 应用关闭时写入缓冲的数据并释放连接
+    task.cancel()
+    await ApiCallCounter.flush()
+    await UserWriteBuffer.stop()
+    await TieredCache.stop()
     await RedisConnection.close_redis()
     await MysqlConnection.close_mysql()
-    task.cancel()  # 关闭 FastAPI 时取消任务
+    await ReplicaConnection.close_replicas()
+    await HttpClientPool.close_clients()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -57,6 +75,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 # 请求中间件
 @app.middleware("http")
 async def request_rate_limiter(request: Request, call_next):
+    ApiCallCounter.bind_request(request.scope)
     client_ip = request.client.host
     if IPAccessListManager.is_blacklisted(client_ip):
         # ip是否在黑名单
@@ -66,7 +85,7 @@ async def request_rate_limiter(request: Request, call_next):
         )
     if not IPAccessListManager.is_whitelisted(client_ip):
         # ip是否在白名单，在则跳过限速检查
-        check_rate_limiter = await rate_limit(client_ip)
+        check_rate_limiter = await rate_limit(client_ip, request.url.path)
         if check_rate_limiter not in [True, False]:
             return JSONResponse(
                 status_code=500,
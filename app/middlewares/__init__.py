@@ -1,12 +1,22 @@
-from .rate_limiter import rate_limit
-from .api_tracking import record_api_call
+from .rate_limiter import rate_limit, RateLimiter
+from .api_tracking import record_api_call, ApiCallCounter
 from .redis import RedisConnection
+from .local_cache import LocalCache
+from .bind_cache import BindCache
+from .tiered_cache import TieredCache
+from .stampede import StampedeCache
 from .access_manager import ClanAccessListManager,UserAccessListManager,IPAccessListManager
 
 __all__ = [
     'RedisConnection',
+    'LocalCache',
+    'BindCache',
+    'TieredCache',
+    'StampedeCache',
     'rate_limit',
+    'RateLimiter',
     'record_api_call',
+    'ApiCallCounter',
     'ClanAccessListManager',
     'UserAccessListManager',
     'IPAccessListManager'
@@ -1,31 +1,124 @@
+import os
+import json
+import time
+import ipaddress
+
+from app.core import EnvConfig, api_logger
+
 # 由于需求不大，就不用数据库存储数据
+# 配置了 IP_ACCESS_LIST_PATH 时以文件中的列表为准
 IP_WHITE_LIST = ['127.0.0.1','43.155.60.190','43.133.59.53','43.157.28.149']
 IP_BLACK_LIST = []
 USER_BLACK_LIST = []
 CLAN_BLACK_LIST = []
 
-class IPAccessListManager:
-    def is_blacklisted(host: str) -> bool:
-        if host in IP_BLACK_LIST:
-            return True
-        else:
-            return False
-    def is_whitelisted(host: str) -> bool:
-        if host in IP_WHITE_LIST:
-            return True
-        else:
+
+class IPPrefixSet:
+    '''支持CIDR的IP集合
+
+    按照 (IP版本, 前缀长度) 分组保存网络地址，查询时每个前缀长度只需要一次集合查找，和列表中的条目数量无关
+
+    单个IP视为 /32 或者 /128 的网络
+    '''
+    __slots__ = ('_prefixes', 'size')
+
+    def __init__(self, items: list[str]):
+        # (version, prefixlen) -> {网络地址}
+        self._prefixes: dict[tuple[int, int], set[int]] = {}
+        self.size = 0
+        for item in items:
+            try:
+                network = ipaddress.ip_network(item.strip(), strict=False)
+            except ValueError:
+                api_logger.warning(f'Invalid IP access list entry: {item}')
+                continue
+            self._prefixes.setdefault((network.version, network.prefixlen), set()).add(int(network.network_address))
+            self.size += 1
+
+    def __contains__(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
             return False
-        
+        value = int(address)
+        max_prefixlen = address.max_prefixlen
+        for (version, prefixlen), networks in self._prefixes.items():
+            if version != address.version:
+                continue
+            shift = max_prefixlen - prefixlen
+            if (value >> shift) << shift in networks:
+                return True
+        return False
+
+
+class IPAccessListManager:
+    '''IP白名单和黑名单
+
+    列表支持单个IP和CIDR网段，配置了 IP_ACCESS_LIST_PATH 时从json文件中读取：
+
+        {"whitelist": ["127.0.0.1", "10.0.0.0/8"], "blacklist": []}
+
+    文件修改后最多 IP_ACCESS_LIST_RELOAD_INTERVAL 秒内生效，不需要重启程序，文件读取失败时继续使用原来的列表
+    '''
+    __whitelist = IPPrefixSet(IP_WHITE_LIST)
+    __blacklist = IPPrefixSet(IP_BLACK_LIST)
+    __mtime = None
+    __checked_at = 0.0
+
+    @classmethod
+    def reload(self, force: bool = False) -> None:
+        "文件修改时间变化时重新读取列表"
+        config = EnvConfig.get_config()
+        path = config.IP_ACCESS_LIST_PATH
+        if not path:
+            return
+        now = time.monotonic()
+        if not force and now - self.__checked_at < config.IP_ACCESS_LIST_RELOAD_INTERVAL:
+            return
+        self.__checked_at = now
+        try:
+            mtime = os.stat(path).st_mtime
+            if not force and mtime == self.__mtime:
+                return
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.__whitelist = IPPrefixSet(data.get('whitelist', []))
+            self.__blacklist = IPPrefixSet(data.get('blacklist', []))
+            self.__mtime = mtime
+            api_logger.info(
+                f'IP access list reloaded, whitelist: {self.__whitelist.size}, blacklist: {self.__blacklist.size}'
+            )
+        except Exception as e:
+            api_logger.warning(f'Failed to reload the IP access list: {e}')
+
+    @classmethod
+    def is_blacklisted(self, host: str) -> bool:
+        self.reload()
+        return host in self.__blacklist
+
+    @classmethod
+    def is_whitelisted(self, host: str) -> bool:
+        self.reload()
+        return host in self.__whitelist
+
+    @classmethod
+    def get_stats(self) -> dict:
+        return {
+            'path': EnvConfig.get_config().IP_ACCESS_LIST_PATH,
+            'whitelist': self.__whitelist.size,
+            'blacklist': self.__blacklist.size
+        }
+
 class UserAccessListManager:
     def is_blacklisted(account_id: int) -> bool:
         if account_id in USER_BLACK_LIST:
             return True
         else:
             return False
-    
+
 class ClanAccessListManager:
     def is_blacklisted(clan_id: int) -> bool:
         if clan_id in CLAN_BLACK_LIST:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
@@ -1,16 +1,132 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
 from .redis import RedisConnection
+from app.core import api_logger
 from app.utils import TimeFormat
 from app.log import ExceptionLogger
 
-# 当前存在key的简单缓存，避免重复查询设置expire
-exist_daily_key = []
-exist_hourly_key = []
+# 当前请求的scope，路由匹配后其中的route为匹配到的接口
+_request_scope: ContextVar[Optional[dict]] = ContextVar('request_scope', default=None)
+
+
+class ApiCallCounter:
+    '''接口请求次数统计
+
+    请求时只在进程内计数，由 app.main 中的 schedule 定时通过一次pipeline写入Redis，请求过程中没有网络IO
+
+    Redis中的数据：
+        api_calls:hourly:{%Y-%m-%d-%H}       total，保存25小时
+        api_calls:daily:{%Y-%m-%d}           total/ok/error，保存31天
+        api_calls:routes:daily:{%Y-%m-%d}    {route}:total/{route}:ok/{route}:error，保存31天
+
+    route为接口的路径模板，例如 /api/v1/wows/recent/features/user/{region}/{account_id}/，数量和接口数量一致
+    '''
+    HOURLY_TTL = 25 * 60 * 60
+    DAILY_TTL = 31 * 24 * 60 * 60
+    # (key, field) -> 未写入的次数
+    __pending: dict[tuple[str, str], int] = {}
+    # 已经设置过期时间的key，只需要保存最近的几个小时和天
+    __expired_keys: OrderedDict[str, None] = OrderedDict()
+
+    def bind_request(scope: dict) -> None:
+        "在请求中间件中调用，记录当前请求的scope"
+        _request_scope.set(scope)
+
+    def get_route() -> str:
+        scope = _request_scope.get()
+        if scope is None:
+            return 'unknown'
+        route = scope.get('route')
+        return getattr(route, 'path', None) or 'unknown'
+
+    @classmethod
+    def record(self, status: str) -> None:
+        current_hour = TimeFormat.get_form_time(time_format='%Y-%m-%d-%H')
+        current_day = TimeFormat.get_form_time(time_format='%Y-%m-%d')
+        route = self.get_route()
+        hourly_key = f'api_calls:hourly:{current_hour}'
+        daily_key = f'api_calls:daily:{current_day}'
+        route_key = f'api_calls:routes:daily:{current_day}'
+        fields = [(hourly_key, 'total'), (daily_key, 'total'), (route_key, f'{route}:total')]
+        if status in ['ok', 'error']:
+            fields.append((daily_key, status))
+            fields.append((route_key, f'{route}:{status}'))
+        for field in fields:
+            self.__pending[field] = self.__pending.get(field, 0) + 1
+
+    @classmethod
+    async def flush(self) -> int:
+        '''将进程内的计数写入Redis
+
+        写入失败时计数会保留到下一次写入
+
+        返回：
+            写入的字段数量
+        '''
+        if not self.__pending:
+            return 0
+        pending = self.__pending
+        self.__pending = {}
+        new_keys = []
+        for key, _ in pending:
+            if key not in self.__expired_keys and key not in new_keys:
+                new_keys.append(key)
+        try:
+            redis = RedisConnection.get_connection()
+            async with redis.pipeline(transaction=False) as pipe:
+                for (key, field), count in pending.items():
+                    pipe.hincrby(key, field, count)
+                for key in new_keys:
+                    pipe.expire(key, self.HOURLY_TTL if key.startswith('api_calls:hourly:') else self.DAILY_TTL)
+                await pipe.execute()
+        except Exception as e:
+            for field, count in pending.items():
+                self.__pending[field] = self.__pending.get(field, 0) + count
+            api_logger.warning(f'Failed to flush the api call counters: {e}')
+            return 0
+        for key in new_keys:
+            self.__expired_keys[key] = None
+        while len(self.__expired_keys) > 16:
+            self.__expired_keys.popitem(last=False)
+        return len(pending)
+
+    @classmethod
+    async def get_route_stats(self, date: str = None) -> dict:
+        '''获取某一天按接口统计的请求次数，按请求次数从大到小排序
+
+        参数：
+            date: 日期，格式为 %Y-%m-%d，默认为当天
+
+        返回：
+            {date, total, ok, error, routes: {route: {total, ok, error}}}
+        '''
+        if date is None:
+            date = TimeFormat.get_form_time(time_format='%Y-%m-%d')
+        redis = RedisConnection.get_connection()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(f'api_calls:daily:{date}')
+            pipe.hgetall(f'api_calls:routes:daily:{date}')
+            daily, route_fields = await pipe.execute()
+        routes = {}
+        for field, count in route_fields.items():
+            route, status = field.rsplit(':', 1)
+            routes.setdefault(route, {'total': 0, 'ok': 0, 'error': 0})[status] = int(count)
+        return {
+            'date': date,
+            'total': int(daily.get('total', 0)),
+            'ok': int(daily.get('ok', 0)),
+            'error': int(daily.get('error', 0)),
+            'routes': dict(sorted(routes.items(), key=lambda item: item[1]['total'], reverse=True))
+        }
+
 
 @ExceptionLogger.handle_cache_exception_async
 async def record_api_call(status: str = 'ok') -> None:
     '''记录api请求次数和请求结果概括
 
-    记录过去24h和过去30d的请求数据
+    只在进程内计数，由 ApiCallCounter.flush 定时写入Redis
 
     参数:
         status: 表示请求结果
@@ -19,29 +135,7 @@ async def record_api_call(status: str = 'ok') -> None:
         None
     '''
     try:
-        redis = RedisConnection.get_connection()
-
-        current_hour = TimeFormat.get_form_time(time_format='%Y-%m-%d-%H')
-        current_day = TimeFormat.get_form_time(time_format='%Y-%m-%d')
-        hourly_key = f'api_calls:hourly:{current_hour}'
-        daily_key = f'api_calls:daily:{current_day}'
-
-        await redis.hincrby(hourly_key, "total", 1)
-        await redis.hincrby(daily_key, "total", 1)
-        if status == "ok":
-            await redis.hincrby(daily_key, "ok", 1)
-        elif status == "error":
-            await redis.hincrby(daily_key, "error", 1)
-        if hourly_key not in exist_hourly_key:
-            hourly_key_ttl = await redis.ttl(hourly_key)
-            if hourly_key_ttl == -1:
-                await redis.expire(hourly_key, 25 * 60 * 60)
-                exist_hourly_key.append(hourly_key)
-        if daily_key not in exist_daily_key:
-            daily_key_ttl = await redis.ttl(daily_key)
-            if daily_key_ttl == -1:
-                await redis.expire(daily_key, 60 * 60 * 24 * 31)
-                exist_daily_key.append(daily_key)
+        ApiCallCounter.record(status)
         return None
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
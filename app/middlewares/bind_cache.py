@@ -0,0 +1,255 @@
+import json
+import time
+from typing import Awaitable, Callable
+
+from app.core import EnvConfig, api_logger
+from app.response import JSONResponse, ResponseDict
+
+from .redis import RedisConnection
+from .local_cache import LocalCache
+from .tiered_cache import TieredCache
+from .stampede import StampedeCache
+
+# 只有数据版本没有变化时才写入缓存，避免读取数据库期间绑定信息被修改后写入旧数据
+FILL_SCRIPT = '''
+local version = redis.call('GET', KEYS[2]) or '0'
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+'''
+# 更新数据版本并写入新的数据，同时通知所有worker删除进程内缓存
+UPDATE_SCRIPT = '''
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+return 1
+'''
+
+
+class BindCache:
+    '''bot用户绑定信息的缓存
+
+    读取顺序为 进程内LRU -> Redis -> MySQL，MySQL中读取到的数据写回Redis和进程内LRU
+
+    没有绑定的用户同样会缓存，缓存时间为 BIND_CACHE_NEGATIVE_TTL
+
+    Redis中保存的数据：
+
+        app_bot:bind_cache:{platform}:{user_id}   绑定信息的json，未绑定为null
+        app_bot:bind_version:{platform}:{user_id} 数据版本，每次修改绑定信息时加一
+
+    读取MySQL前记录数据版本，写回时通过Lua脚本检查版本，版本变化说明期间绑定信息被修改，放弃写入
+
+    同一个用户同一时间只有一个请求读取MySQL，见 get_or_load
+
+    绑定信息修改时通过 TieredCache 的失效频道通知所有worker删除进程内LRU中的数据，命名空间为 bot_bind
+
+    订阅断开时，其他worker最多在 BIND_CACHE_LOCAL_TTL 秒内返回旧数据
+
+    Redis不可用时直接读取MySQL
+    '''
+    KEY_PREFIX = 'app_bot:bind_cache'
+    VERSION_PREFIX = 'app_bot:bind_version'
+    LOCK_PREFIX = 'app_bot:bind_lock'
+    NAMESPACE = 'bot_bind'
+    __local: LocalCache = None
+    # 读取MySQL耗时的移动平均(秒)
+    __load_time: float = 0.01
+    __stats: dict[str, int] = {
+        'redis_hits': 0,
+        'negative_hits': 0,
+        'early_refreshes': 0,
+        'misses': 0,
+        'waits': 0,
+        'fills': 0,
+        'fill_rejected': 0,
+        'errors': 0
+    }
+
+    @classmethod
+    def get_local_cache(self) -> LocalCache:
+        if self.__local is None:
+            config = EnvConfig.get_config()
+            self.__local = LocalCache(config.BIND_CACHE_LOCAL_SIZE, config.BIND_CACHE_LOCAL_TTL)
+            TieredCache.register_local(self.NAMESPACE, self.__local)
+        return self.__local
+
+    def get_keys(platform: str, user_id: str) -> list[str]:
+        return [
+            f'{BindCache.KEY_PREFIX}:{platform}:{user_id}',
+            f'{BindCache.VERSION_PREFIX}:{platform}:{user_id}'
+        ]
+
+    def get_ttl(data: dict | None) -> int:
+        config = EnvConfig.get_config()
+        return config.BIND_CACHE_TTL if data else config.BIND_CACHE_NEGATIVE_TTL
+
+    @classmethod
+    async def get_or_load(
+        self,
+        platform: str,
+        user_id: str,
+        loader: Callable[[], Awaitable[ResponseDict]]
+    ) -> ResponseDict:
+        '''读取缓存的绑定信息，未命中时通过loader读取MySQL
+
+        通过 StampedeCache 避免缓存击穿：
+
+            Redis命中时按照XFetch算法提前刷新，获取到锁的请求重新读取MySQL，其他请求继续返回缓存的数据
+
+            Redis未命中时只有获取到锁的请求读取MySQL，其他请求等待写回后的数据，超时后自己读取
+
+        参数：
+            platform: 平台
+            user_id: 用户id
+            loader: 读取MySQL中绑定信息的函数
+
+        返回：
+            ResponseDict，data为绑定信息，未绑定为None
+        '''
+        local = self.get_local_cache()
+        local_key = f'{platform}:{user_id}'
+        hit, data = local.get(local_key)
+        if hit:
+            return JSONResponse.get_success_response(data)
+        value_key, version_key = self.get_keys(platform, user_id)
+        lock_key = f'{self.LOCK_PREFIX}:{platform}:{user_id}'
+        try:
+            redis = RedisConnection.get_connection()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.get(value_key)
+                pipe.get(version_key)
+                pipe.pttl(value_key)
+                value, version, pttl = await pipe.execute()
+        except Exception as e:
+            self.__stats['errors'] += 1
+            self.__stats['misses'] += 1
+            api_logger.warning(f'Failed to read the bind cache: {e}')
+            return await loader()
+        version = version or '0'
+        if value is not None:
+            data = json.loads(value)
+            self.__stats['redis_hits'] += 1
+            if data is None:
+                self.__stats['negative_hits'] += 1
+            token = None
+            if StampedeCache.should_refresh(pttl / 1000, self.__load_time):
+                token = await StampedeCache.acquire_lock(lock_key)
+            if token is None:
+                local.set(local_key, data, self.get_ttl(data))
+                return JSONResponse.get_success_response(data)
+            self.__stats['early_refreshes'] += 1
+        else:
+            self.__stats['misses'] += 1
+            token = await StampedeCache.acquire_lock(lock_key)
+            if token is None:
+                # 其他请求正在读取MySQL，等待写回的数据
+                try:
+                    value = await StampedeCache.wait_for(value_key)
+                except Exception as e:
+                    self.__stats['errors'] += 1
+                    api_logger.warning(f'Failed to read the bind cache: {e}')
+                    value = None
+                if value is not None:
+                    self.__stats['waits'] += 1
+                    data = json.loads(value)
+                    local.set(local_key, data, self.get_ttl(data))
+                    return JSONResponse.get_success_response(data)
+                return await self.__load(platform, user_id, loader, version)
+        try:
+            return await self.__load(platform, user_id, loader, version)
+        finally:
+            await StampedeCache.release_lock(lock_key, token)
+
+    @classmethod
+    async def __load(
+        self,
+        platform: str,
+        user_id: str,
+        loader: Callable[[], Awaitable[ResponseDict]],
+        version: str
+    ) -> ResponseDict:
+        "读取MySQL并写回缓存，同时记录读取的耗时用于计算提前刷新的概率"
+        start_time = time.monotonic()
+        result = await loader()
+        if result.get('code', None) != 1000:
+            return result
+        self.__load_time = self.__load_time * 0.8 + (time.monotonic() - start_time) * 0.2
+        await self.fill(platform, user_id, result['data'], version)
+        return result
+
+    @classmethod
+    async def fill(self, platform: str, user_id: str, data: dict | None, version: str | None) -> None:
+        '''将MySQL中读取的绑定信息写入缓存
+
+        参数：
+            platform: 平台
+            user_id: 用户id
+            data: 绑定信息，未绑定为None
+            version: 读取MySQL前的数据版本
+        '''
+        if version is None:
+            return
+        ttl = self.get_ttl(data)
+        try:
+            redis = RedisConnection.get_connection()
+            result = await redis.eval(
+                FILL_SCRIPT, 2, *self.get_keys(platform, user_id), version, json.dumps(data), ttl
+            )
+        except Exception as e:
+            self.__stats['errors'] += 1
+            api_logger.warning(f'Failed to write the bind cache: {e}')
+            return
+        if result:
+            self.__stats['fills'] += 1
+            self.get_local_cache().set(f'{platform}:{user_id}', data, ttl)
+        else:
+            self.__stats['fill_rejected'] += 1
+
+    @classmethod
+    async def update(self, platform: str, user_id: str, data: dict) -> None:
+        '''绑定信息修改后更新缓存
+
+        在数据库事务提交后调用，更新数据版本的同时写入新的数据，正在读取MySQL的请求不会再写回旧数据
+
+        写入Redis和通知其他worker删除进程内缓存在同一个Lua脚本中完成
+
+        参数：
+            platform: 平台
+            user_id: 用户id
+            data: 新的绑定信息
+        '''
+        local = self.get_local_cache()
+        local_key = f'{platform}:{user_id}'
+        local.delete(local_key)
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.eval(
+                UPDATE_SCRIPT, 2, *self.get_keys(platform, user_id), json.dumps(data), self.get_ttl(data),
+                TieredCache.CHANNEL, TieredCache.get_message(self.NAMESPACE, [local_key])
+            )
+        except Exception as e:
+            self.__stats['errors'] += 1
+            api_logger.warning(f'Failed to update the bind cache: {e}')
+            return
+        local.set(local_key, data)
+
+    @classmethod
+    def get_stats(self) -> dict:
+        '''获取绑定信息缓存的统计数据
+
+        返回：
+            local: 进程内LRU的数据量和命中次数
+            redis_hits: Redis命中次数，其中negative_hits为未绑定的次数
+            early_refreshes: Redis命中但是提前读取MySQL刷新的次数
+            misses: Redis未命中的次数
+            waits: 未命中时等待其他请求写回数据的次数
+            fills/fill_rejected: 写回Redis成功和因为数据版本变化放弃写入的次数
+            errors: Redis读写失败的次数
+        '''
+        data = dict(self.__stats)
+        data['local'] = self.get_local_cache().get_stats()
+        return data
@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class LocalCache:
+    '''进程内的LRU缓存
+
+    放在Redis缓存前面，用于少量访问非常频繁的数据，每个worker单独保存，只能设置较短的过期时间
+
+    数据超过 maxsize 条时删除最久没有访问的数据
+
+    get 返回 (是否命中, 数据)，数据本身可以为None
+    '''
+    __slots__ = ('maxsize', 'ttl', '_data', 'hits', 'misses')
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (过期时间, 数据)
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, item[1]
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        '''写入数据
+
+        参数：
+            key: 缓存key
+            value: 数据
+            ttl: 过期时间(秒)，为空或者大于默认值时使用默认值
+        '''
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
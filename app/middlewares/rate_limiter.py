@@ -1,37 +1,189 @@
-from .redis import RedisConnection
+import time
+from collections import OrderedDict
+
+from app.core import EnvConfig
+# app.log 依赖 app.utils，需要先导入 app.utils 避免循环导入
 from app.utils import TimeFormat
 from app.log import ExceptionLogger
 
+from .redis import RedisConnection
+
+# GCRA限流，一次往返完成检查和更新，时间使用Redis服务器的时间，多个worker之间不受本地时钟影响
+# ARGV[1]: 请求的间隔(ms)，即 period / limit
+# ARGV[2]: 允许的突发量(ms)，即 period - 间隔，最多允许连续 limit 次请求
+# 返回 {是否通过, 需要等待的时间(ms)}
+GCRA_SCRIPT = '''
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+local wait = tat - now - burst
+if wait > 0 then
+    return {0, wait}
+end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, 0}
+'''
+
+# 客户端分类，按顺序匹配请求路径的前缀，都不匹配时为anonymous
+CLIENT_CLASS_LIST = [
+    ('/api/v1/wows/bot/', 'bot'),
+    ('/api/v1/wows/app1/', 'app'),
+]
+
+
+def parse_limit(value: str) -> tuple[int, float]:
+    "解析 limit/period 格式的限流配置，例如 20/10 表示10秒内最多20次请求"
+    limit, period = value.split('/')
+    return int(limit), float(period)
+
+
+class LocalBucket:
+    '''每个worker内的令牌桶
+
+    容量和速率和Redis中的限流规则相同，单个worker中令牌耗尽时所有worker的请求总数必然已经超过限制，可以直接拒绝，不需要访问Redis
+    '''
+    __buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    @classmethod
+    def consume(self, key: str, limit: int, period: float) -> bool:
+        '''消耗一个令牌
+
+        返回：
+            是否有剩余的令牌
+        '''
+        now = time.monotonic()
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            bucket = [float(limit), now]
+            self.__buckets[key] = bucket
+            config = EnvConfig.get_config()
+            while len(self.__buckets) > config.RATE_LIMIT_LOCAL_SIZE:
+                self.__buckets.popitem(last=False)
+        else:
+            self.__buckets.move_to_end(key)
+            bucket[0] = min(float(limit), bucket[0] + (now - bucket[1]) * limit / period)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+class RateLimiter:
+    '''接口限流
+
+    使用GCRA算法，每次请求只需要执行一次Lua脚本，请求在周期内均匀分布，不会出现固定窗口边界处的突发流量
+
+    限流规则：
+        按请求路径分为 bot/app/anonymous 三类客户端，分别使用 RATE_LIMIT_BOT/RATE_LIMIT_APP/RATE_LIMIT_ANONYMOUS，同一类的接口共用一个限额
+
+        RATE_LIMIT_ROUTES 中配置的路径前缀单独限流，格式为 path=limit/period,path=limit/period
+
+    请求先经过每个worker内的令牌桶，令牌耗尽时直接拒绝
+    '''
+    __routes: list[tuple[str, int, float]] = None
+    __stats = {'requests': 0, 'local_rejected': 0, 'rejected': 0}
+    __class_stats: dict[str, dict[str, int]] = {}
+
+    @classmethod
+    def get_routes(self) -> list[tuple[str, int, float]]:
+        "单独限流的路径前缀，按长度从长到短排序"
+        if self.__routes is None:
+            config = EnvConfig.get_config()
+            routes = []
+            for item in (config.RATE_LIMIT_ROUTES or '').split(','):
+                if not item.strip():
+                    continue
+                path, value = item.strip().split('=')
+                routes.append((path, *parse_limit(value)))
+            self.__routes = sorted(routes, key=lambda route: len(route[0]), reverse=True)
+        return self.__routes
+
+    @classmethod
+    def get_rule(self, path: str) -> tuple[str, str, int, float]:
+        '''获取请求路径对应的限流规则
+
+        返回：
+            (客户端分类, 限流范围, limit, period)，限流范围为路径前缀或者*
+        '''
+        client_class = 'anonymous'
+        for prefix, name in CLIENT_CLASS_LIST:
+            if path.startswith(prefix):
+                client_class = name
+                break
+        for prefix, limit, period in self.get_routes():
+            if path.startswith(prefix):
+                return client_class, prefix, limit, period
+        config = EnvConfig.get_config()
+        limit_list = {
+            'bot': config.RATE_LIMIT_BOT,
+            'app': config.RATE_LIMIT_APP,
+            'anonymous': config.RATE_LIMIT_ANONYMOUS
+        }
+        return client_class, '*', *parse_limit(limit_list[client_class])
+
+    @classmethod
+    async def check(self, host: str, path: str) -> bool:
+        '''检查请求是否达到限速
+
+        参数:
+            host: 请求IP地址
+            path: 请求路径
+
+        返回:
+            是否达到限速
+        '''
+        client_class, scope, limit, period = self.get_rule(path)
+        key = f'rate_limit:{client_class}:{scope}:{host}'
+        stats = self.__class_stats.setdefault(client_class, {'requests': 0, 'local_rejected': 0, 'rejected': 0})
+        self.__stats['requests'] += 1
+        stats['requests'] += 1
+        if not LocalBucket.consume(key, limit, period):
+            self.__stats['local_rejected'] += 1
+            stats['local_rejected'] += 1
+            return True
+        interval = int(period * 1000 / limit)
+        redis = RedisConnection.get_connection()
+        allowed, _ = await redis.eval(GCRA_SCRIPT, 1, key, interval, int(period * 1000) - interval)
+        if not allowed:
+            self.__stats['rejected'] += 1
+            stats['rejected'] += 1
+            return True
+        return False
+
+    @classmethod
+    def get_stats(self) -> dict:
+        '''获取限流的统计数据
+
+        返回：
+            requests: 检查的请求数
+            local_rejected: 被worker内的令牌桶拒绝的请求数
+            rejected: 被Redis中的限流规则拒绝的请求数
+            classes: 按客户端分类的统计
+        '''
+        data = dict(self.__stats)
+        data['classes'] = {name: dict(stats) for name, stats in self.__class_stats.items()}
+        return data
+
+
 @ExceptionLogger.handle_cache_exception_async
-async def rate_limit(host: str, limit: int = 20, window = 10) -> bool:
+async def rate_limit(host: str, path: str = '/') -> bool:
     '''判断当前ip请求是否到达限速
 
-    使用Redis+固定窗口实现接口请求限流，默认为 20次/10秒
-
     参数:
-        key:请求IP地址.
-        limit:窗口内最高请求次数.
-        window:窗口大小(s).
+        host: 请求IP地址.
+        path: 请求路径，用于区分客户端分类和接口的限流规则.
 
     返回:
         bool值，是否到达限速.
     '''
     try:
-        redis = RedisConnection.get_connection()
-        # 基于当前时间生成固定窗口
-        current_time = int(TimeFormat.get_current_timestamp() / window) * window 
-        window_key = f"rate_limit:{host}:{current_time}"
-        
-        # 增加当前窗口的计数
-        current_count = await redis.incr(window_key)
-
-        # 设置key的过期时间，加上5s的冗余
-        if current_count == 1:
-            await redis.expire(window_key, window + 5)
-
-        if current_count > limit:
-            return True
-        else:
-            return False
+        return await RateLimiter.check(host, path)
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
@@ -0,0 +1,206 @@
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from app.core import EnvConfig, api_logger
+
+from .redis import RedisConnection
+
+# 只删除自己持有的锁，加载超过 STAMPEDE_LOCK_TTL 时锁可能已经过期并被其他worker获取
+RELEASE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+class StampedeCache:
+    '''防止缓存击穿的Redis缓存
+
+    缓存过期时大量并发请求同时未命中，会同时访问数据库或者上游接口，通过下面三种方式避免：
+
+        1. 提前刷新(XFetch)：每次命中时根据剩余时间和上次加载的耗时计算提前刷新的概率，越接近过期概率越高，热点数据通常在过期前就已经刷新
+
+        2. 加载锁：刷新或者加载数据前需要获取Redis中的锁，同一时间只有一个worker加载同一个key
+
+        3. 返回旧数据：数据过期后的 stale_ttl 秒内仍然保存在Redis中，没有获取到锁的请求直接返回旧数据，获取到锁的请求在后台刷新
+
+    完全没有缓存时，没有获取到锁的请求最多等待 STAMPEDE_WAIT 秒，超时后自己加载
+
+    每个命名空间一个实例：
+
+        cache = StampedeCache('game_version', ttl=300, stale_ttl=86400)
+        result = await cache.get_or_load(region_id, loader, cacheable=lambda result: result['code'] == 1000)
+    '''
+    KEY_PREFIX = 'app_cache:stampede'
+    LOCK_PREFIX = 'app_cache:stampede_lock'
+    __caches: dict[str, 'StampedeCache'] = {}
+    __refresh_tasks: set[asyncio.Task] = set()
+
+    def __init__(self, namespace: str, ttl: int, stale_ttl: int = 0):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = {'hits': 0, 'early_refreshes': 0, 'stale_hits': 0, 'misses': 0, 'waits': 0, 'errors': 0}
+        StampedeCache.__caches[namespace] = self
+
+    def should_refresh(remaining: float, delta: float) -> bool:
+        '''XFetch算法，判断是否需要提前刷新
+
+        参数：
+            remaining: 距离过期的剩余时间(秒)
+            delta: 加载数据的耗时(秒)
+
+        返回：
+            是否需要提前刷新
+        '''
+        if remaining <= 0:
+            return True
+        beta = EnvConfig.get_config().STAMPEDE_BETA
+        # 1 - random() 的取值范围为 (0, 1]，避免log(0)
+        return -delta * beta * math.log(1 - random.random()) >= remaining
+
+    async def acquire_lock(lock_key: str) -> str | None:
+        '''获取加载锁，Redis不可用时视为获取成功
+
+        返回：
+            锁的token，用于 release_lock，没有获取到锁时返回None
+        '''
+        token = uuid.uuid4().hex
+        try:
+            redis = RedisConnection.get_connection()
+            if await redis.set(lock_key, token, ex=EnvConfig.get_config().STAMPEDE_LOCK_TTL, nx=True):
+                return token
+            return None
+        except Exception as e:
+            api_logger.warning(f'Failed to acquire the cache lock: {e}')
+            return token
+
+    async def release_lock(lock_key: str, token: str) -> None:
+        "释放加载锁，锁已经被其他worker获取时不删除"
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            api_logger.warning(f'Failed to release the cache lock: {e}')
+
+    async def wait_for(key: str) -> str | None:
+        '''等待其他worker加载数据
+
+        每隔50ms读取一次，最多等待 STAMPEDE_WAIT 秒
+
+        返回：
+            Redis中的数据，超时返回None
+        '''
+        redis = RedisConnection.get_connection()
+        deadline = time.monotonic() + EnvConfig.get_config().STAMPEDE_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            value = await redis.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def get_keys(self, key: str) -> tuple[str, str]:
+        return (
+            f'{StampedeCache.KEY_PREFIX}:{self.namespace}:{key}',
+            f'{StampedeCache.LOCK_PREFIX}:{self.namespace}:{key}'
+        )
+
+    async def get_or_load(
+        self,
+        key: str | int,
+        loader: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = None
+    ) -> Any:
+        '''读取缓存，未命中时通过loader加载
+
+        参数：
+            key: 缓存key
+            loader: 加载数据的异步函数，返回值需要可以转为json
+            cacheable: 判断返回值是否可以缓存，为空时全部缓存
+
+        返回：
+            缓存的数据或者loader的返回值
+        '''
+        redis_key, lock_key = self.get_keys(key)
+        try:
+            redis = RedisConnection.get_connection()
+            raw = await redis.get(redis_key)
+        except Exception as e:
+            self.stats['errors'] += 1
+            api_logger.warning(f'Failed to read the {self.namespace} cache: {e}')
+            return await loader()
+        if raw is not None:
+            entry = json.loads(raw)
+            remaining = entry['e'] - time.time()
+            if not StampedeCache.should_refresh(remaining, entry['d']):
+                self.stats['hits'] += 1
+                return entry['v']
+            if remaining > 0:
+                self.stats['early_refreshes'] += 1
+            else:
+                self.stats['stale_hits'] += 1
+            # 获取到锁的请求在后台刷新，所有请求都返回当前的数据
+            token = await StampedeCache.acquire_lock(lock_key)
+            if token is not None:
+                task = asyncio.create_task(self.__refresh(redis_key, lock_key, token, loader, cacheable))
+                StampedeCache.__refresh_tasks.add(task)
+                task.add_done_callback(StampedeCache.__refresh_tasks.discard)
+            return entry['v']
+        self.stats['misses'] += 1
+        token = await StampedeCache.acquire_lock(lock_key)
+        if token is None:
+            try:
+                raw = await StampedeCache.wait_for(redis_key)
+            except Exception as e:
+                self.stats['errors'] += 1
+                api_logger.warning(f'Failed to read the {self.namespace} cache: {e}')
+                raw = None
+            if raw is not None:
+                self.stats['waits'] += 1
+                return json.loads(raw)['v']
+            return await self.__load(redis_key, loader, cacheable)
+        try:
+            return await self.__load(redis_key, loader, cacheable)
+        finally:
+            await StampedeCache.release_lock(lock_key, token)
+
+    async def __load(self, redis_key: str, loader: Callable[[], Awaitable[Any]], cacheable: Callable[[Any], bool]) -> Any:
+        start_time = time.monotonic()
+        value = await loader()
+        delta = time.monotonic() - start_time
+        if cacheable is not None and not cacheable(value):
+            return value
+        now = time.time()
+        entry = {'v': value, 'd': round(delta, 4), 'e': now + self.ttl}
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.set(redis_key, json.dumps(entry), ex=self.ttl + self.stale_ttl)
+        except Exception as e:
+            self.stats['errors'] += 1
+            api_logger.warning(f'Failed to write the {self.namespace} cache: {e}')
+        return value
+
+    async def __refresh(self, redis_key: str, lock_key: str, token: str, loader, cacheable) -> None:
+        try:
+            await self.__load(redis_key, loader, cacheable)
+        except Exception as e:
+            self.stats['errors'] += 1
+            api_logger.warning(f'Failed to refresh the {self.namespace} cache: {e}')
+        finally:
+            await StampedeCache.release_lock(lock_key, token)
+
+    @classmethod
+    def get_stats(self) -> dict:
+        '''获取所有命名空间的统计数据
+
+        返回：
+            {namespace: {hits, early_refreshes, stale_hits, misses, waits, errors}}
+        '''
+        return {namespace: dict(cache.stats) for namespace, cache in self.__caches.items()}
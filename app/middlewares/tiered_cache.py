@@ -0,0 +1,187 @@
+import json
+import asyncio
+from typing import Any, Optional
+
+from app.core import api_logger
+
+from .redis import RedisConnection
+from .local_cache import LocalCache
+
+
+class TieredCache:
+    '''两级缓存：进程内LRU + Redis
+
+    每个命名空间一个实例，读取顺序为 进程内LRU -> Redis，两级都未命中时由调用方读取数据库后通过 set 写入
+
+    Redis中的key格式为 app_cache:{namespace}:{key}，数据为json
+
+    修改数据的程序(包括tool/*中的更新程序)删除Redis中的key后，向 app_cache:invalidate 频道发布消息：
+
+        {"namespace": "bot_user", "keys": ["1:2023619512", ...]}
+
+    每个worker通过 start 启动的后台任务订阅该频道并删除进程内的数据，订阅断开期间可能丢失的消息通过清空进程内缓存处理
+
+    其他模块自己管理的进程内缓存可以通过 register_local 注册到某个命名空间，同样会收到失效消息
+
+    Redis不可用时只使用进程内缓存
+    '''
+    KEY_PREFIX = 'app_cache'
+    CHANNEL = 'app_cache:invalidate'
+    __caches: dict[str, 'TieredCache'] = {}
+    __locals: dict[str, LocalCache] = {}
+    __listener: Optional[asyncio.Task] = None
+
+    def __init__(self, namespace: str, maxsize: int, local_ttl: float):
+        self.namespace = namespace
+        self.local = LocalCache(maxsize, local_ttl)
+        self.stats = {'redis_hits': 0, 'misses': 0, 'stored': 0, 'invalidated': 0, 'errors': 0}
+        TieredCache.__caches[namespace] = self
+
+    def get_redis_key(self, key: str) -> str:
+        return f'{TieredCache.KEY_PREFIX}:{self.namespace}:{key}'
+
+    async def get(self, key: str) -> tuple[bool, Any]:
+        '''读取缓存
+
+        返回：
+            (是否命中, 数据)
+        '''
+        hit, value = self.local.get(key)
+        if hit:
+            return True, value
+        try:
+            redis = RedisConnection.get_connection()
+            # 同时获取剩余的过期时间，进程内缓存不会比Redis中的数据更晚过期
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.get(self.get_redis_key(key))
+                pipe.ttl(self.get_redis_key(key))
+                raw, ttl = await pipe.execute()
+        except Exception as e:
+            self.stats['errors'] += 1
+            self.stats['misses'] += 1
+            api_logger.warning(f'Failed to read the {self.namespace} cache: {e}')
+            return False, None
+        if raw is None:
+            self.stats['misses'] += 1
+            return False, None
+        value = json.loads(raw)
+        self.stats['redis_hits'] += 1
+        if ttl and ttl > 0:
+            self.local.set(key, value, ttl)
+        return True, value
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        '''写入缓存
+
+        参数：
+            key: 缓存key
+            value: 可以转为json的数据
+            ttl: 过期时间(秒)，小于等于0时不缓存
+        '''
+        if ttl <= 0:
+            return
+        self.local.set(key, value, ttl)
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.set(self.get_redis_key(key), json.dumps(value), ex=ttl)
+            self.stats['stored'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            api_logger.warning(f'Failed to write the {self.namespace} cache: {e}')
+
+    async def invalidate(self, keys: list[str]) -> None:
+        '''删除缓存并通知所有worker删除进程内的数据
+
+        参数：
+            keys: 缓存key列表
+        '''
+        if not keys:
+            return
+        for key in keys:
+            self.local.delete(key)
+        try:
+            redis = RedisConnection.get_connection()
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*[self.get_redis_key(key) for key in keys])
+                pipe.publish(self.CHANNEL, TieredCache.get_message(self.namespace, keys))
+                await pipe.execute()
+        except Exception as e:
+            self.stats['errors'] += 1
+            api_logger.warning(f'Failed to invalidate the {self.namespace} cache: {e}')
+
+    @classmethod
+    def register_local(self, namespace: str, local: LocalCache) -> None:
+        "注册其他模块的进程内缓存，收到该命名空间的失效消息时删除其中的数据"
+        self.__locals[namespace] = local
+
+    def get_message(namespace: str, keys: list[str]) -> str:
+        "失效消息的内容，用于需要在Lua脚本中发布消息的场景"
+        return json.dumps({'namespace': namespace, 'keys': keys})
+
+    @classmethod
+    def start(self) -> None:
+        "启动订阅失效消息的后台任务"
+        if self.__listener is None or self.__listener.done():
+            self.__listener = asyncio.create_task(self.__listen(self))
+
+    @classmethod
+    async def stop(self) -> None:
+        "停止订阅失效消息的后台任务，需要在关闭Redis连接之前调用"
+        if self.__listener:
+            self.__listener.cancel()
+            try:
+                await self.__listener
+            except asyncio.CancelledError:
+                pass
+            self.__listener = None
+
+    async def __listen(self) -> None:
+        while True:
+            try:
+                redis = RedisConnection.get_connection()
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    # 订阅断开期间的消息已经丢失，重新订阅后清空进程内缓存
+                    for cache in self.__caches.values():
+                        cache.local.clear()
+                    for local in self.__locals.values():
+                        local.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        self.__handle_message(self, message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                api_logger.warning(f'Cache invalidation subscriber disconnected: {e}')
+                await asyncio.sleep(1)
+
+    def __handle_message(self, data: str) -> None:
+        try:
+            message = json.loads(data)
+            local = self.__locals.get(message['namespace'])
+            if local is not None:
+                for key in message['keys']:
+                    local.delete(str(key))
+                return
+            cache = self.__caches.get(message['namespace'])
+            if cache is None:
+                return
+            for key in message['keys']:
+                cache.local.delete(str(key))
+            cache.stats['invalidated'] += len(message['keys'])
+        except Exception as e:
+            api_logger.warning(f'Invalid cache invalidation message: {e}')
+
+    @classmethod
+    def get_stats(self) -> dict:
+        '''获取所有命名空间的统计数据
+
+        返回：
+            {namespace: {local, redis_hits, misses, stored, invalidated, errors}}
+        '''
+        data = {}
+        for namespace, cache in self.__caches.items():
+            data[namespace] = dict(cache.stats)
+            data[namespace]['local'] = cache.local.get_stats()
+        return data
@@ -9,12 +9,18 @@ from .access_token import UserAccessToken, UserAccessToken2
 from .ships_cache import ShipsCacheModel
 from .root import RootModel
 from .ship_rank import RankDataModel
+from .provision import ProvisionModel
+from .write_buffer import UserWriteBuffer
+from .profile_cache import ProfileCache
 
 __all__ = [
     'UserModel',
     'ClanModel',
     'GameModel',
     'RootModel',
+    'ProvisionModel',
+    'UserWriteBuffer',
+    'ProfileCache',
     'BotUserModel',
     'RecentUserModel',
     'RecentsUserModel',
@@ -1,7 +1,4 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.response import JSONResponse, ResponseDict
 from app.log import ExceptionLogger
 
@@ -31,11 +28,7 @@ class UserAccessToken:
         返回:
             - ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = []
             await cur.execute(
                 "SELECT account_id, region_id, token_value, expired_at "
@@ -52,14 +45,7 @@ class UserAccessToken:
                     'token_value': user[2]
                 })
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
     
     @ExceptionLogger.handle_database_exception_async
     async def get_ac_value_by_rid(region_id: int, token_type: int = 1) -> ResponseDict:
@@ -74,11 +60,7 @@ class UserAccessToken:
         返回:
             - ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = {}
             await cur.execute(
                 "SELECT account_id, token_type, token_value, expired_at "
@@ -91,14 +73,7 @@ class UserAccessToken:
                     continue
                 data[user[0]] = user[2]
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
     
     @ExceptionLogger.handle_database_exception_async
     async def get_ac_value_by_id(account_id: int, region_id: int, token_type: int = 1) -> ResponseDict:
@@ -113,11 +88,7 @@ class UserAccessToken:
         返回:
             - ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = None
             await cur.execute(
                 "SELECT token_value, expired_at "
@@ -130,14 +101,39 @@ class UserAccessToken:
                     'token_value': user[0]
                 }
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
+    
+    @ExceptionLogger.handle_database_exception_async
+    async def get_ac_value_batch(users: list[tuple[int, int]], token_type: int = 1) -> ResponseDict:
+        '''批量获取用户的ac数据
+
+        主要用于bot批量获取用户信息
+
+        参数:
+            - users: [(account_id, region_id), ...]
+            - token_type
+        
+        返回:
+            - ResponseDict，data为 {(account_id, region_id): {'token_value': ...}}，没有ac的用户不在结果中
+        '''
+        data = {}
+        users = list(dict.fromkeys(users))
+        if not users:
+            return JSONResponse.get_success_response(data)
+        async with DatabaseSession.read() as cur:
+            params = [value for account_id, region_id in users for value in (region_id, account_id)]
+            await cur.execute(
+                "SELECT account_id, region_id, token_value, expired_at "
+                f"FROM {MAIN_DB}.user_token WHERE token_type = %s "
+                f"AND (region_id, account_id) IN ({', '.join(['(%s, %s)'] * len(users))});",
+                [token_type] + params
+            )
+            for user in await cur.fetchall():
+                data[(user[0], user[1])] = {
+                    'token_value': user[2]
+                }
+
+            return JSONResponse.get_success_response(data)
     
     @ExceptionLogger.handle_database_exception_async
     async def set_ac_value(
@@ -148,11 +144,7 @@ class UserAccessToken:
         expired_at: int = None
     ) -> ResponseDict:
         '''写入或者更新某个用户的ac数据'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             data = {}
             await cur.execute(
                 "SELECT token_value, expired_at "
@@ -171,23 +163,12 @@ class UserAccessToken:
                     [account_id, region_id, token_type, token_value]
                 )
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
     
     @ExceptionLogger.handle_database_exception_async
     async def delete_ac_value_by_id(account_id: int, region_id: int, token_type: int = 1) -> ResponseDict:
         '''删除某个用户的ac数据'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             data = {}
             await cur.execute(
                 "DELETE FROM {MAIN_DB}.user_token WHERE region_id = %s AND account_id = %s AND token_type = %s;",
@@ -197,14 +178,7 @@ class UserAccessToken:
             if user:
                 data['token_value'] = user[0]
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
     
 class UserAccessToken2:
     '''用户ac2数据
@@ -1,11 +1,10 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.utils import UtilityFunctions
 from app.response import JSONResponse, ResponseDict
 
+from .provision import ProvisionModel
+from .profile_cache import ProfileCache
 from .db_name import MAIN_DB, BOT_DB
 
 
@@ -23,11 +22,8 @@ class BotUserModel:
         返回:
             ResponseDict
         '''
-        try:
-            connection: Connection = await MysqlConnection.get_connection()
-            await connection.begin()
-            cursor: Cursor = await connection.cursor()
-
+        # 绑定信息更新后的一段时间内从主库读取
+        async with DatabaseSession.read(replica=True, sticky_key=f'bind:{platform}:{user_id}') as cursor:
             await cursor.execute(
                 f"SELECT region_id, account_id FROM {BOT_DB}.user_basic "
                 "WHERE platform = %s AND user_id = %s;",
@@ -42,14 +38,7 @@ class BotUserModel:
             else:
                 data = None
 
-            await connection.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await connection.rollback()
-            raise e
-        finally:
-            await cursor.close()
-            await MysqlConnection.release_connection(connection)
 
     @ExceptionLogger.handle_database_exception_async
     async def post_user_bind(user_data: dict) -> ResponseDict:
@@ -63,11 +52,8 @@ class BotUserModel:
         返回:
             ResponseDict
         '''
-        try:
-            connection: Connection = await MysqlConnection.get_connection()
-            await connection.begin()
-            cursor: Cursor = await connection.cursor()
-
+        sticky_key = f"bind:{user_data['platform']}:{user_data['user_id']}"
+        async with DatabaseSession.transaction(sticky_key=sticky_key) as cursor:
             await cursor.execute(
                 f"SELECT region_id, account_id FROM {BOT_DB}.user_basic "
                 "WHERE platform = %s AND user_id = %s;",
@@ -86,14 +72,7 @@ class BotUserModel:
                     "VALUES (%s, %s, %s, %s);",
                     [user_data['platform'], user_data['user_id'],user_data['region_id'],user_data['account_id']]
                 )
-            await connection.commit()
             return JSONResponse.API_1000_Success
-        except Exception as e:
-            await connection.rollback()
-            raise e
-        finally:
-            await cursor.close()
-            await MysqlConnection.release_connection(connection)
 
     @ExceptionLogger.handle_database_exception_async
     async def get_user_data(account_id: int, region_id: int) -> ResponseDict:
@@ -102,13 +81,14 @@ class BotUserModel:
         主要是bot或者排行榜通过uid来获取用户的基本信息，包括名称，工会以及颜色
 
         返回的数据中expired为True表示数据库中的用户工会信息已经过期或者无该用户数据
+
+        查询结果通过 ProfileCache 缓存，数据过期前不需要读取数据库
         
         '''
-        try:
-            connection: Connection = await MysqlConnection.get_connection()
-            await connection.begin()
-            cursor: Cursor = await connection.cursor()
-
+        user = await ProfileCache.get_user(account_id, region_id)
+        if user is not None:
+            return JSONResponse.get_success_response(BotUserModel.get_user_data_from_row(account_id, user))
+        async with DatabaseSession.read(replica=True) as cursor:
             await cursor.execute(f'''
                 SELECT 
                     basic.username, userclan.clan_id, UNIX_TIMESTAMP(userclan.updated_at) AS user_update_time, 
@@ -122,67 +102,106 @@ class BotUserModel:
                 [region_id, account_id]
             )
             user = await cursor.fetchone()
-            data = {
-                'expired': False,
-                'user': {
-                    'id': account_id,
-                    'name': None
-                },
-                'clan': {
-                    'id': None,
-                    'tag': None,
-                    'league': None
-                }
+        data = BotUserModel.get_user_data_from_row(account_id, user)
+        if user is None:
+            # 用户不存在时才需要开启事务插入新用户
+            name = UtilityFunctions.get_user_default_name(account_id)
+            async with DatabaseSession.transaction() as cursor:
+                await ProvisionModel.ensure_users(cursor, [(account_id, region_id, name)])
+        else:
+            await ProfileCache.set_user(account_id, region_id, user)
+        return JSONResponse.get_success_response(data)
+
+    def get_user_data_from_row(account_id: int, user: tuple | None) -> dict:
+        '''将查询结果转换为用户的基本信息
+
+        参数:
+            account_id: 用户id
+            user: (username, clan_id, user_update_time, tag, league, clan_update_time)，用户不存在时为None，返回默认名称
+
+        返回:
+            {expired, user, clan}
+        '''
+        data = {
+            'expired': False,
+            'user': {
+                'id': account_id,
+                'name': None
+            },
+            'clan': {
+                'id': None,
+                'tag': None,
+                'league': None
             }
-            if user:
-                data['user']['name'] = user[0]
-                if user[2] and UtilityFunctions.check_clan_vaild(user[2]):
-                    data['clan']['id'] = user[1]
-                    if user[1]:
-                        if user[5] and UtilityFunctions.check_clan_vaild(user[5]):
-                            data['clan']['tag'] = user[3]
-                            data['clan']['league'] = user[4]
-                        else:
-                            data['expired'] = True
-                else:
-                    data['expired'] = True
+        }
+        if user:
+            data['user']['name'] = user[0]
+            if user[2] and UtilityFunctions.check_clan_vaild(user[2]):
+                data['clan']['id'] = user[1]
+                if user[1]:
+                    if user[5] and UtilityFunctions.check_clan_vaild(user[5]):
+                        data['clan']['tag'] = user[3]
+                        data['clan']['league'] = user[4]
+                    else:
+                        data['expired'] = True
             else:
-                name = UtilityFunctions.get_user_default_name(account_id)
-                await cursor.execute(
-                    f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                    [account_id, region_id, name]
-                )
-                await cursor.execute(
-                    f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cursor.execute(
-                    f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cursor.execute(
-                    f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                data['user']['name'] = name
                 data['expired'] = True
+        else:
+            data['user']['name'] = UtilityFunctions.get_user_default_name(account_id)
+            data['expired'] = True
+        return data
+
+    @ExceptionLogger.handle_database_exception_async
+    async def get_user_data_batch(users: list[tuple[int, int]]) -> ResponseDict:
+        '''批量获取数据库中用户的基本信息
+
+        通过一次查询获取所有用户的数据，不存在的用户在同一个事务中批量写入
+
+        参数:
+            users: [(account_id, region_id), ...]
+
+        返回:
+            ResponseDict，data为和users顺序一致的列表，每一项和 get_user_data 的返回值相同
+        '''
+        unique_users = list(dict.fromkeys(users))
+        rows = {}
+        if unique_users:
+            params = [value for account_id, region_id in unique_users for value in (region_id, account_id)]
+            async with DatabaseSession.read(replica=True) as cursor:
+                await cursor.execute(f'''
+                    SELECT 
+                        basic.username, userclan.clan_id, UNIX_TIMESTAMP(userclan.updated_at) AS user_update_time, 
+                        clan.tag, clan.league, UNIX_TIMESTAMP(clan.updated_at) AS clan_update_time,
+                        basic.account_id, basic.region_id
+                    FROM {MAIN_DB}.user_basic AS basic 
+                    LEFT JOIN {MAIN_DB}.user_clan AS userclan
+                        ON userclan.account_id = basic.account_id 
+                    LEFT JOIN {MAIN_DB}.clan_basic AS clan
+                        ON clan.region_id = basic.region_id AND clan.clan_id = userclan.clan_id
+                    WHERE (basic.region_id, basic.account_id) IN ({', '.join(['(%s, %s)'] * len(unique_users))});''',
+                    params
+                )
+                for row in await cursor.fetchall():
+                    rows[(row[6], row[7])] = row
+        missing_users = [
+            (account_id, region_id, UtilityFunctions.get_user_default_name(account_id))
+            for account_id, region_id in unique_users if (account_id, region_id) not in rows
+        ]
+        if missing_users:
+            async with DatabaseSession.transaction() as cursor:
+                await ProvisionModel.ensure_users(cursor, missing_users)
+        data = []
+        for account_id, region_id in users:
+            data.append(BotUserModel.get_user_data_from_row(account_id, rows.get((account_id, region_id))))
+        return JSONResponse.get_success_response(data)
 
-            await connection.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await connection.rollback()
-            raise e
-        finally:
-            await cursor.close()
-            await MysqlConnection.release_connection(connection)
-        
     @ExceptionLogger.handle_database_exception_async
     async def get_clan_data(clan_id: int, region_id: int) -> ResponseDict:
         '''获取工会名称
 
         从clan_basic中获取工会名称数据
         
-        如果工会不存在会插入并返回一个默认值
+        如果工会不存在会插入并返回一个默认值，存在的工会数据通过 ProfileCache 缓存
 
         参数：
             clan_id: 工会id
@@ -192,51 +211,31 @@ class BotUserModel:
             tag: 工会名称
             league: 工会段位（用于标记颜色）
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
-            data= {
-                'tag': None,
-                'league': None
-            }
+        data= {
+            'tag': None,
+            'league': None
+        }
+        clan = await ProfileCache.get_clan(clan_id, region_id)
+        if clan is not None:
+            data['tag'] = clan[0]
+            data['league'] = clan[1]
+            return JSONResponse.get_success_response(data)
+        async with DatabaseSession.read(replica=True) as cur:
             await cur.execute(
-                f"SELECT tag, league FROM {MAIN_DB}.clan_basic "
+                f"SELECT tag, league, UNIX_TIMESTAMP(updated_at) FROM {MAIN_DB}.clan_basic "
                 "WHERE region_id = %s and clan_id = %s;", 
                 [region_id, clan_id]
             )
             clan = await cur.fetchone()
-            if clan is None:
-                # 用户不存在，插入新用户
-                tag = UtilityFunctions.get_clan_default_name()
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_basic (clan_id, region_id, tag) VALUES (%s, %s, %s);",
-                    [clan_id, region_id, tag]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_info (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_users (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_season (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                data['tag'] = tag
-                data['league'] = 5
-            else:
-                data['tag'] = clan[0]
-                data['league'] = clan[1]
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
\ No newline at end of file
+        if clan is None:
+            # 工会不存在，插入新工会
+            tag = UtilityFunctions.get_clan_default_name()
+            async with DatabaseSession.transaction() as cur:
+                await ProvisionModel.ensure_clans(cur, [(clan_id, region_id, tag)])
+            data['tag'] = tag
+            data['league'] = 5
+        else:
+            data['tag'] = clan[0]
+            data['league'] = clan[1]
+            await ProfileCache.set_clan(clan_id, region_id, clan)
+        return JSONResponse.get_success_response(data)
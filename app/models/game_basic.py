@@ -1,7 +1,4 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.response import JSONResponse, ResponseDict
 
@@ -21,11 +18,7 @@ class GameModel:
         返回:
             ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = {
                 'version': None
             }
@@ -39,14 +32,7 @@ class GameModel:
             else:
                 data['version'] = game[0]
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def update_game_version(region_id: int, game_version: str) -> ResponseDict:
@@ -60,11 +46,7 @@ class GameModel:
         返回:
             ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             version = ".".join(game_version.split(".")[:2])
             await cur.execute(
                 f"SELECT game_version FROM {MAIN_DB}.region_version WHERE region_id = %s;",
@@ -83,11 +65,4 @@ class GameModel:
                     [game_version, region_id]
                 )
 
-            await conn.commit()
-            return JSONResponse.API_1000_Success
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
\ No newline at end of file
+            return JSONResponse.API_1000_Success
\ No newline at end of file
@@ -1,11 +1,9 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.response import JSONResponse, ResponseDict
 from app.log import ExceptionLogger
 from app.utils import UtilityFunctions, TimeFormat
 
+from .provision import ProvisionModel
 from .db_name import MAIN_DB
 
 
@@ -119,56 +117,31 @@ class ClanModel:
             tag: 工会名称
             league: 工会段位（用于标记颜色）
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
-            data= {
-                'tag': None,
-                'league': None,
-                'updated_at': None
-            }
+        data= {
+            'tag': None,
+            'league': None,
+            'updated_at': None
+        }
+        async with DatabaseSession.read(replica=True) as cur:
             await cur.execute(
                 "SELECT tag, league, UNIX_TIMESTAMP(updated_at) AS update_time "
                 f"FROM {MAIN_DB}.clan_basic WHERE region_id = %s and clan_id = %s;", 
                 [region_id, clan_id]
             )
             clan = await cur.fetchone()
-            if clan is None:
-                # 用户不存在，插入新用户
-                tag = UtilityFunctions.get_clan_default_name()
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_basic (clan_id, region_id, tag) VALUES (%s, %s, %s);",
-                    [clan_id, region_id, tag]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_info (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_users (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_season (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                data['tag'] = tag
-                data['league'] = 5
-            else:
-                data['tag'] = clan[0]
-                data['league'] = clan[1]
-                data['updated_at'] = clan[2]
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
+        if clan is None:
+            # 用户不存在，插入新用户
+            tag = UtilityFunctions.get_clan_default_name()
+            async with DatabaseSession.transaction() as cur:
+                await ProvisionModel.ensure_clans(cur, [(clan_id, region_id, tag)])
+            data['tag'] = tag
+            data['league'] = 5
+        else:
+            data['tag'] = clan[0]
+            data['league'] = clan[1]
+            data['updated_at'] = clan[2]
+
+        return JSONResponse.get_success_response(data)
 
     # @ExceptionLogger.handle_database_exception_async
     # async def update_clan_season(clan_season: dict) -> ResponseDict:
@@ -1,12 +1,10 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
 from .access_token import UserAccessToken
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.response import JSONResponse, ResponseDict
 from app.utils import UtilityFunctions, TimeFormat, BinaryParserUtils
 
+from .provision import ProvisionModel
 from .db_name import MAIN_DB
 
 
@@ -24,22 +22,17 @@ class UserModel:
         返回:
             ResponseDict
         '''
-        try:
-            connection: Connection = await MysqlConnection.get_connection()  # 获取连接
-            await connection.begin()  # 开启事务
-            cursor: Cursor = await connection.cursor()  # 获取游标
-
+        # 只有查询语句时使用 read()，不会开启事务
+        async with DatabaseSession.read() as cursor:
             # 在这里执行sql语句
             await cursor.execute()
-
-            await connection.commit()  # 提交事务
-            return JSONResponse.API_1000_Success  # 返回数据
-        except Exception as e:
-            await connection.rollback()  # 执行报错回滚事务
-            raise e  # 抛出异常
-        finally:
-            await cursor.close()  # 关闭游标
-            await MysqlConnection.release_connection(connection)  # 释放连接
+            data = await cursor.fetchone()
+        # 需要写入时使用 transaction()，退出时自动提交，出现异常时自动回滚
+        async with DatabaseSession.transaction() as cursor:
+            # 在这里执行sql语句
+            await cursor.execute()
+        # 游标和连接由会话负责关闭和释放
+        return JSONResponse.API_1000_Success  # 返回数据
 
     # @ExceptionLogger.handle_database_exception_async
     # async def get_user_max_number() -> ResponseDict:
@@ -173,54 +166,29 @@ class UserModel:
         返回：
             ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
-            data = {
-                'nickname': None,
-                'update_time': None
-            }
+        data = {
+            'nickname': None,
+            'update_time': None
+        }
+        async with DatabaseSession.read(replica=True) as cur:
             await cur.execute(
                 "SELECT username, UNIX_TIMESTAMP(updated_at) AS update_time "
                 f"FROM {MAIN_DB}.user_basic WHERE region_id = %s and account_id = %s;", 
                 [region_id, account_id]
             )
             user = await cur.fetchone()
-            if user is None:
-                # 用户不存在
-                name = UtilityFunctions.get_user_default_name(account_id)
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                    [account_id, region_id, name]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                data['nickname'] = name
-                data['update_time'] = None
-            else:
-                data['nickname'] = user[0]
-                data['update_time'] = user[1]
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
+        if user is None:
+            # 用户不存在
+            name = UtilityFunctions.get_user_default_name(account_id)
+            async with DatabaseSession.transaction() as cur:
+                await ProvisionModel.ensure_users(cur, [(account_id, region_id, name)])
+            data['nickname'] = name
+            data['update_time'] = None
+        else:
+            data['nickname'] = user[0]
+            data['update_time'] = user[1]
+
+        return JSONResponse.get_success_response(data)
 
     @ExceptionLogger.handle_database_exception_async
     async def get_user_clan_id(account_id: int, region_id: int) -> ResponseDict:
@@ -234,54 +202,29 @@ class UserModel:
         返回：
             ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
-            data =  {
-                'clan_id': None,
-                'updated_at': 0
-            }
+        data =  {
+            'clan_id': None,
+            'updated_at': 0
+        }
+        async with DatabaseSession.read(replica=True) as cur:
             await cur.execute(
                 "SELECT clan_id, UNIX_TIMESTAMP(updated_at) AS update_time "
                 f"FROM {MAIN_DB}.user_clan WHERE account_id = %s;", 
                 [account_id]
             )
             user = await cur.fetchone()
-            if user is None:
-                # 用户不存在
-                name = UtilityFunctions.get_user_default_name(account_id)
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                    [account_id, region_id, name]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                data['clan_id'] = None
-                data['updated_at'] = None
-            else:
-                data['clan_id'] = user[0]
-                data['updated_at'] = user[1]
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
+        if user is None:
+            # 用户不存在
+            name = UtilityFunctions.get_user_default_name(account_id)
+            async with DatabaseSession.transaction() as cur:
+                await ProvisionModel.ensure_users(cur, [(account_id, region_id, name)])
+            data['clan_id'] = None
+            data['updated_at'] = None
+        else:
+            data['clan_id'] = user[0]
+            data['updated_at'] = user[1]
+
+        return JSONResponse.get_success_response(data)
 
     @ExceptionLogger.handle_database_exception_async
     async def get_user_info(account_id: int, region_id: int) -> ResponseDict:
@@ -297,11 +240,7 @@ class UserModel:
         返回：
             ResponseDict
         '''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read(replica=True) as cur:
             await cur.execute(
                 "SELECT is_active, active_level, is_public, total_battles, "
                 "UNIX_TIMESTAMP(last_battle_at) AS last_battle_time, UNIX_TIMESTAMP(updated_at) AS update_time "
@@ -309,52 +248,31 @@ class UserModel:
                 [account_id]
             )
             user = await cur.fetchone()
-            data = None
-            if user is None:
-                # 用户不存在
-                name = UtilityFunctions.get_user_default_name(account_id)
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                    [account_id, region_id, name]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                await cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                data = {
-                    'is_active': 0,
-                    'active_level': 0,
-                    'is_public': 0,
-                    'total_battles': 0,
-                    'last_battle_time': 0,
-                    'update_time': None
-                }
-            else:
-                data = {
-                    'is_active': user[0],
-                    'active_level': user[1],
-                    'is_public': user[2],
-                    'total_battles': user[3],
-                    'last_battle_time': user[4],
-                    'update_time': user[5]
-                }
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
+        data = None
+        if user is None:
+            # 用户不存在
+            name = UtilityFunctions.get_user_default_name(account_id)
+            async with DatabaseSession.transaction() as cur:
+                await ProvisionModel.ensure_users(cur, [(account_id, region_id, name)])
+            data = {
+                'is_active': 0,
+                'active_level': 0,
+                'is_public': 0,
+                'total_battles': 0,
+                'last_battle_time': 0,
+                'update_time': None
+            }
+        else:
+            data = {
+                'is_active': user[0],
+                'active_level': user[1],
+                'is_public': user[2],
+                'total_battles': user[3],
+                'last_battle_time': user[4],
+                'update_time': user[5]
+            }
+
+        return JSONResponse.get_success_response(data)
 
     # @ExceptionLogger.handle_database_exception_async
     # async def get_user_cache_data(account_id: int, region_id: int) -> ResponseDict:
@@ -0,0 +1,91 @@
+from app.core import EnvConfig
+from app.utils import TimeFormat
+from app.middlewares import TieredCache
+
+# 和 UtilityFunctions.check_clan_vaild 一致，更新时间超过3天的数据视为过期
+PROFILE_VALID_SECONDS = 3 * 24 * 60 * 60
+
+config = EnvConfig.get_config()
+
+
+class ProfileCache:
+    '''bot查询的用户名称、工会名称和段位的缓存
+
+    bot_user: {region_id}:{account_id} -> [username, clan_id, user_update_time]
+
+    bot_clan: {region_id}:{clan_id} -> [tag, league, clan_update_time]
+
+    缓存时间根据数据的updated_at计算，在 check_clan_vaild 判断数据过期的时刻同时过期
+
+    已经过期的数据只缓存 PROFILE_CACHE_STALE_TTL 秒，更新程序写入新数据后会删除缓存
+    '''
+    user = TieredCache('bot_user', config.PROFILE_CACHE_LOCAL_SIZE, config.PROFILE_CACHE_LOCAL_TTL)
+    clan = TieredCache('bot_clan', config.PROFILE_CACHE_LOCAL_SIZE, config.PROFILE_CACHE_LOCAL_TTL)
+
+    def get_ttl(update_time: int | None) -> int:
+        "根据数据的更新时间计算缓存时间"
+        if update_time:
+            ttl = update_time + PROFILE_VALID_SECONDS - TimeFormat.get_current_timestamp()
+            if ttl > 0:
+                return ttl
+        return EnvConfig.get_config().PROFILE_CACHE_STALE_TTL
+
+    async def get_user(account_id: int, region_id: int) -> tuple | None:
+        '''读取缓存的用户数据
+
+        返回：
+            和 BotUserModel.get_user_data 查询结果格式相同的数据
+            (username, clan_id, user_update_time, tag, league, clan_update_time)
+
+            用户或者用户所在工会的数据未命中时返回None
+        '''
+        hit, user = await ProfileCache.user.get(f'{region_id}:{account_id}')
+        if not hit:
+            return None
+        username, clan_id, user_update_time = user
+        if not clan_id:
+            return (username, clan_id, user_update_time, None, None, None)
+        hit, clan = await ProfileCache.clan.get(f'{region_id}:{clan_id}')
+        if not hit:
+            return None
+        return (username, clan_id, user_update_time, *clan)
+
+    async def set_user(account_id: int, region_id: int, user: tuple) -> None:
+        '''写入查询到的用户数据
+
+        参数：
+            user: (username, clan_id, user_update_time, tag, league, clan_update_time)
+        '''
+        username, clan_id, user_update_time, tag, league, clan_update_time = user
+        await ProfileCache.user.set(
+            f'{region_id}:{account_id}',
+            [username, clan_id, user_update_time],
+            ProfileCache.get_ttl(user_update_time)
+        )
+        if clan_id and tag is not None:
+            await ProfileCache.set_clan(clan_id, region_id, (tag, league, clan_update_time))
+
+    async def get_clan(clan_id: int, region_id: int) -> tuple | None:
+        '''读取缓存的工会数据
+
+        返回：
+            (tag, league, clan_update_time)，未命中时返回None
+        '''
+        hit, clan = await ProfileCache.clan.get(f'{region_id}:{clan_id}')
+        return tuple(clan) if hit else None
+
+    async def set_clan(clan_id: int, region_id: int, clan: tuple) -> None:
+        '''写入查询到的工会数据
+
+        参数：
+            clan: (tag, league, clan_update_time)
+        '''
+        await ProfileCache.clan.set(f'{region_id}:{clan_id}', list(clan), ProfileCache.get_ttl(clan[2]))
+
+    async def invalidate_users(region_id: int, account_ids: list[int]) -> None:
+        "用户名称或者所在工会修改后删除缓存"
+        await ProfileCache.user.invalidate([f'{region_id}:{account_id}' for account_id in account_ids])
+
+    async def invalidate_clans(region_id: int, clan_ids: list[int]) -> None:
+        "工会名称或者段位修改后删除缓存"
+        await ProfileCache.clan.invalidate([f'{region_id}:{clan_id}' for clan_id in clan_ids])
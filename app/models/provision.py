@@ -0,0 +1,85 @@
+from aiomysql.cursors import Cursor
+
+from .db_name import MAIN_DB
+
+# 每条INSERT语句最多写入的行数
+PROVISION_BATCH_SIZE = 1000
+
+
+class ProvisionModel:
+    '''用户和工会的初始化数据
+
+    新用户需要在 user_basic/user_info/user_ships/user_clan 中各插入一行，新工会需要在 clan_basic/clan_info/clan_users/clan_season 中各插入一行
+
+    使用 INSERT IGNORE 批量写入，已经存在的数据不会被修改，可以重复调用，每张表每 PROVISION_BATCH_SIZE 个id只需要一次数据库往返
+
+    需要在调用方的事务中使用：
+
+        async with DatabaseSession.transaction() as cur:
+            await ProvisionModel.ensure_users(cur, [(account_id, region_id, username)])
+    '''
+    def get_batches(rows: list) -> list[list]:
+        "将数据按照 PROVISION_BATCH_SIZE 分组"
+        return [rows[i:i + PROVISION_BATCH_SIZE] for i in range(0, len(rows), PROVISION_BATCH_SIZE)]
+
+    async def ensure_users(cur: Cursor, users: list[tuple[int, int, str]], updated: bool = False) -> int:
+        '''确保用户在数据库中存在，不存在则插入默认数据
+
+        参数：
+            cur: 事务中的游标
+            users: [(account_id, region_id, username), ...]
+            updated: 新插入的用户是否设置updated_at，username为真实名称时使用
+
+        返回：
+            新插入的用户数量
+        '''
+        inserted = 0
+        basic_row = '(%s, %s, %s, CURRENT_TIMESTAMP)' if updated else '(%s, %s, %s)'
+        basic_columns = 'account_id, region_id, username, updated_at' if updated else 'account_id, region_id, username'
+        for batch in ProvisionModel.get_batches(list(dict.fromkeys(users))):
+            params = [value for user in batch for value in user]
+            await cur.execute(
+                f"INSERT IGNORE INTO {MAIN_DB}.user_basic ({basic_columns}) "
+                f"VALUES {', '.join([basic_row] * len(batch))};",
+                params
+            )
+            inserted += cur.rowcount
+            account_ids = [user[0] for user in batch]
+            for table in ['user_info', 'user_ships', 'user_clan']:
+                await cur.execute(
+                    f"INSERT IGNORE INTO {MAIN_DB}.{table} (account_id) "
+                    f"VALUES {', '.join(['(%s)'] * len(batch))};",
+                    account_ids
+                )
+        return inserted
+
+    async def ensure_clans(cur: Cursor, clans: list[tuple[int, int, str]], updated: bool = False) -> int:
+        '''确保工会在数据库中存在，不存在则插入默认数据
+
+        参数：
+            cur: 事务中的游标
+            clans: [(clan_id, region_id, tag), ...]
+            updated: 新插入的工会是否设置updated_at，tag为真实名称时使用
+
+        返回：
+            新插入的工会数量
+        '''
+        inserted = 0
+        basic_row = '(%s, %s, %s, CURRENT_TIMESTAMP)' if updated else '(%s, %s, %s)'
+        basic_columns = 'clan_id, region_id, tag, updated_at' if updated else 'clan_id, region_id, tag'
+        for batch in ProvisionModel.get_batches(list(dict.fromkeys(clans))):
+            params = [value for clan in batch for value in clan]
+            await cur.execute(
+                f"INSERT IGNORE INTO {MAIN_DB}.clan_basic ({basic_columns}) "
+                f"VALUES {', '.join([basic_row] * len(batch))};",
+                params
+            )
+            inserted += cur.rowcount
+            clan_ids = [clan[0] for clan in batch]
+            for table in ['clan_info', 'clan_users', 'clan_season']:
+                await cur.execute(
+                    f"INSERT IGNORE INTO {MAIN_DB}.{table} (clan_id) "
+                    f"VALUES {', '.join(['(%s)'] * len(batch))};",
+                    clan_ids
+                )
+        return inserted
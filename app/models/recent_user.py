@@ -1,7 +1,4 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.response import JSONResponse, ResponseDict
 from app.utils import TimeFormat
@@ -12,11 +9,7 @@ from .db_name import MAIN_DB
 class RecentUserModel:
     @ExceptionLogger.handle_database_exception_async
     async def get_recent_user_by_rid(region_id: int) -> ResponseDict:
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = []
             await cur.execute(
                 f"SELECT account_id FROM {MAIN_DB}.recent WHERE region_id = %s;",
@@ -25,23 +18,12 @@ class RecentUserModel:
             users = await cur.fetchall()
             for user in users:
                 data.append(user[0])
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def check_recent_user(account_id: int, region_id: int) -> ResponseDict:
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = {
                 'enabled': False
             }
@@ -52,23 +34,12 @@ class RecentUserModel:
             user = await cur.fetchone()
             if user[0]:
                 data['enabled'] = True
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def add_recent_user(account_id: int, region_id: int, recent_class: int) -> ResponseDict:
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             await cur.execute(
                 f"SELECT recent_class FROM {MAIN_DB}.recent WHERE region_id = %s and account_id = %s;", 
                 [region_id, account_id]
@@ -88,45 +59,23 @@ class RecentUserModel:
                         f"UPDATE {MAIN_DB}.recent SET recent_class = %s WHERE region_id = %s and account_id = %s;",
                         [recent_class, region_id, account_id]
                     )
-            
-            await conn.commit()
+
             return JSONResponse.API_1000_Success
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def del_recent_user(account_id: int, region_id: int) -> ResponseDict:
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             await cur.execute(
                 f"DELETE FROM {MAIN_DB}.recent WHERE region_id = %s and account_id = %s;",
                 [region_id, account_id]
             )
 
-            await conn.commit()
             return JSONResponse.API_1000_Success
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def get_user_recent_data(account_id: int, region_id: int) -> ResponseDict:
         '''获取用户recent表的数据'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             await cur.execute(
                 "SELECT u.is_active, u.active_level, u.is_public, u.total_battles, UNIX_TIMESTAMP(u.last_battle_at) AS last_battle_time, "
                 "UNIX_TIMESTAMP(u.updated_at) AS update_time, r.recent_class, "
@@ -154,14 +103,6 @@ class RecentUserModel:
                     }
                 }
             else:
-                await conn.commit()
                 return JSONResponse.API_1018_RecentNotEnabled
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
\ No newline at end of file
+
+            return JSONResponse.get_success_response(data)
\ No newline at end of file
@@ -1,7 +1,4 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.response import JSONResponse, ResponseDict
 
@@ -11,11 +8,7 @@ from .db_name import MAIN_DB
 class RecentsUserModel:
     @ExceptionLogger.handle_database_exception_async
     async def get_recents_user_by_rid(region_id: int) -> ResponseDict:
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = []
             await cur.execute(
                 f"SELECT account_id FROM {MAIN_DB}.recents WHERE region_id = %s;",
@@ -24,12 +17,5 @@ class RecentsUserModel:
             users = await cur.fetchall()
             for user in users:
                 data.append(user[0])
-            
-            await conn.commit()
-            return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
\ No newline at end of file
+
+            return JSONResponse.get_success_response(data)
\ No newline at end of file
@@ -1,7 +1,4 @@
-from aiomysql.connection import Connection
-from aiomysql.cursors import Cursor
-
-from app.db import MysqlConnection
+from app.db import DatabaseSession
 from app.log import ExceptionLogger
 from app.response import JSONResponse, ResponseDict
 
@@ -13,11 +10,7 @@ class RootModel:
     @ExceptionLogger.handle_database_exception_async
     async def get_innodb_trx() -> ResponseDict:
         '''检测数据库是否有未提交的事务'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = []
             await cur.execute(
                 "SELECT trx_id, trx_mysql_thread_id, trx_started, trx_state, trx_query "
@@ -33,46 +26,24 @@ class RootModel:
                     'state': row[3],
                     'query': row[4]
                 })
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def kill_trx(thread_id: str) -> ResponseDict:
         '''删除未提交事务的thread_id'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.transaction() as cur:
             await cur.execute(
                 "KILL %s;"
                 [thread_id]
             )
 
-            await conn.commit()
             return JSONResponse.API_1000_Success
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     @ExceptionLogger.handle_database_exception_async
     async def get_innodb_processlist() -> ResponseDict:
         '''获取数据库的连接数'''
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read() as cur:
             data = []
             await cur.execute(
                 "SELECT * FROM performance_schema.processlist;"
@@ -89,24 +60,13 @@ class RootModel:
                     'state': row[6],
                     'info': row[7]
                 })
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     
     @ExceptionLogger.handle_database_exception_async
     async def get_basic_user_overview():
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read(replica=True) as cur:
             data = {}
             await cur.execute(
                 "SELECT r.region_str, COALESCE(COUNT(u.region_id), 0) AS count "
@@ -118,24 +78,13 @@ class RootModel:
             users = await cur.fetchall()
             for user in users:
                 data[user[0]] = user[1]
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     
     @ExceptionLogger.handle_database_exception_async
     async def get_basic_clan_overview():
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read(replica=True) as cur:
             data = {}
             await cur.execute(
                 "SELECT r.region_str, COALESCE(COUNT(u.region_id), 0) AS count "
@@ -147,24 +96,13 @@ class RootModel:
             users = await cur.fetchall()
             for user in users:
                 data[user[0]] = user[1]
-            
-            await conn.commit()
+
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
     
     @ExceptionLogger.handle_database_exception_async
     async def get_recent_user_overview():
-        try:
-            conn: Connection = await MysqlConnection.get_connection()
-            await conn.begin()
-            cur: Cursor = await conn.cursor()
-
+        async with DatabaseSession.read(replica=True) as cur:
             data = {}
             await cur.execute(
                 "SELECT r.region_str, COALESCE(COUNT(u.region_id), 0) AS count "
@@ -177,12 +115,5 @@ class RootModel:
             for user in users:
                 data[user[0]] = user[1]
 
-            await conn.commit()
             return JSONResponse.get_success_response(data)
-        except Exception as e:
-            await conn.rollback()
-            raise e
-        finally:
-            await cur.close()
-            await MysqlConnection.release_connection(conn)
 
@@ -0,0 +1,419 @@
+import os
+import json
+import socket
+import asyncio
+from typing import Optional
+
+from redis.exceptions import ResponseError
+
+from app.db import DatabaseSession
+from app.core import EnvConfig, api_logger
+from app.log import ExceptionLogger
+from app.middlewares import RedisConnection
+from app.response import JSONResponse, ResponseDict
+
+from .provision import ProvisionModel
+from .profile_cache import ProfileCache
+from .db_name import MAIN_DB
+
+# 可以写入的表和字段，其他字段会被忽略
+BUFFER_FIELDS = {
+    'user_basic': ('nickname',),
+    'user_info': ('is_active', 'active_level', 'is_public', 'total_battles', 'last_battle_time'),
+    'user_recent': ('recent_class', 'last_update_time')
+}
+
+
+class UserWriteBuffer:
+    '''用户数据的写缓冲(write-behind)
+
+    更新程序上传的 user_basic/user_info/user_recent 数据先写入Redis Stream，接口直接返回，由后台任务批量写入数据库
+
+    每隔 WRITE_BUFFER_FLUSH_INTERVAL 秒或者缓冲的数据达到 WRITE_BUFFER_BATCH_SIZE 条时写入一次，同一个用户的多次更新会合并，每个字段以最后一次更新为准
+
+    同一个用户的数据可能被不同的worker读取，或者在重试时晚于新的数据写入，因此以Stream数据id中的时间作为数据的更新时间，写入时不会覆盖数据库中更新的数据
+
+    每张表每批数据只需要一次数据库往返，写入的吞吐量取决于批量大小而不是请求数量
+
+    数据通过消费者组读取，写入数据库成功后才会确认并删除，进程重启或者写入失败的数据在 WRITE_BUFFER_CLAIM_IDLE 秒后会被重新写入
+
+    重新投递的数据逐条写入，其中无法写入的数据不会影响同一批的其他数据，投递次数达到 WRITE_BUFFER_MAX_DELIVERIES 后仍然失败的数据移入死信Stream并记录日志
+
+    数据库中的数据最多会延迟一个写入间隔
+    '''
+    STREAM_KEY = 'app_db:write_buffer:user'
+    GROUP_NAME = 'user_writer'
+    DEAD_STREAM_KEY = 'app_db:write_buffer:user:dead'
+    DEAD_STREAM_MAXLEN = 10000
+    __consumer = f'{socket.gethostname()}:{os.getpid()}'
+    __group_ready = False
+    __pending = 0
+    __flush_task: Optional[asyncio.Task] = None
+    __flush_event: Optional[asyncio.Event] = None
+    __stats = {'pushed': 0, 'flushes': 0, 'flushed_entries': 0, 'flushed_users': 0, 'claimed': 0, 'failures': 0, 'dead_letters': 0}
+
+    @classmethod
+    @ExceptionLogger.handle_cache_exception_async
+    async def push(self, user_data: dict) -> ResponseDict:
+        '''写入一条用户数据的更新
+
+        参数：
+            user_data: {user_basic, user_info, user_recent}，每一项都包含account_id和region_id，值为None的字段不会更新
+
+        返回：
+            ResponseDict
+        '''
+        data = {}
+        for table, fields in BUFFER_FIELDS.items():
+            table_data = user_data.get(table)
+            if not table_data:
+                continue
+            data[table] = {'account_id': table_data['account_id'], 'region_id': table_data['region_id']}
+            for field in fields:
+                if table_data.get(field) is not None:
+                    data[table][field] = table_data[field]
+        if not data:
+            return JSONResponse.API_1000_Success
+        redis = RedisConnection.get_connection()
+        await redis.xadd(self.STREAM_KEY, {'data': json.dumps(data)})
+        self.__stats['pushed'] += 1
+        self.__pending += 1
+        config = EnvConfig.get_config()
+        if self.__pending >= config.WRITE_BUFFER_BATCH_SIZE and self.__flush_event:
+            self.__flush_event.set()
+        return JSONResponse.API_1000_Success
+
+    @classmethod
+    def start(self) -> None:
+        "启动写入数据库的后台任务"
+        if self.__flush_task is None or self.__flush_task.done():
+            self.__flush_event = asyncio.Event()
+            self.__flush_task = asyncio.create_task(self.__worker(self))
+
+    @classmethod
+    async def stop(self) -> None:
+        "停止后台任务并写入已经读取的数据，需要在关闭Redis和MySQL连接之前调用"
+        if self.__flush_task:
+            self.__flush_task.cancel()
+            # 等待正在执行的写入和确认结束
+            try:
+                await self.__flush_task
+            except asyncio.CancelledError:
+                pass
+            self.__flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            api_logger.warning(f'Failed to flush the user write buffer: {e}')
+
+    async def __worker(self) -> None:
+        config = EnvConfig.get_config()
+        while True:
+            try:
+                await asyncio.wait_for(self.__flush_event.wait(), timeout=config.WRITE_BUFFER_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.__flush_event.clear()
+            try:
+                # 积压的数据较多时连续写入
+                while await self.flush() >= config.WRITE_BUFFER_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                api_logger.warning(f'Failed to flush the user write buffer: {e}')
+
+    async def __ensure_group(self) -> None:
+        if self.__group_ready:
+            return
+        redis = RedisConnection.get_connection()
+        try:
+            await redis.xgroup_create(self.STREAM_KEY, self.GROUP_NAME, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self.__group_ready = True
+
+    async def __read_entries(self) -> list[tuple[str, dict, int]]:
+        '''读取一批数据，优先重新读取超时未确认的数据
+
+        返回：
+            [(entry_id, fields, 投递次数), ...]
+        '''
+        config = EnvConfig.get_config()
+        redis = RedisConnection.get_connection()
+        await self.__ensure_group(self)
+        _, entries, *_ = await redis.xautoclaim(
+            self.STREAM_KEY,
+            self.GROUP_NAME,
+            self.__consumer,
+            min_idle_time=int(config.WRITE_BUFFER_CLAIM_IDLE * 1000),
+            start_id='0-0',
+            count=config.WRITE_BUFFER_BATCH_SIZE
+        )
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        self.__stats['claimed'] += len(entries)
+        # 重新读取的数据从XPENDING中获取投递次数，新读取的数据投递次数为1
+        deliveries = {}
+        if entries:
+            async with redis.pipeline(transaction=False) as pipe:
+                for entry_id, _ in entries:
+                    pipe.xpending_range(self.STREAM_KEY, self.GROUP_NAME, min=entry_id, max=entry_id, count=1)
+                for pending in await pipe.execute():
+                    for item in pending:
+                        deliveries[item['message_id']] = item['times_delivered']
+        if len(entries) < config.WRITE_BUFFER_BATCH_SIZE:
+            result = await redis.xreadgroup(
+                self.GROUP_NAME,
+                self.__consumer,
+                {self.STREAM_KEY: '>'},
+                count=config.WRITE_BUFFER_BATCH_SIZE - len(entries)
+            )
+            for _, stream_entries in result:
+                entries.extend(stream_entries)
+        return [(entry_id, fields, deliveries.get(entry_id, 1)) for entry_id, fields in entries if fields]
+
+    @classmethod
+    async def flush(self) -> int:
+        '''将一批缓冲的数据写入数据库
+
+        重新投递的数据逐条写入，其他数据在一个事务中写入
+
+        返回：
+            本次写入和移入死信Stream的数据条数，写入失败的数据保留在Stream中等待重试
+        '''
+        entries = await self.__read_entries(self)
+        self.__pending = 0
+        if not entries:
+            return 0
+        written = 0
+        for entry in entries:
+            if entry[2] > 1:
+                written += await self.__write_entries(self, [entry])
+        new_entries = [entry for entry in entries if entry[2] <= 1]
+        if new_entries:
+            written += await self.__write_entries(self, new_entries)
+        return written
+
+    async def __write_entries(self, entries: list[tuple[str, dict, int]]) -> int:
+        "写入数据库并确认，单条数据投递次数达到上限后仍然失败时移入死信Stream"
+        try:
+            users = self.coalesce([(entry_id, json.loads(fields['data'])) for entry_id, fields, _ in entries])
+            result = await self.write_users(users)
+        except Exception as e:
+            # 数据格式错误，和写入失败一样处理
+            users = {}
+            result = {'code': 5000, 'message': f'{type(e).__name__}: {e}'}
+        redis = RedisConnection.get_connection()
+        entry_ids = [entry_id for entry_id, _, _ in entries]
+        if result.get('code', None) != 1000:
+            self.__stats['failures'] += 1
+            config = EnvConfig.get_config()
+            if len(entries) == 1 and entries[0][2] >= config.WRITE_BUFFER_MAX_DELIVERIES:
+                entry_id, fields, deliveries = entries[0]
+                await redis.xadd(
+                    self.DEAD_STREAM_KEY,
+                    {'id': entry_id, 'data': fields.get('data', ''), 'error': str(result.get('message'))},
+                    maxlen=self.DEAD_STREAM_MAXLEN,
+                    approximate=True
+                )
+                await redis.xack(self.STREAM_KEY, self.GROUP_NAME, entry_id)
+                await redis.xdel(self.STREAM_KEY, entry_id)
+                self.__stats['dead_letters'] += 1
+                api_logger.error(
+                    f"User write buffer entry {entry_id} moved to {self.DEAD_STREAM_KEY} after {deliveries} deliveries, "
+                    f"Error: {result.get('message')}"
+                )
+                return 1
+            api_logger.warning(f"Failed to write the user write buffer, Error: {result.get('message')}")
+            return 0
+        await redis.xack(self.STREAM_KEY, self.GROUP_NAME, *entry_ids)
+        await redis.xdel(self.STREAM_KEY, *entry_ids)
+        self.__stats['flushes'] += 1
+        self.__stats['flushed_entries'] += len(entries)
+        self.__stats['flushed_users'] += len(users)
+        return len(entries)
+
+    def get_entry_time(entry_id: str) -> int:
+        "Stream数据id中的写入时间(秒)"
+        return int(entry_id.split('-')[0]) // 1000
+
+    def coalesce(entries: list[tuple[str, dict]]) -> dict[tuple[int, int], dict]:
+        '''合并同一个用户的多次更新，每个字段以最后一次更新为准
+
+        参数：
+            entries: [(entry_id, data), ...]，按照entry_id排序后合并
+
+        返回：
+            {(region_id, account_id): {table: {field: value, update_time}}}
+
+            update_time为合并的数据中最新的写入时间
+        '''
+        users = {}
+        entries = sorted(entries, key=lambda entry: tuple(int(part) for part in entry[0].split('-')))
+        for entry_id, entry in entries:
+            entry_time = UserWriteBuffer.get_entry_time(entry_id)
+            for table, table_data in entry.items():
+                key = (table_data['region_id'], table_data['account_id'])
+                fields = users.setdefault(key, {}).setdefault(table, {})
+                for field in BUFFER_FIELDS.get(table, ()):
+                    value = table_data.get(field)
+                    # last_battle_time为0表示没有数据，不能覆盖之前的值
+                    if value is None or (field == 'last_battle_time' and value == 0):
+                        continue
+                    fields[field] = value
+                fields['update_time'] = entry_time
+        return users
+
+    @ExceptionLogger.handle_database_exception_async
+    async def write_users(users: dict[tuple[int, int], dict]) -> ResponseDict:
+        '''在一个事务中批量写入合并后的用户数据
+
+        user_basic: 不存在的用户会被插入，用户名称变更时记录到 user_history，数据库中的updated_at晚于数据的更新时间时不修改名称
+
+        user_info: 只更新传入的字段，last_battle_time为0时不更新，数据库中的updated_at晚于数据的更新时间时只更新last_battle_at
+
+        user_recent: 只更新已经启用recent功能的用户，数据库中的last_update_at晚于数据的更新时间时不修改recent_class
+
+        last_battle_at和last_update_at只会增大，不会被旧的数据覆盖
+
+        名称变更的用户在事务提交后删除 ProfileCache 中的缓存
+
+        参数：
+            users: coalesce 的返回值
+
+        返回：
+            ResponseDict
+        '''
+        basic_users = {
+            key[1]: (key[1], key[0], tables['user_basic']['nickname'], tables['user_basic']['update_time'])
+            for key, tables in users.items() if tables.get('user_basic', {}).get('nickname')
+        }
+        info_users = {key: tables['user_info'] for key, tables in users.items() if tables.get('user_info')}
+        recent_users = {key: tables['user_recent'] for key, tables in users.items() if tables.get('user_recent')}
+        renamed_rows = []
+        async with DatabaseSession.transaction() as cur:
+            if basic_users:
+                await ProvisionModel.ensure_users(cur, [user[:3] for user in basic_users.values()], updated=True)
+                history_rows = []
+                for batch in ProvisionModel.get_batches(list(basic_users)):
+                    await cur.execute(
+                        "SELECT account_id, username, UNIX_TIMESTAMP(updated_at) AS update_time "
+                        f"FROM {MAIN_DB}.user_basic WHERE account_id IN ({', '.join(['%s'] * len(batch))});",
+                        batch
+                    )
+                    for account_id, username, update_time in await cur.fetchall():
+                        account_id, region_id, nickname, entry_time = basic_users[account_id]
+                        if update_time is None:
+                            # 默认名称的用户直接写入真实名称
+                            renamed_rows.append((account_id, region_id, nickname, entry_time))
+                        elif update_time > entry_time:
+                            # 数据库中的名称比这条数据更新
+                            continue
+                        elif username != nickname:
+                            renamed_rows.append((account_id, region_id, nickname, entry_time))
+                            history_rows.append((account_id, username, update_time, entry_time))
+                for batch in ProvisionModel.get_batches(history_rows):
+                    await cur.execute(
+                        f"INSERT INTO {MAIN_DB}.user_history (account_id, username, start_time, end_time) VALUES "
+                        + ', '.join(['(%s, %s, FROM_UNIXTIME(%s), FROM_UNIXTIME(%s))'] * len(batch)) + ";",
+                        [value for row in batch for value in row]
+                    )
+                for batch in ProvisionModel.get_batches(renamed_rows):
+                    await cur.execute(
+                        f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username, updated_at) VALUES "
+                        + ', '.join(['(%s, %s, %s, FROM_UNIXTIME(%s))'] * len(batch)) + " "
+                        "ON DUPLICATE KEY UPDATE username = VALUES(username), updated_at = VALUES(updated_at);",
+                        [value for row in batch for value in row]
+                    )
+            if info_users:
+                # 数据库中不存在的用户不更新info数据
+                existing = set(basic_users)
+                missing = [key[1] for key in info_users if key[1] not in existing]
+                for batch in ProvisionModel.get_batches(missing):
+                    await cur.execute(
+                        f"SELECT account_id FROM {MAIN_DB}.user_basic "
+                        f"WHERE account_id IN ({', '.join(['%s'] * len(batch))});",
+                        batch
+                    )
+                    existing.update(row[0] for row in await cur.fetchall())
+                info_rows = []
+                for (region_id, account_id), info in info_users.items():
+                    if account_id not in existing:
+                        continue
+                    info_rows.append((
+                        account_id, info.get('is_active'), info.get('active_level'), info.get('is_public'),
+                        info.get('total_battles'), info.get('last_battle_time'), info['update_time']
+                    ))
+                for batch in ProvisionModel.get_batches(info_rows):
+                    # 确保user_info中存在对应的行，下面的INSERT只会更新传入的字段
+                    await cur.execute(
+                        f"INSERT IGNORE INTO {MAIN_DB}.user_info (account_id) VALUES "
+                        + ', '.join(['(%s)'] * len(batch)) + ";",
+                        [row[0] for row in batch]
+                    )
+                    # 赋值按顺序执行，updated_at需要放在最后，前面的判断使用的是原来的值
+                    newer = "(updated_at IS NULL OR updated_at <= VALUES(updated_at))"
+                    await cur.execute(
+                        f"INSERT INTO {MAIN_DB}.user_info "
+                        "(account_id, is_active, active_level, is_public, total_battles, last_battle_at, updated_at) VALUES "
+                        + ', '.join(['(%s, %s, %s, %s, %s, FROM_UNIXTIME(%s), FROM_UNIXTIME(%s))'] * len(batch)) + " "
+                        "ON DUPLICATE KEY UPDATE "
+                        f"is_active = IF({newer}, COALESCE(VALUES(is_active), is_active), is_active), "
+                        f"active_level = IF({newer}, COALESCE(VALUES(active_level), active_level), active_level), "
+                        f"is_public = IF({newer}, COALESCE(VALUES(is_public), is_public), is_public), "
+                        f"total_battles = IF({newer}, COALESCE(VALUES(total_battles), total_battles), total_battles), "
+                        "last_battle_at = GREATEST("
+                        "COALESCE(VALUES(last_battle_at), last_battle_at), COALESCE(last_battle_at, VALUES(last_battle_at))), "
+                        "updated_at = GREATEST(COALESCE(updated_at, VALUES(updated_at)), VALUES(updated_at));",
+                        [value for row in batch for value in row]
+                    )
+            if recent_users:
+                recent_rows = [
+                    (
+                        region_id, account_id, recent.get('recent_class'), recent.get('last_update_time'),
+                        recent['update_time']
+                    )
+                    for (region_id, account_id), recent in recent_users.items()
+                ]
+                for batch in ProvisionModel.get_batches(recent_rows):
+                    values = ' UNION ALL '.join(
+                        [
+                            'SELECT %s AS region_id, %s AS account_id, %s AS recent_class, '
+                            '%s AS last_update_time, %s AS update_time'
+                        ] * len(batch)
+                    )
+                    # recent的updated_at在查询时也会修改，通过last_update_at判断数据库中的数据是否更新，需要在修改last_update_at之前判断
+                    await cur.execute(
+                        f"UPDATE {MAIN_DB}.recent AS r JOIN ({values}) AS v "
+                        "ON r.region_id = v.region_id AND r.account_id = v.account_id "
+                        "SET r.recent_class = IF("
+                        "r.last_update_at IS NULL OR r.last_update_at <= FROM_UNIXTIME(v.update_time), "
+                        "COALESCE(v.recent_class, r.recent_class), r.recent_class), "
+                        "r.last_update_at = GREATEST("
+                        "COALESCE(FROM_UNIXTIME(v.last_update_time), r.last_update_at), "
+                        "COALESCE(r.last_update_at, FROM_UNIXTIME(v.last_update_time)));",
+                        [value for row in batch for value in row]
+                    )
+
+        renamed_users: dict[int, list[int]] = {}
+        for account_id, region_id, _, _ in renamed_rows:
+            renamed_users.setdefault(region_id, []).append(account_id)
+        for region_id, account_ids in renamed_users.items():
+            await ProfileCache.invalidate_users(region_id, account_ids)
+        return JSONResponse.API_1000_Success
+
+    @classmethod
+    async def get_stats(self) -> dict:
+        '''获取写缓冲的统计数据
+
+        返回：
+            {length, dead_length, pushed, flushes, flushed_entries, flushed_users, claimed, failures, dead_letters}
+        '''
+        data = {'length': None, 'dead_length': None}
+        try:
+            redis = RedisConnection.get_connection()
+            data['length'] = await redis.xlen(self.STREAM_KEY)
+            data['dead_length'] = await redis.xlen(self.DEAD_STREAM_KEY)
+        except Exception as e:
+            api_logger.warning(f'Failed to read the user write buffer length: {e}')
+        data.update(self.__stats)
+        return data
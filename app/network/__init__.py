@@ -1,9 +1,27 @@
 from .api_basic import BasicAPI
 from .api_details import DetailsAPI
 from .api_other import OtherAPI
+from .api_official import OfficialAPI
+from .api_client import HttpClientPool
+from .api_proxy import ProxyPool
+from .api_singleflight import SingleFlight
+from .api_limiter import UpstreamLimiter
+from .api_breaker import UpstreamBreaker
+from .api_hedge import UpstreamHedge
+from .api_cache import ResponseCache
+from .api_negative import NegativeCache
 
 __all__ = [
     'BasicAPI',
     'DetailsAPI',
-    'OtherAPI'
+    'OtherAPI',
+    'OfficialAPI',
+    'HttpClientPool',
+    'ProxyPool',
+    'SingleFlight',
+    'UpstreamLimiter',
+    'UpstreamBreaker',
+    'UpstreamHedge',
+    'ResponseCache',
+    'NegativeCache'
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
-import random
+from urllib.parse import urlsplit
 
+from .api_proxy import ProxyPool
 from app.core.config import EnvConfig
 
 VORTEX_API_URL_LIST = {
@@ -26,23 +27,20 @@ CLAN_API_URL_LIST = {
     5: 'https://clans.wowsgame.cn'
 }
 
-config = EnvConfig.get_config()
-
-proxy_config = {
-    '43.133.59.53:8080': [1,2,3,4,5]
+# 上游接口的分类，用于区分连接池、限流等按上游维度管理的资源
+UPSTREAM_URL_LIST = {
+    'vortex': VORTEX_API_URL_LIST,
+    'clans': CLAN_API_URL_LIST,
+    'official': OFFICIAL_API_URL_LIST
 }
 
-proxy_list = {
-    1: [],
-    2: [],
-    3: [],
-    4: [],
-    5: []
-}
+UPSTREAM_HOST_LIST = {}
+for upstream, url_list in UPSTREAM_URL_LIST.items():
+    for region_id, base_url in url_list.items():
+        if base_url:
+            UPSTREAM_HOST_LIST[urlsplit(base_url).hostname] = (upstream, region_id)
 
-for key, value in proxy_config.items():
-    for region in value:
-        proxy_list[region].append(key)
+config = EnvConfig.get_config()
 
 class BaseUrl:
     REQUEST_TIME_OUT = 5
@@ -52,7 +50,7 @@ class BaseUrl:
 
         根据代理配置和服务器返回对应的url
         
-        如果某个服务器下有多个可用代理则会随机选择一个返回
+        如果某个服务器下有多个可用代理则根据代理的延迟和错误率选择一个返回
 
         参数：
             region: 接口服务器
@@ -60,15 +58,10 @@ class BaseUrl:
         返回：
             url: str
         '''
-        # if config.USE_PROXY:
-        #     proxy_url_len = len(proxy_list.get(region_id))
-        #     if proxy_url_len >= 2:
-        #         random_num = random.randint(0,proxy_url_len-1)
-        #     else:
-        #         random_num = 0
-        #     proxy_url = f'http://{proxy_list.get(region_id)[random_num]}/proxy?url={VORTEX_API_URL_LIST.get(region_id)}'
-        #     return proxy_url
-        # else:
+        if config.USE_PROXY:
+            proxy = ProxyPool.select(region_id)
+            if proxy:
+                return f'http://{proxy}/proxy?url={VORTEX_API_URL_LIST.get(region_id)}'
         return VORTEX_API_URL_LIST.get(region_id)
         
     def get_official_base_url(region_id: int):
@@ -93,7 +86,7 @@ class BaseUrl:
 
         根据代理配置和服务器返回对应的url
         
-        如果某个服务器下有多个可用代理则会随机选择一个返回
+        如果某个服务器下有多个可用代理则根据代理的延迟和错误率选择一个返回
 
         参数：
             region: 接口服务器
@@ -101,14 +94,43 @@ class BaseUrl:
         返回：
             url: str
         '''
-        # if config.USE_PROXY:
-        #     proxy_url_len = len(proxy_list.get(region_id))
-        #     if proxy_url_len >= 2:
-        #         random_num = random.randint(0,proxy_url_len-1)
-        #     else:
-        #         random_num = 0
-        #     proxy_url = f'http://{proxy_list.get(region_id)[random_num]}/proxy?url={CLAN_API_URL_LIST.get(region_id)}'
-        #     return proxy_url
-        # else:
+        if config.USE_PROXY:
+            proxy = ProxyPool.select(region_id)
+            if proxy:
+                return f'http://{proxy}/proxy?url={CLAN_API_URL_LIST.get(region_id)}'
         return CLAN_API_URL_LIST.get(region_id)
-        
+
+    def get_target_url(url: str) -> str:
+        '''获取请求实际访问的上游url
+
+        通过代理请求时url格式为 http://{proxy}/proxy?url={上游url}，返回其中的上游url
+
+        参数：
+            url: 请求的完整url
+
+        返回：
+            url: str
+        '''
+        split_url = urlsplit(url)
+        if split_url.path == '/proxy' and split_url.query.startswith('url='):
+            return split_url.query[4:]
+        return url
+
+    def get_proxy(url: str) -> str | None:
+        "获取请求使用的代理，没有使用代理则返回None"
+        split_url = urlsplit(url)
+        if split_url.path == '/proxy' and split_url.query.startswith('url='):
+            return split_url.netloc
+        return None
+
+    def get_upstream(url: str) -> tuple[str, int]:
+        '''获取url对应的上游接口类型和服务器
+
+        参数：
+            url: 请求的完整url，通过代理的请求会使用实际访问的上游url
+
+        返回：
+            (upstream, region_id)，无法识别的url返回 ('other', 0)
+        '''
+        host = urlsplit(BaseUrl.get_target_url(url)).hostname
+        return UPSTREAM_HOST_LIST.get(host, ('other', 0))
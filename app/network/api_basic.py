@@ -1,8 +1,13 @@
 import asyncio
 
-import httpx
-
 from .api_base import BaseUrl
+from .api_breaker import UpstreamBreaker
+from .api_cache import ResponseCache
+from .api_negative import NegativeCache
+from .api_client import HttpClientPool
+from .api_hedge import UpstreamHedge
+from .api_limiter import UpstreamLimiter
+from .api_singleflight import SingleFlight
 from app.log import ExceptionLogger
 from app.response import JSONResponse
 
@@ -17,48 +22,58 @@ class BasicAPI:
     3. 获取搜索用户的结果
     4. 获取搜索工会的结果
     '''
+    @NegativeCache.cached('basic')
+    @ResponseCache.cached('basic')
+    @SingleFlight.coalesce('basic')
     @ExceptionLogger.handle_network_exception_async
     async def fetch_data(url, method: str = 'get', data: dict | list = None):
         try:
-            async with httpx.AsyncClient() as client:
+            if method not in ['get', 'post']:
+                raise ValueError('Invalid Method')
+            call = UpstreamBreaker.acquire(url)
+            if call is None:
+                # 熔断器打开，直接返回不再等待上游超时
+                return JSONResponse.API_2000_NetworkError
+            client = HttpClientPool.get_client(url)
+            async with call, UpstreamLimiter.limit(url) as slot:
                 if method == 'get':
-                    res = await client.get(url=url, timeout=BaseUrl.REQUEST_TIME_OUT)
-                elif method == 'post': 
-                    res = await client.post(url=url, json=data, timeout=BaseUrl.REQUEST_TIME_OUT)
+                    res = await UpstreamHedge.get(client, url)
                 else:
-                    raise ValueError('Invalid Method')
-                requset_code = res.status_code
-                requset_result = res.json()
-                if '/clans.' in url:
-                    if '/api/clanbase/' in url and requset_code == 200:
-                        # 用户基础信息接口的返回值
-                        data = requset_result['clanview']
-                        return JSONResponse.get_success_response(data)
-                    if '/api/clanbase/' in url and requset_code == 503:
-                        return JSONResponse.API_1002_ClanNotExist
-                elif (
-                    '/clans/' in url
-                    and requset_code == 404
-                ):
-                    # 用户所在工会接口，如果用户没有在工会会返回404
-                    data = {
-                        "clan_id": None,
-                        "role": None, 
-                        "joined_at": None, 
-                        "clan": {},
-                    }
-                    return JSONResponse.get_success_response(data)
-                elif requset_code == 404:
-                    # 用户不存在或者账号删除的情况
-                    return JSONResponse.API_1001_UserNotExist
-                elif method == 'post' and requset_code == 200:
-                    return JSONResponse.get_success_response(requset_result)
-                elif requset_code == 200:
-                    # 正常返回值的处理
-                    data = requset_result['data']
+                    res = await client.post(url=url, json=data, timeout=BaseUrl.REQUEST_TIME_OUT)
+                call.record(res.status_code)
+                slot.record(res.status_code)
+            requset_code = res.status_code
+            requset_result = res.json()
+            if '/clans.' in url:
+                if '/api/clanbase/' in url and requset_code == 200:
+                    # 用户基础信息接口的返回值
+                    data = requset_result['clanview']
                     return JSONResponse.get_success_response(data)
-                else:
-                    res.raise_for_status()  # 其他状态码
+                if '/api/clanbase/' in url and requset_code == 503:
+                    return JSONResponse.API_1002_ClanNotExist
+            elif (
+                '/clans/' in url
+                and requset_code == 404
+            ):
+                # 用户所在工会接口，如果用户没有在工会会返回404
+                data = {
+                    "clan_id": None,
+                    "role": None, 
+                    "joined_at": None, 
+                    "clan": {},
+                }
+                return JSONResponse.get_success_response(data)
+            elif requset_code == 404:
+                # 用户不存在或者账号删除的情况
+                return JSONResponse.API_1001_UserNotExist
+            elif method == 'post' and requset_code == 200:
+                return JSONResponse.get_success_response(requset_result)
+            elif requset_code == 200:
+                # 正常返回值的处理
+                data = requset_result['data']
+                return JSONResponse.get_success_response(data)
+            else:
+                res.raise_for_status()  # 其他状态码
         except Exception as e:
             raise e
         
@@ -103,12 +118,10 @@ class BasicAPI:
             f'{api_url}/api/accounts/{account_id}/' + (f'?ac={ac_value}' if ac_value else '')
         ]
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
-            return responses
+        for url in urls:
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
+        return responses
         
     @classmethod
     async def get_user_basic_and_clan(
@@ -134,12 +147,10 @@ class BasicAPI:
             f'{api_url}/api/accounts/{account_id}/clans/'
         ]
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
-            return responses
+        for url in urls:
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
+        return responses
         
 
     @classmethod
@@ -162,9 +173,7 @@ class BasicAPI:
             f'{api_url}/api/clanbase/{clan_id}/claninfo/'
         ]
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
-            return responses
+        for url in urls:
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
+        return responses
@@ -0,0 +1,204 @@
+import time
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from .api_base import BaseUrl
+from app.core import EnvConfig, api_logger
+
+
+class BreakerState:
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+
+class CircuitBreaker:
+    '''单个上游的熔断器
+
+    closed: 正常请求，统计最近请求的失败率，超过阈值后进入open
+
+    open: 直接拒绝请求，等待一段时间后进入half_open
+
+    half_open: 只放行少量探测请求，探测全部成功则进入closed，任意失败则重新进入open
+    '''
+    def __init__(
+        self,
+        name: str,
+        window_size: int,
+        min_requests: int,
+        failure_rate: float,
+        open_seconds: float,
+        half_open_probes: int
+    ):
+        self.name = name
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = BreakerState.closed
+        # 最近请求的结果，True表示失败
+        self.outcomes: deque[bool] = deque(maxlen=window_size)
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        "判断当前是否允许请求上游"
+        if self.state == BreakerState.open:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.__transition(BreakerState.half_open)
+        if self.state == BreakerState.half_open:
+            if self.probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes += 1
+        return True
+
+    def record(self, failure: bool | None, probe: bool) -> None:
+        '''记录一次请求的结果
+
+        参数：
+            failure: True表示失败，False表示成功，None表示不计入统计
+            probe: 是否为half_open状态下放行的探测请求
+        '''
+        if probe:
+            self.probes = max(0, self.probes - 1)
+            if self.state != BreakerState.half_open:
+                return
+            if failure is True:
+                self.__transition(BreakerState.open)
+            elif failure is False:
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_probes:
+                    self.__transition(BreakerState.closed)
+            return
+        if failure is None or self.state != BreakerState.closed:
+            return
+        self.outcomes.append(failure)
+        if (
+            len(self.outcomes) >= self.min_requests
+            and self.get_failure_rate() >= self.failure_rate
+        ):
+            self.__transition(BreakerState.open)
+
+    def get_failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def __transition(self, state: str) -> None:
+        "切换熔断器状态"
+        if state == self.state:
+            return
+        api_logger.warning(f'Circuit breaker {self.name}: {self.state} -> {state}')
+        self.state = state
+        self.probes = 0
+        self.probe_successes = 0
+        if state == BreakerState.open:
+            self.opened_at = time.monotonic()
+        elif state == BreakerState.closed:
+            self.outcomes.clear()
+
+    def get_stats(self) -> dict:
+        data = {
+            'state': self.state,
+            'failure_rate': round(self.get_failure_rate(), 4),
+            'requests': len(self.outcomes),
+            'rejected': self.rejected
+        }
+        if self.state == BreakerState.open:
+            data['retry_after'] = round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 2)
+        return data
+
+
+class BreakerCall:
+    '''一次通过熔断器的上游请求
+
+    使用 async with 进入，退出时根据请求结果更新熔断器
+    '''
+    def __init__(self, breaker: CircuitBreaker, url: str, probe: bool):
+        self.breaker = breaker
+        self.url = url
+        self.probe = probe
+        self.failure = None
+
+    def record(self, status_code: int) -> None:
+        "记录请求的状态码"
+        if status_code == 503 and '/api/clanbase/' in self.url:
+            # clanbase接口使用503表示工会不存在
+            self.failure = False
+        elif status_code == 429:
+            # 限流由并发限制处理，不计入熔断统计
+            self.failure = None
+        else:
+            self.failure = status_code >= 500
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if (
+            exc_type is not None
+            and issubclass(exc_type, httpx.TransportError)
+            and not issubclass(exc_type, httpx.PoolTimeout)
+        ):
+            # 连接和读取失败计入熔断统计，本地排队超时(PoolTimeout)不计入
+            self.failure = True
+        self.breaker.record(self.failure, self.probe)
+        return False
+
+
+class UpstreamBreaker:
+    '''管理各个上游接口的熔断器
+
+    按照 上游接口类型(vortex/clans/official) + 服务器 分别维护熔断器，
+    避免单个服务器的接口故障拖慢其他服务器的请求
+    '''
+    _breakers: dict[tuple[str, int], CircuitBreaker] = {}
+
+    @classmethod
+    def _get_breaker(cls, key: tuple[str, int]) -> CircuitBreaker:
+        if key not in cls._breakers:
+            config = EnvConfig.get_config()
+            cls._breakers[key] = CircuitBreaker(
+                name=f'{key[0]}:{key[1]}',
+                window_size=config.BREAKER_WINDOW_SIZE,
+                min_requests=config.BREAKER_MIN_REQUESTS,
+                failure_rate=config.BREAKER_FAILURE_RATE,
+                open_seconds=config.BREAKER_OPEN_SECONDS,
+                half_open_probes=config.BREAKER_HALF_OPEN_PROBES
+            )
+        return cls._breakers[key]
+
+    @classmethod
+    def acquire(cls, url: str) -> Optional[BreakerCall]:
+        '''检查url对应上游的熔断器
+
+        参数：
+            url: 请求的完整url
+
+        返回：
+            熔断器打开时返回None，否则返回BreakerCall，需要使用 async with
+        '''
+        breaker = cls._get_breaker(BaseUrl.get_upstream(url))
+        probe = breaker.state != BreakerState.closed
+        if not breaker.allow_request():
+            return None
+        return BreakerCall(breaker, url, probe)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取熔断器的状态
+
+        返回：
+            {upstream: {region_id: {state, failure_rate, ...}}}
+        '''
+        data = {}
+        for (upstream, region_id), breaker in cls._breakers.items():
+            data.setdefault(upstream, {})[region_id] = breaker.get_stats()
+        return data
@@ -0,0 +1,189 @@
+import re
+import json
+import time
+import zlib
+import base64
+import asyncio
+import hashlib
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from .api_base import BaseUrl
+from app.core import EnvConfig, api_logger
+from app.middlewares import RedisConnection
+
+# 可以缓存的接口分类，按顺序匹配url的path
+CACHE_ENDPOINT_LIST = [
+    ('account_clan', re.compile(r'^/api/accounts/\d+/clans/$')),
+    ('account_ships', re.compile(r'^/api/accounts/\d+/ships/[a-z_0-9]+/$')),
+    ('account', re.compile(r'^/api/accounts/\d+/$')),
+    ('clan', re.compile(r'^/api/clanbase/\d+/claninfo/$')),
+    ('encyclopedia', re.compile(r'^/api/encyclopedia/')),
+]
+
+
+class ResponseCache:
+    '''上游接口的响应缓存
+
+    缓存保存在Redis中，所有worker共享，按照接口分类设置不同的缓存时间
+
+    缓存过期后的一段时间内(stale)仍然返回旧数据，同时由一个worker在后台刷新缓存
+
+    缓存的key中去掉了ac参数，只保留是否使用了ac(scope)，避免token写入Redis
+    '''
+    KEY_PREFIX = 'app_network:response_cache'
+    LOCK_PREFIX = 'app_network:response_cache_lock'
+    # 后台刷新锁的过期时间
+    LOCK_TTL = 10
+    _stats: dict[str, dict[str, int]] = {}
+    _refresh_tasks: set[asyncio.Task] = set()
+
+    def get_endpoint_ttl(url: str) -> tuple[str, int]:
+        '''获取url对应的接口分类和缓存时间
+
+        返回：
+            (endpoint, ttl)，不缓存的接口ttl为0
+        '''
+        config = EnvConfig.get_config()
+        ttl_list = {
+            'account': config.RESPONSE_CACHE_TTL_ACCOUNT,
+            'account_clan': config.RESPONSE_CACHE_TTL_ACCOUNT_CLAN,
+            'account_ships': config.RESPONSE_CACHE_TTL_ACCOUNT_SHIPS,
+            'clan': config.RESPONSE_CACHE_TTL_CLAN,
+            'encyclopedia': config.RESPONSE_CACHE_TTL_ENCYCLOPEDIA
+        }
+        path = urlsplit(BaseUrl.get_target_url(url)).path
+        for endpoint, pattern in CACHE_ENDPOINT_LIST:
+            if pattern.match(path):
+                return endpoint, ttl_list[endpoint]
+        return None, 0
+
+    def get_cache_key(url: str) -> str:
+        '''生成url对应的缓存key
+
+        去掉ac参数，并记录请求的scope(public/ac)
+        '''
+        split_url = urlsplit(BaseUrl.get_target_url(url))
+        query = parse_qsl(split_url.query, keep_blank_values=True)
+        scope = 'ac' if any(name == 'ac' for name, _ in query) else 'public'
+        query = sorted((name, value) for name, value in query if name != 'ac')
+        cache_url = f'{split_url.netloc}{split_url.path}?{urlencode(query)}'
+        url_hash = hashlib.sha1(cache_url.encode('utf-8')).hexdigest()
+        return f'{scope}:{url_hash}'
+
+    def encode(response: dict) -> str:
+        "压缩返回值，Redis连接使用decode_responses，所以需要转为base64字符串"
+        value = json.dumps({'t': time.time(), 'd': response}, ensure_ascii=False, separators=(',', ':'))
+        return base64.b64encode(zlib.compress(value.encode('utf-8'))).decode('ascii')
+
+    def decode(value: str) -> tuple[float, dict]:
+        "解压缓存的数据，返回 (缓存时间, 返回值)"
+        data = json.loads(zlib.decompress(base64.b64decode(value)))
+        return data['t'], data['d']
+
+    @classmethod
+    def cached(cls, namespace: str):
+        '''响应缓存的装饰器
+
+        只缓存get请求中code为1000的返回值，被装饰函数的参数为 (url, method, data)
+
+        参数：
+            namespace: 区分不同接口类的命名空间
+        '''
+        def decorator(func):
+            async def wrapper(url: str, method: str = 'get', data: dict | list = None):
+                if method != 'get':
+                    return await func(url, method, data)
+                config = EnvConfig.get_config()
+                endpoint, ttl = cls.get_endpoint_ttl(url)
+                if not config.RESPONSE_CACHE_ENABLED or ttl <= 0:
+                    return await func(url)
+                stats = cls._stats.setdefault(
+                    f'{namespace}:{endpoint}',
+                    {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+                )
+                key = f'{cls.KEY_PREFIX}:{endpoint}:{cls.get_cache_key(url)}'
+                cache = await cls.__get(key, stats)
+                if cache is not None:
+                    cached_at, response = cache
+                    age = time.time() - cached_at
+                    if age < ttl:
+                        stats['hits'] += 1
+                        return response
+                    stats['stale_hits'] += 1
+                    await cls.__refresh_in_background(func, url, key, ttl, stats)
+                    return response
+                stats['misses'] += 1
+                response = await func(url)
+                await cls.__set(key, response, ttl, stats)
+                return response
+            return wrapper
+        return decorator
+
+    @classmethod
+    async def __get(cls, key: str, stats: dict) -> tuple[float, dict] | None:
+        try:
+            redis = RedisConnection.get_connection()
+            value = await redis.get(key)
+            if value is None:
+                return None
+            return cls.decode(value)
+        except Exception as e:
+            # 缓存不可用时直接请求上游
+            stats['errors'] += 1
+            api_logger.warning(f'Failed to read the response cache: {e}')
+            return None
+
+    @classmethod
+    async def __set(cls, key: str, response: dict, ttl: int, stats: dict) -> None:
+        if response is None or response.get('code') != 1000:
+            return
+        try:
+            config = EnvConfig.get_config()
+            redis = RedisConnection.get_connection()
+            await redis.set(key, cls.encode(response), ex=ttl + config.RESPONSE_CACHE_STALE_TTL)
+        except Exception as e:
+            stats['errors'] += 1
+            api_logger.warning(f'Failed to write the response cache: {e}')
+
+    @classmethod
+    async def __refresh_in_background(cls, func, url: str, key: str, ttl: int, stats: dict) -> None:
+        "缓存过期时由一个worker在后台刷新缓存"
+        try:
+            redis = RedisConnection.get_connection()
+            lock_key = key.replace(cls.KEY_PREFIX, cls.LOCK_PREFIX, 1)
+            if not await redis.set(lock_key, 1, ex=cls.LOCK_TTL, nx=True):
+                return
+        except Exception as e:
+            stats['errors'] += 1
+            api_logger.warning(f'Failed to lock the response cache: {e}')
+            return
+
+        async def refresh():
+            try:
+                stats['refreshes'] += 1
+                response = await func(url)
+                await cls.__set(key, response, ttl, stats)
+            finally:
+                try:
+                    await redis.delete(lock_key)
+                except Exception:
+                    pass
+
+        task = asyncio.ensure_future(refresh())
+        cls._refresh_tasks.add(task)
+        task.add_done_callback(cls._refresh_tasks.discard)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取响应缓存的统计数据
+
+        返回：
+            {namespace:endpoint: {hits, stale_hits, misses, refreshes, errors, hit_rate}}
+        '''
+        data = {}
+        for name, stats in cls._stats.items():
+            total = stats['hits'] + stats['stale_hits'] + stats['misses']
+            name_data = dict(stats)
+            name_data['hit_rate'] = round((stats['hits'] + stats['stale_hits']) / total, 4) if total else 0
+            data[name] = name_data
+        return data
@@ -0,0 +1,156 @@
+import time
+from typing import Optional
+
+import httpx
+
+from .api_base import BaseUrl, UPSTREAM_URL_LIST
+from .api_proxy import ProxyPool
+from app.core import EnvConfig, api_logger
+
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+
+class ProxyTransport(httpx.AsyncBaseTransport):
+    '''记录代理请求结果的transport
+
+    通过代理的请求会把耗时和结果反馈给ProxyPool，用于代理的选择和剔除
+    '''
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        proxy = BaseUrl.get_proxy(url)
+        _, region_id = BaseUrl.get_upstream(url)
+        if proxy is None or not ProxyPool.is_proxy(proxy, region_id):
+            return await self.transport.handle_async_request(request)
+        ProxyPool.start_request(proxy, region_id)
+        start_time = time.monotonic()
+        success = None
+        try:
+            response = await self.transport.handle_async_request(request)
+            if response.status_code == 503 and '/api/clanbase/' in url:
+                # clanbase接口使用503表示工会不存在
+                success = True
+            else:
+                success = not (response.status_code == 429 or response.status_code >= 500)
+            return response
+        except httpx.TransportError:
+            success = False
+            raise
+        finally:
+            ProxyPool.finish_request(proxy, region_id, time.monotonic() - start_time, success)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class HttpClientPool:
+    '''管理上游接口的长连接客户端
+
+    按照 上游接口类型(vortex/clans/official) + 服务器 维护长连接的httpx客户端，
+    避免每次请求都重新建立TCP+TLS连接
+
+    客户端在 lifespan 中初始化和关闭
+    '''
+    _clients: dict[tuple[str, int], httpx.AsyncClient] = {}
+    _request_count: dict[tuple[str, int], int] = {}
+
+    @classmethod
+    def _init_client(cls, key: tuple[str, int]) -> httpx.AsyncClient:
+        "初始化指定上游的客户端"
+        if key not in cls._clients:
+            config = EnvConfig.get_config()
+            http2 = config.HTTP2_ENABLED
+            if http2 and not H2_AVAILABLE:
+                api_logger.warning('HTTP/2 is enabled but the h2 package is not installed, fall back to HTTP/1.1')
+                http2 = False
+            cls._request_count.setdefault(key, 0)
+
+            async def count_request(request: httpx.Request) -> None:
+                cls._request_count[key] += 1
+
+            transport = httpx.AsyncHTTPTransport(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+            cls._clients[key] = httpx.AsyncClient(
+                transport=ProxyTransport(transport),
+                timeout=BaseUrl.REQUEST_TIME_OUT,
+                headers={'Accept-Encoding': 'gzip, deflate, br'},
+                event_hooks={'request': [count_request]}
+            )
+        return cls._clients[key]
+
+    @classmethod
+    def init_clients(cls) -> None:
+        "初始化所有上游接口的客户端"
+        try:
+            for upstream, url_list in UPSTREAM_URL_LIST.items():
+                for region_id, base_url in url_list.items():
+                    if base_url:
+                        cls._init_client((upstream, region_id))
+            api_logger.info(f'HTTP client pool initialization is complete, {len(cls._clients)} clients')
+        except Exception as e:
+            api_logger.error('Failed to initialize the HTTP client pool')
+            api_logger.error(e)
+
+    @classmethod
+    def get_client(cls, url: str) -> httpx.AsyncClient:
+        '''获取url对应上游的客户端
+
+        参数：
+            url: 请求的完整url
+
+        返回：
+            httpx.AsyncClient
+        '''
+        return cls._init_client(BaseUrl.get_upstream(url))
+
+    @classmethod
+    async def close_clients(cls) -> None:
+        "关闭所有上游接口的客户端"
+        try:
+            for client in cls._clients.values():
+                await client.aclose()
+            cls._clients.clear()
+            api_logger.info('The HTTP client pool is closed')
+        except Exception as e:
+            api_logger.error('Failed to close the HTTP client pool')
+            api_logger.error(e)
+
+    @classmethod
+    def get_pool_stats(cls) -> dict:
+        '''获取连接池的使用情况
+
+        返回：
+            {upstream: {region_id: {...}}}
+        '''
+        data = {}
+        for (upstream, region_id), client in cls._clients.items():
+            connections = cls.__get_connections(client)
+            idle = 0
+            for connection in connections:
+                if connection.is_idle():
+                    idle += 1
+            data.setdefault(upstream, {})[region_id] = {
+                'requests': cls._request_count.get((upstream, region_id), 0),
+                'connections': len(connections),
+                'active': len(connections) - idle,
+                'idle': idle
+            }
+        return data
+
+    def __get_connections(client: httpx.AsyncClient) -> list:
+        "读取httpcore连接池中的连接列表"
+        transport: Optional[ProxyTransport] = getattr(client, '_transport', None)
+        pool = getattr(getattr(transport, 'transport', None), '_pool', None)
+        return list(getattr(pool, 'connections', []))
@@ -1,8 +1,13 @@
 import asyncio
 
-import httpx
-
 from .api_base import BaseUrl
+from .api_breaker import UpstreamBreaker
+from .api_cache import ResponseCache
+from .api_negative import NegativeCache
+from .api_client import HttpClientPool
+from .api_hedge import UpstreamHedge
+from .api_limiter import UpstreamLimiter
+from .api_singleflight import SingleFlight
 from app.log import ExceptionLogger
 from app.response import JSONResponse
 
@@ -10,19 +15,29 @@ from app.response import JSONResponse
 class DetailsAPI:
     '''其他接口
     '''
+    @NegativeCache.cached('details')
+    @ResponseCache.cached('details')
+    @SingleFlight.coalesce('details')
     @ExceptionLogger.handle_network_exception_async
     async def fetch_data(url):
         try:
-            async with httpx.AsyncClient() as client:
-                res = await client.get(url=url, timeout=BaseUrl.REQUEST_TIME_OUT)
-                requset_code = res.status_code
-                requset_result = res.json()
-                if requset_code == 200:
-                    # 正常返回值的处理
-                    data = requset_result['data']
-                    return JSONResponse.get_success_response(data)
-                else:
-                    res.raise_for_status()  # 其他状态码
+            call = UpstreamBreaker.acquire(url)
+            if call is None:
+                # 熔断器打开，直接返回不再等待上游超时
+                return JSONResponse.API_2000_NetworkError
+            client = HttpClientPool.get_client(url)
+            async with call, UpstreamLimiter.limit(url) as slot:
+                res = await UpstreamHedge.get(client, url)
+                call.record(res.status_code)
+                slot.record(res.status_code)
+            requset_code = res.status_code
+            requset_result = res.json()
+            if requset_code == 200:
+                # 正常返回值的处理
+                data = requset_result['data']
+                return JSONResponse.get_success_response(data)
+            else:
+                res.raise_for_status()  # 其他状态码
         except Exception as e:
             raise e
 
@@ -64,9 +79,7 @@ class DetailsAPI:
             else:
                 raise ValueError('The entered `match_type` parameter is invalid')
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
-            return responses
\ No newline at end of file
+        for url in urls:
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
+        return responses
\ No newline at end of file
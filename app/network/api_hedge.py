@@ -0,0 +1,148 @@
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+from .api_base import BaseUrl
+from .api_proxy import ProxyPool
+from app.core import EnvConfig
+
+
+class HedgeState:
+    '''单个上游的对冲请求状态
+
+    记录最近请求的延迟用于计算触发对冲的时间，并使用预算限制额外请求的比例
+    '''
+    def __init__(self, sample_size: int, max_budget: float):
+        self.latencies: deque[float] = deque(maxlen=sample_size)
+        self.max_budget = max_budget
+        self.budget = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def get_delay(self, percentile: float, min_samples: int, min_delay: float) -> float | None:
+        "获取触发对冲请求的等待时间，样本不足时返回None"
+        if len(self.latencies) < min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile))
+        return max(min_delay, latencies[index])
+
+    def get_stats(self) -> dict:
+        config = EnvConfig.get_config()
+        delay = self.get_delay(config.HEDGE_PERCENTILE, config.HEDGE_MIN_SAMPLES, config.HEDGE_MIN_DELAY)
+        return {
+            'requests': self.requests,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'hedge_ratio': round(self.hedged / self.requests, 4) if self.requests else 0,
+            'win_rate': round(self.hedge_wins / self.hedged, 4) if self.hedged else 0,
+            'budget_exhausted': self.budget_exhausted,
+            'delay': round(delay, 4) if delay is not None else None
+        }
+
+
+class UpstreamHedge:
+    '''对冲请求
+
+    请求在最近延迟的指定分位数(HEDGE_PERCENTILE)时间内没有返回时，通过另一个代理或者连接再发送一次相同的请求，
+
+    使用先返回的结果并取消另一个请求，每个请求会增加 HEDGE_BUDGET_RATIO 的预算，对冲请求消耗1，额外请求的比例不会超过预算
+
+    只用于get请求
+    '''
+    _states: dict[tuple[str, int], HedgeState] = {}
+
+    @classmethod
+    def _get_state(cls, key: tuple[str, int]) -> HedgeState:
+        if key not in cls._states:
+            config = EnvConfig.get_config()
+            cls._states[key] = HedgeState(config.HEDGE_SAMPLE_SIZE, config.HEDGE_MAX_BUDGET)
+        return cls._states[key]
+
+    def get_hedge_url(url: str) -> str:
+        "获取对冲请求的url，使用代理时换用另一个代理，否则使用同一个url(连接池会使用另一个连接)"
+        proxy = BaseUrl.get_proxy(url)
+        if proxy is None:
+            return url
+        _, region_id = BaseUrl.get_upstream(url)
+        hedge_proxy = ProxyPool.select(region_id, exclude=proxy)
+        if hedge_proxy is None:
+            return url
+        return url.replace(f'//{proxy}/', f'//{hedge_proxy}/', 1)
+
+    @classmethod
+    async def get(cls, client: httpx.AsyncClient, url: str) -> httpx.Response:
+        '''发送get请求，慢请求会触发对冲请求
+
+        参数：
+            client: 上游接口的客户端
+            url: 请求的完整url
+
+        返回：
+            httpx.Response
+        '''
+        config = EnvConfig.get_config()
+        state = cls._get_state(BaseUrl.get_upstream(url))
+        state.requests += 1
+        state.budget = min(state.max_budget, state.budget + config.HEDGE_BUDGET_RATIO)
+
+        async def send(request_url: str) -> tuple[float, httpx.Response]:
+            start_time = time.monotonic()
+            res = await client.get(url=request_url, timeout=BaseUrl.REQUEST_TIME_OUT)
+            return time.monotonic() - start_time, res
+
+        delay = None
+        if config.HEDGE_ENABLED:
+            delay = state.get_delay(config.HEDGE_PERCENTILE, config.HEDGE_MIN_SAMPLES, config.HEDGE_MIN_DELAY)
+        if delay is None:
+            latency, res = await send(url)
+            state.latencies.append(latency)
+            return res
+        primary = asyncio.ensure_future(send(url))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if state.budget >= 1:
+                    state.budget -= 1
+                    state.hedged += 1
+                    tasks.append(asyncio.ensure_future(send(cls.get_hedge_url(url))))
+                else:
+                    state.budget_exhausted += 1
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    latency, res = task.result()
+                    if task is primary:
+                        state.latencies.append(latency)
+                    else:
+                        state.hedge_wins += 1
+                        # 主请求的实际延迟至少为对冲等待时间加上对冲请求的延迟
+                        state.latencies.append(delay + latency)
+                    return res
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取对冲请求的统计数据
+
+        返回：
+            {upstream: {region_id: {requests, hedged, hedge_wins, ...}}}
+        '''
+        data = {}
+        for (upstream, region_id), state in cls._states.items():
+            data.setdefault(upstream, {})[region_id] = state.get_stats()
+        return data
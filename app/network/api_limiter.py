@@ -0,0 +1,166 @@
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+from .api_base import BaseUrl
+from app.core import EnvConfig
+
+
+class AdaptiveLimiter:
+    '''基于AIMD的自适应并发限制
+
+    请求成功时并发窗口加性增长，遇到限流(429)、服务端错误(5xx)或超时时乘性减小
+
+    超过窗口的请求进入队列等待，等待超过截止时间则抛出 httpx.PoolTimeout
+    '''
+    # 两次乘性减小之间的最小间隔，避免同一批失败请求把窗口压到最小值
+    DECREASE_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        min_window: int,
+        max_window: int,
+        initial_window: int,
+        decrease_factor: float = 0.5
+    ):
+        self.min_window = min_window
+        self.max_window = max_window
+        self.window = float(initial_window)
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.last_decrease = 0.0
+        self.throttled = 0
+        self.queue_timeouts = 0
+
+    async def acquire(self, timeout: float) -> None:
+        "获取一个并发名额，超过截止时间抛出 httpx.PoolTimeout"
+        if self.in_flight < int(self.window) and not self.waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise httpx.PoolTimeout('Timed out waiting for the upstream concurrency limiter')
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到名额但调用方被取消，归还名额
+                self.release(None)
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def release(self, success: bool | None) -> None:
+        '''释放并发名额并调整窗口
+
+        参数：
+            success: True表示成功，False表示被限流，None表示不影响窗口
+        '''
+        self.in_flight -= 1
+        if success is True:
+            self.window = min(self.max_window, self.window + 1 / self.window)
+        elif success is False:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= self.DECREASE_INTERVAL:
+                self.window = max(self.min_window, self.window * self.decrease_factor)
+                self.last_decrease = now
+        self.__wake_up()
+
+    def __wake_up(self) -> None:
+        "窗口有空余时唤醒等待中的请求"
+        while self.waiters and self.in_flight < int(self.window):
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def get_stats(self) -> dict:
+        return {
+            'window': round(self.window, 2),
+            'in_flight': self.in_flight,
+            'queue': len(self.waiters),
+            'throttled': self.throttled,
+            'queue_timeouts': self.queue_timeouts
+        }
+
+
+class LimiterSlot:
+    '''一次上游请求占用的并发名额
+
+    使用 async with 进入，退出时根据请求结果调整窗口
+    '''
+    def __init__(self, limiter: AdaptiveLimiter, url: str):
+        self.limiter = limiter
+        self.url = url
+        self.success = None
+
+    def record(self, status_code: int) -> None:
+        "记录请求的状态码"
+        if status_code == 503 and '/api/clanbase/' in self.url:
+            # clanbase接口使用503表示工会不存在
+            self.success = True
+        elif status_code == 429 or status_code >= 500:
+            self.success = False
+        else:
+            self.success = True
+
+    async def __aenter__(self):
+        config = EnvConfig.get_config()
+        await self.limiter.acquire(config.UPSTREAM_QUEUE_TIMEOUT)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, httpx.TimeoutException):
+            self.success = False
+        self.limiter.release(self.success)
+        return False
+
+
+class UpstreamLimiter:
+    '''管理各个上游接口的并发限制
+
+    按照 上游接口类型(vortex/clans/official) + 服务器 分别维护并发窗口
+    '''
+    _limiters: dict[tuple[str, int], AdaptiveLimiter] = {}
+
+    @classmethod
+    def _get_limiter(cls, key: tuple[str, int]) -> AdaptiveLimiter:
+        if key not in cls._limiters:
+            config = EnvConfig.get_config()
+            cls._limiters[key] = AdaptiveLimiter(
+                min_window=config.UPSTREAM_MIN_CONCURRENCY,
+                max_window=config.UPSTREAM_MAX_CONCURRENCY,
+                initial_window=config.UPSTREAM_INITIAL_CONCURRENCY
+            )
+        return cls._limiters[key]
+
+    @classmethod
+    def limit(cls, url: str) -> LimiterSlot:
+        '''获取url对应上游的并发名额
+
+        参数：
+            url: 请求的完整url
+
+        返回：
+            LimiterSlot，需要使用 async with
+        '''
+        return LimiterSlot(cls._get_limiter(BaseUrl.get_upstream(url)), url)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取并发限制的状态
+
+        返回：
+            {upstream: {region_id: {window, in_flight, queue, ...}}}
+        '''
+        data = {}
+        for (upstream, region_id), limiter in cls._limiters.items():
+            data.setdefault(upstream, {})[region_id] = limiter.get_stats()
+        return data
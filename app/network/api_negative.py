@@ -0,0 +1,183 @@
+import re
+import json
+from urllib.parse import urlsplit, parse_qsl
+
+from .api_base import BaseUrl
+from app.core import EnvConfig, api_logger
+from app.middlewares import RedisConnection
+from app.response import JSONResponse
+
+# 用户和工会相关的接口，用于从url中获取对应的用户或工会
+NEGATIVE_ENDPOINT_LIST = [
+    ('user_basic', re.compile(r'^/api/accounts/(\d+)/$')),
+    ('user', re.compile(r'^/api/accounts/(\d+)/ships/')),
+    ('clan', re.compile(r'^/api/clanbase/(\d+)/claninfo/$')),
+    ('clan', re.compile(r'^/api/members/(\d+)/$')),
+]
+
+
+class NegativeOutcome:
+    user_not_exist = 'user_not_exist'
+    clan_not_exist = 'clan_not_exist'
+    hidden_profile = 'hidden_profile'
+
+
+class NegativeCache:
+    '''上游接口的负缓存
+
+    记录 用户不存在/工会不存在/隐藏战绩 的结果，在过期前不再请求上游接口
+
+    缓存按照用户或工会保存在Redis中，key格式和tool/*中的负缓存保持一致：
+
+    app_network:negative_cache:{region_id}:{user|clan}:{id}
+
+    隐藏战绩只对没有ac的请求有效，使用ac时可以获取到完整数据
+    '''
+    KEY_PREFIX = 'app_network:negative_cache'
+    _stats: dict[str, dict[str, int]] = {}
+
+    def get_entity(url: str) -> tuple[str, int, int] | None:
+        '''获取url对应的用户或工会
+
+        返回：
+            (endpoint, region_id, entity_id)，不是用户或工会接口则返回None
+        '''
+        path = urlsplit(BaseUrl.get_target_url(url)).path
+        for endpoint, pattern in NEGATIVE_ENDPOINT_LIST:
+            match = pattern.match(path)
+            if match:
+                _, region_id = BaseUrl.get_upstream(url)
+                return endpoint, region_id, int(match.group(1))
+        return None
+
+    def get_outcome_ttl(outcome: str) -> int:
+        "获取不同结果的缓存时间"
+        config = EnvConfig.get_config()
+        ttl_list = {
+            NegativeOutcome.user_not_exist: config.NEGATIVE_CACHE_TTL_USER_NOT_EXIST,
+            NegativeOutcome.clan_not_exist: config.NEGATIVE_CACHE_TTL_CLAN_NOT_EXIST,
+            NegativeOutcome.hidden_profile: config.NEGATIVE_CACHE_TTL_HIDDEN_PROFILE
+        }
+        return ttl_list[outcome]
+
+    def get_cache_key(region_id: int, entity_type: str, entity_id: int) -> str:
+        return f'{NegativeCache.KEY_PREFIX}:{region_id}:{entity_type}:{entity_id}'
+
+    @classmethod
+    def cached(cls, namespace: str):
+        '''负缓存的装饰器
+
+        被装饰函数的参数为 (url, method, data)，只处理get请求
+
+        参数：
+            namespace: 区分不同接口类的命名空间
+        '''
+        def decorator(func):
+            async def wrapper(url: str, method: str = 'get', data: dict | list = None):
+                if method != 'get':
+                    return await func(url, method, data)
+                config = EnvConfig.get_config()
+                entity = cls.get_entity(url)
+                if not config.NEGATIVE_CACHE_ENABLED or entity is None:
+                    return await func(url)
+                endpoint, region_id, entity_id = entity
+                entity_type = 'clan' if endpoint == 'clan' else 'user'
+                public = not any(name == 'ac' for name, _ in parse_qsl(urlsplit(BaseUrl.get_target_url(url)).query))
+                stats = cls._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'stored': 0, 'errors': 0})
+                key = cls.get_cache_key(region_id, entity_type, entity_id)
+                cache = await cls.__get(key, stats)
+                if cache is not None:
+                    outcome = cache['outcome']
+                    if outcome == NegativeOutcome.clan_not_exist:
+                        stats['hits'] += 1
+                        return JSONResponse.API_1002_ClanNotExist
+                    if outcome == NegativeOutcome.user_not_exist:
+                        stats['hits'] += 1
+                        return JSONResponse.API_1001_UserNotExist
+                    if outcome == NegativeOutcome.hidden_profile and endpoint == 'user_basic' and public:
+                        stats['hits'] += 1
+                        return cache['response']
+                stats['misses'] += 1
+                response = await func(url)
+                outcome = None
+                if response['code'] == 1001 and entity_type == 'user':
+                    outcome = NegativeOutcome.user_not_exist
+                elif response['code'] == 1002 and entity_type == 'clan':
+                    outcome = NegativeOutcome.clan_not_exist
+                elif (
+                    response['code'] == 1000
+                    and endpoint == 'user_basic'
+                    and public
+                    and 'hidden_profile' in ((response['data'] or {}).get(str(entity_id)) or {})
+                ):
+                    outcome = NegativeOutcome.hidden_profile
+                if outcome:
+                    await cls.__set(key, outcome, response, stats)
+                return response
+            return wrapper
+        return decorator
+
+    @classmethod
+    async def __get(cls, key: str, stats: dict) -> dict | None:
+        try:
+            redis = RedisConnection.get_connection()
+            value = await redis.get(key)
+            if value is None:
+                return None
+            return json.loads(value)
+        except Exception as e:
+            stats['errors'] += 1
+            api_logger.warning(f'Failed to read the negative cache: {e}')
+            return None
+
+    @classmethod
+    async def __set(cls, key: str, outcome: str, response: dict, stats: dict) -> None:
+        try:
+            redis = RedisConnection.get_connection()
+            value = {'outcome': outcome}
+            if outcome == NegativeOutcome.hidden_profile:
+                value['response'] = response
+            await redis.set(key, json.dumps(value), ex=cls.get_outcome_ttl(outcome))
+            stats['stored'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            api_logger.warning(f'Failed to write the negative cache: {e}')
+
+    @classmethod
+    async def invalidate_user(cls, account_id: int, region_id: int) -> None:
+        '''删除用户的负缓存
+
+        用户绑定、用户更新ac等场景下调用，保证下一次请求会访问上游接口
+
+        参数：
+            account_id: 用户id
+            region_id: 服务器id
+        '''
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.delete(cls.get_cache_key(region_id, 'user', account_id))
+        except Exception as e:
+            api_logger.warning(f'Failed to invalidate the negative cache: {e}')
+
+    @classmethod
+    async def invalidate_clan(cls, clan_id: int, region_id: int) -> None:
+        '''删除工会的负缓存
+
+        参数：
+            clan_id: 工会id
+            region_id: 服务器id
+        '''
+        try:
+            redis = RedisConnection.get_connection()
+            await redis.delete(cls.get_cache_key(region_id, 'clan', clan_id))
+        except Exception as e:
+            api_logger.warning(f'Failed to invalidate the negative cache: {e}')
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取负缓存的统计数据
+
+        返回：
+            {namespace: {hits, misses, stored, errors}}
+        '''
+        return {namespace: dict(stats) for namespace, stats in cls._stats.items()}
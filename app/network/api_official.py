@@ -0,0 +1,174 @@
+import asyncio
+
+import httpx
+
+from .api_base import BaseUrl
+from .api_breaker import UpstreamBreaker
+from .api_client import HttpClientPool
+from .api_limiter import UpstreamLimiter
+from app.core import EnvConfig
+from app.log import ExceptionLogger
+from app.response import JSONResponse
+
+
+class OfficialAPI:
+    '''官方接口
+
+    使用官方接口批量获取用户数据，account/info 接口单次最多支持查询100个用户
+
+    1. 批量获取用户信息
+    2. 获取单个用户信息(短时间内的请求会被合并为批量请求)
+    '''
+    # 官方接口单次请求的最大用户数量
+    MAX_BATCH_SIZE = 100
+    # 等待合并的请求 {(region_id, fields): {account_id: [future]}}
+    _pending: dict[tuple[int, str], dict[int, list[asyncio.Future]]] = {}
+    _flush_tasks: dict[tuple[int, str], asyncio.TimerHandle] = {}
+    _dispatch_tasks: set[asyncio.Task] = set()
+
+    @ExceptionLogger.handle_network_exception_async
+    async def fetch_data(url):
+        try:
+            call = UpstreamBreaker.acquire(url)
+            if call is None:
+                # 熔断器打开，直接返回不再等待上游超时
+                return JSONResponse.API_2000_NetworkError
+            client = HttpClientPool.get_client(url)
+            async with call, UpstreamLimiter.limit(url) as slot:
+                res = await client.get(url=url, timeout=BaseUrl.REQUEST_TIME_OUT)
+                call.record(res.status_code)
+                slot.record(res.status_code)
+            requset_code = res.status_code
+            if requset_code != 200:
+                res.raise_for_status()  # 其他状态码
+            requset_result = res.json()
+            if requset_result.get('status') != 'ok':
+                # 官方接口的错误也是200状态码，错误信息在返回值的error中
+                error = requset_result.get('error', {})
+                raise httpx.HTTPStatusError(
+                    f"{error.get('code')} {error.get('message')}",
+                    request=res.request,
+                    response=res
+                )
+            return JSONResponse.get_success_response({
+                'hidden': requset_result.get('meta', {}).get('hidden') or [],
+                'data': requset_result['data']
+            })
+        except Exception as e:
+            raise e
+
+    @classmethod
+    @ExceptionLogger.handle_program_exception_async
+    async def get_account_info_batch(
+        self,
+        region_id: int,
+        account_ids: list,
+        fields: str = None
+    ) -> dict:
+        '''批量获取用户信息
+
+        按照每100个用户拆分为多个请求并发获取
+
+        参数：
+            region_id: 用户服务器id
+            account_ids: 用户id列表
+            fields: 官方接口的fields参数，用于限制返回的字段
+
+        返回：
+            {account_id: ResponseDict}，程序异常时返回带有error_id的ResponseDict
+        '''
+        account_ids = list(dict.fromkeys(int(account_id) for account_id in account_ids))
+        api_url, api_token = BaseUrl.get_official_base_url(region_id)
+        if api_url is None:
+            return {account_id: JSONResponse.API_1010_IllegalRegion for account_id in account_ids}
+        chunks = [
+            account_ids[i:i + self.MAX_BATCH_SIZE]
+            for i in range(0, len(account_ids), self.MAX_BATCH_SIZE)
+        ]
+        tasks = []
+        for chunk in chunks:
+            url = (
+                f'{api_url}/wows/account/info/?application_id={api_token}'
+                f'&account_id={",".join(str(account_id) for account_id in chunk)}'
+                + (f'&fields={fields}' if fields else '')
+            )
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
+        result = {}
+        for chunk, response in zip(chunks, responses):
+            if response['code'] != 1000:
+                for account_id in chunk:
+                    result[account_id] = response
+                continue
+            hidden = set(response['data']['hidden'])
+            data = response['data']['data'] or {}
+            for account_id in chunk:
+                user_data = data.get(str(account_id))
+                if user_data is None:
+                    result[account_id] = JSONResponse.API_1001_UserNotExist
+                elif account_id in hidden:
+                    result[account_id] = JSONResponse.API_1005_UserHiddenProfite
+                else:
+                    result[account_id] = JSONResponse.get_success_response(user_data)
+        return result
+
+    @classmethod
+    async def get_account_info(
+        self,
+        region_id: int,
+        account_id: int,
+        fields: str = None
+    ) -> dict:
+        '''获取单个用户信息
+
+        请求会先等待一个很短的时间窗口，窗口内同服务器的请求合并为一次批量请求
+
+        参数：
+            region_id: 用户服务器id
+            account_id: 用户id
+            fields: 官方接口的fields参数，用于限制返回的字段
+
+        返回：
+            ResponseDict
+        '''
+        key = (region_id, fields)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, {})
+        pending.setdefault(int(account_id), []).append(future)
+        if len(pending) >= self.MAX_BATCH_SIZE:
+            self.__flush(key)
+        elif key not in self._flush_tasks:
+            config = EnvConfig.get_config()
+            self._flush_tasks[key] = asyncio.get_running_loop().call_later(
+                config.OFFICIAL_BATCH_WINDOW, self.__flush, key
+            )
+        return await future
+
+    @classmethod
+    def __flush(self, key: tuple[int, str]) -> None:
+        "将等待中的请求作为一次批量请求发出"
+        timer = self._flush_tasks.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if pending:
+            task = asyncio.ensure_future(self.__dispatch(key, pending))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+
+    @classmethod
+    async def __dispatch(
+        self,
+        key: tuple[int, str],
+        pending: dict[int, list[asyncio.Future]]
+    ) -> None:
+        "执行批量请求并将结果分发给各个等待的请求"
+        region_id, fields = key
+        result = await self.get_account_info_batch(region_id, list(pending.keys()), fields)
+        error = result if result.get('status') == 'error' else None
+        for account_id, futures in pending.items():
+            # 批量请求的程序异常已经由ExceptionLogger记录，所有请求返回同一个error_id
+            response = error or result.get(account_id, JSONResponse.API_5000_ProgramError)
+            for future in futures:
+                if not future.done():
+                    future.set_result(response)
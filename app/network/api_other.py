@@ -1,6 +1,8 @@
-import httpx
-
 from .api_base import BaseUrl
+from .api_breaker import UpstreamBreaker
+from .api_cache import ResponseCache
+from .api_client import HttpClientPool
+from .api_limiter import UpstreamLimiter
 from app.log import ExceptionLogger
 from app.response import JSONResponse
 
@@ -8,19 +10,27 @@ from app.response import JSONResponse
 class OtherAPI:
     '''其他接口
     '''
+    @ResponseCache.cached('other')
     @ExceptionLogger.handle_network_exception_async
     async def fetch_data(url):
         try:
-            async with httpx.AsyncClient() as client:
+            call = UpstreamBreaker.acquire(url)
+            if call is None:
+                # 熔断器打开，直接返回不再等待上游超时
+                return JSONResponse.API_2000_NetworkError
+            client = HttpClientPool.get_client(url)
+            async with call, UpstreamLimiter.limit(url) as slot:
                 res = await client.get(url=url, timeout=BaseUrl.REQUEST_TIME_OUT)
-                requset_code = res.status_code
-                requset_result = res.json()
-                if requset_code == 200:
-                    # 正常返回值的处理
-                    data = requset_result['data']
-                    return JSONResponse.get_success_response(data)
-                else:
-                    res.raise_for_status()  # 其他状态码
+                call.record(res.status_code)
+                slot.record(res.status_code)
+            requset_code = res.status_code
+            requset_result = res.json()
+            if requset_code == 200:
+                # 正常返回值的处理
+                data = requset_result['data']
+                return JSONResponse.get_success_response(data)
+            else:
+                res.raise_for_status()  # 其他状态码
         except Exception as e:
             raise e
 
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import random
+
+from app.core import EnvConfig, api_logger
+
+
+class ProxyState:
+    '''单个代理在某个服务器下的状态
+
+    延迟和错误率使用EWMA计算，越新的请求权重越大
+    '''
+    # EWMA的平滑系数
+    ALPHA = 0.3
+
+    def __init__(self):
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def get_score(self) -> float:
+        "代理的评分，越小越好"
+        config = EnvConfig.get_config()
+        return self.latency * (1 + config.PROXY_ERROR_PENALTY * self.error_rate) * (self.in_flight + 1)
+
+    def is_available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def record(self, latency: float, success: bool) -> None:
+        "记录一次请求的延迟和结果"
+        config = EnvConfig.get_config()
+        self.requests += 1
+        if self.requests == 1:
+            self.latency = latency
+        else:
+            self.latency = self.ALPHA * latency + (1 - self.ALPHA) * self.latency
+        self.error_rate = self.ALPHA * (0.0 if success else 1.0) + (1 - self.ALPHA) * self.error_rate
+        if success:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= config.PROXY_EJECT_FAILURES:
+            # 连续失败的代理暂时移出，到期后重新参与选择
+            self.ejected_until = time.monotonic() + config.PROXY_EJECT_SECONDS
+            self.ejections += 1
+            self.failures = 0
+            self.error_rate = 0.5
+
+
+class ProxyPool:
+    '''上游接口的代理池
+
+    代理配置从 PROXY_CONFIG_PATH 指定的json文件中读取，格式为 {"host:port": [region_id, ...]}
+
+    文件修改后会在 PROXY_RELOAD_INTERVAL 秒内自动重新加载，无需重启服务
+
+    选择代理时随机选出两个可用的代理，使用延迟、错误率和进行中请求数综合评分较低的一个(power of two choices)
+    '''
+    _proxy_list: dict[int, list[str]] = {}
+    _states: dict[tuple[str, int], ProxyState] = {}
+    _config_mtime = None
+    _last_check = 0.0
+
+    @classmethod
+    def reload(cls, force: bool = False) -> None:
+        "检查代理配置文件是否有修改，有修改则重新加载"
+        config = EnvConfig.get_config()
+        now = time.monotonic()
+        if not force and now - cls._last_check < config.PROXY_RELOAD_INTERVAL:
+            return
+        cls._last_check = now
+        if not config.PROXY_CONFIG_PATH:
+            return
+        try:
+            mtime = os.path.getmtime(config.PROXY_CONFIG_PATH)
+            if mtime == cls._config_mtime:
+                return
+            with open(config.PROXY_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                proxy_config = json.load(f)
+            proxy_list = {}
+            for proxy, region_list in proxy_config.items():
+                for region_id in region_list:
+                    proxy_list.setdefault(int(region_id), []).append(proxy)
+            cls._proxy_list = proxy_list
+            cls._config_mtime = mtime
+            # 删除已经不在配置中的代理的状态
+            for proxy, region_id in list(cls._states.keys()):
+                if proxy not in proxy_list.get(region_id, []):
+                    del cls._states[(proxy, region_id)]
+            api_logger.info(f'Proxy config reloaded, {len(proxy_config)} proxies')
+        except Exception as e:
+            api_logger.error('Failed to reload the proxy config')
+            api_logger.error(e)
+
+    @classmethod
+    def _get_state(cls, proxy: str, region_id: int) -> ProxyState:
+        if (proxy, region_id) not in cls._states:
+            cls._states[(proxy, region_id)] = ProxyState()
+        return cls._states[(proxy, region_id)]
+
+    @classmethod
+    def select(cls, region_id: int, exclude: str = None) -> str | None:
+        '''选择服务器对应的代理
+
+        参数：
+            region_id: 服务器id
+            exclude: 不参与选择的代理，用于对冲请求时选择另一个代理
+
+        返回：
+            代理的 host:port，没有可用代理时返回None(直接请求上游)
+        '''
+        cls.reload()
+        now = time.monotonic()
+        candidates = [
+            proxy for proxy in cls._proxy_list.get(region_id, [])
+            if proxy != exclude and cls._get_state(proxy, region_id).is_available(now)
+        ]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        if cls._get_state(first, region_id).get_score() <= cls._get_state(second, region_id).get_score():
+            return first
+        return second
+
+    @classmethod
+    def is_proxy(cls, proxy: str, region_id: int) -> bool:
+        return proxy in cls._proxy_list.get(region_id, [])
+
+    @classmethod
+    def start_request(cls, proxy: str, region_id: int) -> None:
+        cls._get_state(proxy, region_id).in_flight += 1
+
+    @classmethod
+    def finish_request(cls, proxy: str, region_id: int, latency: float, success: bool | None) -> None:
+        '''记录通过代理的请求结果
+
+        参数：
+            proxy: 代理的 host:port
+            region_id: 服务器id
+            latency: 请求耗时(秒)
+            success: 请求是否成功，None表示不计入统计
+        '''
+        state = cls._get_state(proxy, region_id)
+        state.in_flight = max(0, state.in_flight - 1)
+        if success is not None:
+            state.record(latency, success)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取代理池的状态
+
+        返回：
+            {region_id: {proxy: {latency, error_rate, ...}}}
+        '''
+        now = time.monotonic()
+        data = {}
+        for region_id, proxy_list in cls._proxy_list.items():
+            for proxy in proxy_list:
+                state = cls._get_state(proxy, region_id)
+                data.setdefault(region_id, {})[proxy] = {
+                    'latency': round(state.latency, 4),
+                    'error_rate': round(state.error_rate, 4),
+                    'in_flight': state.in_flight,
+                    'requests': state.requests,
+                    'ejected': not state.is_available(now),
+                    'ejections': state.ejections
+                }
+        return data
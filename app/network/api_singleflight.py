@@ -0,0 +1,62 @@
+import json
+import asyncio
+
+
+class SingleFlight:
+    '''合并相同的上游请求
+
+    同一时间内相同的请求只会向上游发送一次，其他请求等待并共享同一个结果
+
+    注：共享的结果是同一个对象，调用方不应修改返回值
+    '''
+    _calls: dict[str, asyncio.Task] = {}
+    _stats: dict[str, dict[str, int]] = {}
+
+    @classmethod
+    def coalesce(cls, namespace: str):
+        '''请求合并的装饰器
+
+        被装饰函数的参数为 (url, method, data)，以此生成请求的key
+
+        参数：
+            namespace: 区分不同接口类的命名空间
+        '''
+        def decorator(func):
+            async def wrapper(url: str, method: str = 'get', data: dict | list = None):
+                key = f'{namespace}:{method}:{url}'
+                if data is not None:
+                    key += ':' + json.dumps(data, sort_keys=True)
+                stats = cls._stats.setdefault(namespace, {'requests': 0, 'upstream': 0, 'coalesced': 0})
+                stats['requests'] += 1
+                task = cls._calls.get(key)
+                if task is None:
+                    stats['upstream'] += 1
+                    if method == 'get':
+                        task = asyncio.ensure_future(func(url))
+                    else:
+                        task = asyncio.ensure_future(func(url, method, data))
+                    cls._calls[key] = task
+                    task.add_done_callback(lambda _: cls._calls.pop(key, None))
+                else:
+                    stats['coalesced'] += 1
+                # 单个调用方被取消时不影响其他等待中的调用方
+                return await asyncio.shield(task)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        '''获取请求合并的统计数据
+
+        返回：
+            {in_flight, namespaces: {namespace: {requests, upstream, coalesced, hit_rate}}}
+        '''
+        data = {
+            'in_flight': len(cls._calls),
+            'namespaces': {}
+        }
+        for namespace, stats in cls._stats.items():
+            namespace_data = dict(stats)
+            namespace_data['hit_rate'] = round(stats['coalesced'] / stats['requests'], 4) if stats['requests'] else 0
+            data['namespaces'][namespace] = namespace_data
+        return data
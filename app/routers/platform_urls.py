@@ -84,23 +84,23 @@ async def updateShipName(region: RegionList) -> ResponseDict:
 #     await record_api_call(result['status'])
 #     return result
 
-# @router.put("/game/user/update/", summary="更新用户的数据库数据")
-# async def updateUserCache(user_data: UserUpdateModel) -> ResponseDict:
-#     """更新用户的数据
+@router.put("/game/user/update/", summary="更新用户的数据库数据")
+async def updateUserCache(user_data: UserUpdateModel) -> ResponseDict:
+    """更新用户的数据
 
-#     通过传入的数据更新数据库
+    传入的 user_basic/user_info/user_recent 数据写入写缓冲后直接返回，由后台任务合并后批量写入数据库
 
-#     参数:
-#     - UserUpdateModel
+    参数:
+    - UserUpdateModel
     
-#     返回:
-#     - ResponseDict
-#     """
-#     if not ServiceStatus.is_service_available():
-#         return JSONResponse.API_8000_ServiceUnavailable
-#     result = await GameUser.update_user_data(user_data.model_dump())
-#     await record_api_call(result['status'])
-#     return result
+    返回:
+    - ResponseDict
+    """
+    if not ServiceStatus.is_service_available():
+        return JSONResponse.API_8000_ServiceUnavailable
+    result = await GameUser.update_user_data(user_data.model_dump())
+    await record_api_call(result['status'])
+    return result
 
 # @router.get("/game/clans/cache/", summary="获取工会的数据库中数据")
 # async def getClanCache(offset: Optional[int] = None, limit: Optional[int] = None) -> ResponseDict:
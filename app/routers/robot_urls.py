@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from .schemas import RegionList, PlatformList, BotUserBindModel
+from .schemas import RegionList, PlatformList, BotUserBindModel, UserBatchModel
 from app.utils import UtilityFunctions
 from app.core import ServiceStatus
 from app.response import JSONResponse, ResponseDict
@@ -62,6 +62,30 @@ async def getUserAccountData(
     await record_api_call(result['status'])
     return result
 
+@router.post("/user/account/batch/", summary="批量获取数据库中用户的基本信息")
+async def postUserAccountBatch(
+    user_data: UserBatchModel
+) -> ResponseDict:
+    """批量获取数据库中用户的基本信息
+
+    一次最多100个用户，返回的列表顺序和请求一致，每一项和 /user/account/ 的返回数据相同
+
+    数据库中还没有名称的用户通过官方接口批量获取名称
+    """
+    if not ServiceStatus.is_service_available():
+        return JSONResponse.API_8000_ServiceUnavailable
+    users = []
+    for user in user_data.user_list:
+        region_id = UtilityFunctions.get_region_id(user.region.name)
+        if not region_id:
+            return JSONResponse.API_1010_IllegalRegion
+        if UtilityFunctions.check_aid_and_rid(user.account_id, region_id) == False:
+            return JSONResponse.API_1003_IllegalAccoutIDorRegionID
+        users.append((user.account_id, region_id))
+    result = await BotUser.get_user_basic_batch(users)
+    await record_api_call(result['status'])
+    return result
+
 @router.get("/user/clan/", summary="获取数据库中工会的基本信息")
 async def getUserAccountData(
     region: RegionList,
@@ -1,9 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from app.response import ResponseDict, JSONResponse
 from app.core import ServiceStatus
+from app.log import QueryLog
+from app.models import UserWriteBuffer
+from app.db import MysqlConnection, ReplicaConnection
 from app.apis.root import RootData
-from app.middlewares import record_api_call
+from app.middlewares import record_api_call, ApiCallCounter, BindCache, TieredCache, StampedeCache, RateLimiter, IPAccessListManager
+from app.network import HttpClientPool, ProxyPool, SingleFlight, UpstreamLimiter, UpstreamBreaker, UpstreamHedge, ResponseCache, NegativeCache
 
 router = APIRouter()
 
@@ -13,6 +18,8 @@ async def getServiceStatus() -> ResponseDict:
     
     返回True或者False表示是否处于维护状态
 
+    upstream 为各个上游接口按服务器划分的熔断器状态
+
     参数:
     - None
 
@@ -28,6 +35,7 @@ async def getServiceStatus() -> ResponseDict:
         data = {
             'status': 'OK'
         }
+    data['upstream'] = UpstreamBreaker.get_stats()
     return JSONResponse.get_success_response(data)
 
 @router.post("/service/status/", summary="修改当前服务状态")
@@ -42,6 +50,179 @@ async def setServiceStatus(set: bool = False) -> ResponseDict:
         ServiceStatus.service_set_unavailable()
     return JSONResponse.API_1000_Success
 
+@router.get("/service/ratelimit/", summary="获取接口限流的统计数据")
+async def getServiceRateLimit() -> ResponseDict:
+    """获取接口限流的统计数据
+
+    按客户端分类统计检查的请求数、被worker内令牌桶拒绝以及被Redis限流规则拒绝的请求数
+
+    access_list: IP白名单和黑名单的文件路径和条目数量
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = RateLimiter.get_stats()
+    data['access_list'] = IPAccessListManager.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/service/calls/", summary="获取按接口统计的请求次数")
+async def getServiceCalls(date: str = None) -> ResponseDict:
+    """获取某一天按接口统计的请求次数
+
+    每个worker的计数每隔 API_CALLS_FLUSH_INTERVAL 秒写入一次，最近几秒的请求可能还没有统计
+
+    参数:
+    - date: 日期，格式为 %Y-%m-%d，默认为当天
+
+    返回:
+    - ResponseDict
+    """
+    data = await ApiCallCounter.get_route_stats(date)
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/pool/", summary="获取上游接口连接池状态")
+async def getNetworkPool() -> ResponseDict:
+    """获取上游接口连接池的使用情况
+
+    按上游接口类型和服务器统计请求数以及连接数，用于调整连接池大小
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = HttpClientPool.get_pool_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/proxy/", summary="获取上游接口代理池状态")
+async def getNetworkProxy() -> ResponseDict:
+    """获取上游接口代理池的状态
+
+    按服务器返回每个代理的延迟、错误率、进行中的请求数以及是否被暂时剔除
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = ProxyPool.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/singleflight/", summary="获取上游请求合并的统计数据")
+async def getNetworkSingleFlight() -> ResponseDict:
+    """获取上游请求合并的统计数据
+
+    统计总请求数、实际发往上游的请求数以及被合并的请求数
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = SingleFlight.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/limiter/", summary="获取上游接口并发限制的状态")
+async def getNetworkLimiter() -> ResponseDict:
+    """获取上游接口并发限制的状态
+
+    按上游接口类型和服务器返回当前并发窗口、进行中的请求数以及排队数量
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = UpstreamLimiter.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/hedge/", summary="获取上游接口对冲请求的统计数据")
+async def getNetworkHedge() -> ResponseDict:
+    """获取上游接口对冲请求的统计数据
+
+    按上游接口类型和服务器统计请求数、对冲请求数、对冲请求先返回的次数以及当前的对冲等待时间
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = UpstreamHedge.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/network/cache/", summary="获取上游接口响应缓存的统计数据")
+async def getNetworkCache() -> ResponseDict:
+    """获取上游接口响应缓存的统计数据
+
+    response: 按接口分类统计缓存命中、过期命中、未命中以及后台刷新的次数
+
+    negative: 用户不存在/工会不存在/隐藏战绩的负缓存命中次数
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = {
+        'response': ResponseCache.get_stats(),
+        'negative': NegativeCache.get_stats()
+    }
+    return JSONResponse.get_success_response(data)
+
+@router.get("/cache/bind/", summary="获取bot绑定信息缓存的统计数据")
+async def getBindCache() -> ResponseDict:
+    """获取bot用户绑定信息缓存的统计数据
+
+    统计进程内缓存和Redis缓存的命中次数、读取数据库的次数以及写回缓存的次数，用于确认数据库的查询量
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = BindCache.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/cache/profile/", summary="获取bot用户和工会信息缓存的统计数据")
+async def getProfileCache() -> ResponseDict:
+    """获取两级缓存的统计数据
+
+    按命名空间统计进程内缓存和Redis缓存的命中次数、读取数据库的次数以及收到的失效消息数量
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = TieredCache.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/cache/stampede/", summary="获取缓存击穿保护的统计数据")
+async def getStampedeCache() -> ResponseDict:
+    """获取缓存击穿保护的统计数据
+
+    按命名空间统计命中、提前刷新、返回旧数据、未命中以及等待其他worker加载的次数
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = StampedeCache.get_stats()
+    return JSONResponse.get_success_response(data)
+
 @router.get("/users/overview/", summary="获取数据库中用户数量")
 async def getUsersOverview() -> ResponseDict:
     """获取数据库中用户的overview
@@ -106,6 +287,73 @@ async def getTrx() -> ResponseDict:
     await record_api_call(result['status'])
     return result
 
+@router.get("/mysql/pool/", summary="获取MySQL连接池状态")
+async def getMysqlPool() -> ResponseDict:
+    """获取MySQL连接池的使用情况
+
+    返回使用中和空闲的连接数、等待连接的请求数、获取连接超时的次数以及获取连接耗时的直方图，用于调整连接池大小
+
+    replica: 只读副本的复制延迟、连接数以及副本和主库分别处理的只读查询数量
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = MysqlConnection.get_pool_stats()
+    data['replica'] = ReplicaConnection.get_replica_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/mysql/query/", summary="获取数据库查询耗时和慢查询记录")
+async def getMysqlQuery() -> ResponseDict:
+    """获取数据库查询的耗时统计和慢查询记录
+
+    methods: 按model方法统计调用次数、错误次数、慢查询次数、行数以及耗时，按总耗时从大到小排序
+
+    slow_queries: 最近的慢查询，包含最慢的SQL、参数结构和EXPLAIN结果
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = {
+        'methods': QueryLog.get_summary(),
+        'slow_queries': QueryLog.get_slow_queries()
+    }
+    return JSONResponse.get_success_response(data)
+
+@router.get("/mysql/buffer/", summary="获取用户数据写缓冲的状态")
+async def getMysqlBuffer() -> ResponseDict:
+    """获取用户数据写缓冲的状态
+
+    返回缓冲中的数据量、写入次数、写入的数据条数和用户数、重新读取的数据条数以及写入失败的次数
+
+    参数:
+    - None
+
+    返回:
+    - ResponseDict
+    """
+    data = await UserWriteBuffer.get_stats()
+    return JSONResponse.get_success_response(data)
+
+@router.get("/metrics/", summary="获取Prometheus格式的监控数据")
+async def getMetrics() -> Response:
+    """获取Prometheus格式的监控数据
+
+    包含每个数据库model方法的耗时直方图、行数、错误次数以及慢查询次数
+
+    参数:
+    - None
+
+    返回:
+    - text/plain
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @router.get("/mysql/processlist/", summary="查看数据库连接数量")
 async def getProcessList() -> ResponseDict:
     """获取数据库连接量
@@ -44,6 +44,9 @@ class UserBaseDerivedModel(BaseModel):
     region: RegionList = Field(..., description='服务器')
     account_id: int = Field(..., description='用户id')
 
+class UserBatchModel(BaseModel):
+    user_list: list[UserBaseDerivedModel] = Field(..., max_length=100, description='用户列表')
+
 class UserInfoModel(UserBaseModel):
     is_active: int = Field(None, description='是否活跃')
     active_level: int = Field(None, description='活跃等级')
@@ -321,6 +321,37 @@ CREATE TABLE existing_ships (
     PRIMARY KEY (id) -- 主键
 );
 
+-- 所有船只共用的缓存表，替代按船只创建的 ship_<id> 表
+-- 数据通过 migrate_ship_cache.py 从旧的表中迁移
+CREATE TABLE ship_cache (
+    -- 相关id
+    ship_id          BIGINT       NOT NULL,
+    region_id        TINYINT      NOT NULL,
+    account_id       BIGINT       NOT NULL,
+    -- 用户该船只的数据
+    battles_count    INT          NOT NULL,
+    battle_type_1    INT          NOT NULL,
+    battle_type_2    INT          NOT NULL,
+    battle_type_3    INT          NOT NULL,
+    wins             INT          NOT NULL,
+    damage_dealt     BIGINT       NOT NULL,
+    frags            INT          NOT NULL,
+    exp              BIGINT       NOT NULL,
+    survived         INT          NOT NULL,
+    scouting_damage  BIGINT       NOT NULL,
+    art_agro         BIGINT       NOT NULL,
+    planes_killed    INT          NOT NULL,
+    max_exp          INT          NOT NULL,
+    max_damage_dealt INT          NOT NULL,
+    max_frags        INT          NOT NULL,
+    -- 记录数据创建的时间和更新时间
+    created_at       TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at       TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (ship_id, region_id, account_id) -- 主键，同一艘船只的数据按用户顺序存储
+)
+PARTITION BY HASH (ship_id) PARTITIONS 64;
+
 CREATE DATABASE kokomi_bot;
 USE kokomi_bot;
 
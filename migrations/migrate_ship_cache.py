@@ -0,0 +1,149 @@
+'''将按船只创建的 ship_<id> 表迁移到分区表 ship_cache
+
+每张 ship_<id> 表按照 id 划分为多个区间，所有区间通过 INSERT ... SELECT 在数据库内并行复制，数据不需要经过本程序
+
+同一个用户的数据以 updated_at 较新的一方为准，可以重复执行：
+    1. 执行一次迁移
+    2. 将 user_cache 和 user_status 的 SHIP_CACHE_BACKEND 设置为 partitioned
+    3. 再执行一次迁移，补充切换期间写入旧表的数据
+
+用法：
+    python migrate_ship_cache.py --workers 8 --chunk-size 5000
+'''
+import time
+import asyncio
+import argparse
+import traceback
+
+import aiomysql
+from aiomysql.pool import Pool
+from aiomysql.connection import Connection
+from aiomysql.cursors import Cursor
+
+from config import MYSQL_HOST, MYSQL_PASSWORD, MYSQL_PORT, MYSQL_USERNAME
+
+
+DATA_FIELDS = [
+    'battles_count', 'battle_type_1', 'battle_type_2', 'battle_type_3', 'wins', 'damage_dealt',
+    'frags', 'exp', 'survived', 'scouting_damage', 'art_agro', 'planes_killed', 'max_exp',
+    'max_damage_dealt', 'max_frags'
+]
+
+def get_copy_sql(db: str, ship_id: int) -> str:
+    "复制一个id区间的SQL，已经存在的数据只有在旧表中更新时间更新时才会覆盖"
+    fields = ', '.join(DATA_FIELDS)
+    # updated_at 需要最后更新，前面的判断使用的是原来的值
+    updates = [
+        f'{field} = IF(VALUES(updated_at) > updated_at, VALUES({field}), {field})'
+        for field in DATA_FIELDS
+    ]
+    updates.append('updated_at = GREATEST(VALUES(updated_at), updated_at)')
+    return (
+        f"INSERT INTO {db}.ship_cache (ship_id, region_id, account_id, {fields}, created_at, updated_at) "
+        f"SELECT %s, region_id, account_id, {fields}, created_at, updated_at FROM {db}.ship_{int(ship_id)} "
+        "WHERE id BETWEEN %s AND %s "
+        f"ON DUPLICATE KEY UPDATE {', '.join(updates)};"
+    )
+
+async def get_chunks(pool: Pool, db: str, chunk_size: int) -> list[tuple[int, int, int]]:
+    "获取所有需要复制的区间 [(ship_id, start_id, end_id)]"
+    chunks = []
+    async with pool.acquire() as conn:
+        conn: Connection
+        async with conn.cursor() as cur:
+            cur: Cursor
+            await cur.execute(f"SELECT ship_id FROM {db}.existing_ships;")
+            ship_ids = [row[0] for row in await cur.fetchall()]
+            for ship_id in ship_ids:
+                try:
+                    await cur.execute(f"SELECT MIN(id), MAX(id) FROM {db}.ship_{int(ship_id)};")
+                except aiomysql.ProgrammingError:
+                    print(f'{ship_id} | 表不存在，跳过')
+                    continue
+                min_id, max_id = await cur.fetchone()
+                if min_id is None:
+                    continue
+                for start_id in range(min_id, max_id + 1, chunk_size):
+                    chunks.append((ship_id, start_id, start_id + chunk_size - 1))
+    return chunks
+
+async def copy_chunk(pool: Pool, db: str, ship_id: int, start_id: int, end_id: int) -> int:
+    "复制一个区间的数据，返回影响的行数"
+    async with pool.acquire() as conn:
+        conn: Connection
+        async with conn.cursor() as cur:
+            cur: Cursor
+            await cur.execute(get_copy_sql(db, ship_id), [ship_id, start_id, end_id])
+            return cur.rowcount
+
+async def verify(pool: Pool, db: str) -> int:
+    "检查每艘船只的数据量是否一致，返回不一致的船只数量"
+    mismatch = 0
+    async with pool.acquire() as conn:
+        conn: Connection
+        async with conn.cursor() as cur:
+            cur: Cursor
+            await cur.execute(f"SELECT ship_id FROM {db}.existing_ships;")
+            ship_ids = [row[0] for row in await cur.fetchall()]
+            for ship_id in ship_ids:
+                try:
+                    await cur.execute(f"SELECT COUNT(*) FROM {db}.ship_{int(ship_id)};")
+                except aiomysql.ProgrammingError:
+                    continue
+                old_count = (await cur.fetchone())[0]
+                await cur.execute(f"SELECT COUNT(*) FROM {db}.ship_cache WHERE ship_id = %s;", [ship_id])
+                new_count = (await cur.fetchone())[0]
+                if new_count < old_count:
+                    mismatch += 1
+                    print(f'{ship_id} | 数据量不一致 ship_{ship_id}: {old_count} ship_cache: {new_count}')
+    return mismatch
+
+async def main(db: str, workers: int, chunk_size: int):
+    pool: Pool = await aiomysql.create_pool(
+        host=MYSQL_HOST,
+        port=MYSQL_PORT,
+        user=MYSQL_USERNAME,
+        password=MYSQL_PASSWORD,
+        maxsize=workers,
+        autocommit=True
+    )
+    try:
+        start_time = time.time()
+        chunks = await get_chunks(pool, db, chunk_size)
+        print(f'共 {len(chunks)} 个区间需要复制')
+        semaphore = asyncio.Semaphore(workers)
+        finished = 0
+        failed = []
+
+        async def run(chunk: tuple[int, int, int]):
+            nonlocal finished
+            async with semaphore:
+                try:
+                    await copy_chunk(pool, db, *chunk)
+                except Exception:
+                    failed.append(chunk)
+                    traceback.print_exc()
+                finished += 1
+                if finished % 100 == 0 or finished == len(chunks):
+                    print(f'[ {finished} / {len(chunks)} ] 耗时 {round(time.time() - start_time, 2)} s')
+
+        await asyncio.gather(*(run(chunk) for chunk in chunks))
+        for ship_id, start_id, end_id in failed:
+            print(f'{ship_id} | 区间 {start_id} - {end_id} 复制失败，请重新执行')
+        mismatch = await verify(pool, db)
+        print(f'迁移完成，失败区间 {len(failed)} 个，数据量不一致的船只 {mismatch} 艘')
+    except:
+        traceback.print_exc()
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='迁移 ship_<id> 表的数据到 ship_cache')
+    parser.add_argument('--db', default='ships', help='船只缓存数据库名称')
+    parser.add_argument('--workers', type=int, default=8, help='并行复制的连接数')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='每次复制的id区间大小')
+    args = parser.parse_args()
+    asyncio.run(
+        main(args.db, args.workers, args.chunk_size)
+    )
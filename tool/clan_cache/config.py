@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class LoadConfig(BaseSettings):
@@ -9,6 +11,8 @@ class LoadConfig(BaseSettings):
     MYSQL_PORT: int
     MYSQL_USERNAME: str
     MYSQL_PASSWORD: str
+    # 数据库线程池和连接池的大小，即同时执行的数据库操作数量
+    MYSQL_POOL_SIZE: int = 4
 
     DB_NAME_MAIN: str
     DB_NAME_BOT: str
@@ -18,6 +22,9 @@ class LoadConfig(BaseSettings):
     RABBITMQ_USERNAME: str
     RABBITMQ_PASSWORD: str
 
+    # 可选，配置后和主程序共用Redis中的负缓存，并在更新数据后删除主程序中的用户和工会信息缓存
+    REDIS_URL: Optional[str] = None
+
     class Config:
         env_file = ".env"
         extra = 'allow'
@@ -2,6 +2,7 @@ import time
 import traceback
 import pymysql
 from db import DatabaseConnection
+from provision import ensure_clans
 
 from config import settings
 from log import log as logger
@@ -12,7 +13,10 @@ CACHE_DB = settings.DB_NAME_SHIP
 
 
 def update_clan_info_batch(region_id: int, season_number: int, clan_data_list: list):
-    """更新clan_info表中工会赛季信息，同时根据info表和season表的差异判断是否需要进一步更新season表"""
+    """更新clan_info表中工会赛季信息，同时根据info表和season表的差异判断是否需要进一步更新season表
+
+    返回的data中need_update为需要更新season表的工会，changed为clan_basic中名称或者段位被修改的工会
+    """
     pool = DatabaseConnection.get_pool()
     conn = pool.connection()
     cur = None
@@ -48,32 +52,22 @@ def update_clan_info_batch(region_id: int, season_number: int, clan_data_list: l
             params
         )
         need_update_clan = []
+        changed_clan = []
         clans = cur.fetchall()
         exists_clans = {}
         current_timestamp = int(time.time())
         for clan in clans:
             exists_clans[clan['clan_id']] = clan
+        # 不存在的工会批量写入，每张表只需要一次数据库往返
+        ensure_clans(
+            cur,
+            [(clan_data['id'], region_id, clan_data['tag']) for clan_data in clan_data_list if clan_data['id'] not in exists_clans]
+        )
         for clan_data in clan_data_list:
             # 批量更新写入数据
             clan_id = clan_data['id']
             if clan_id not in exists_clans:
-                # 用户不存在于数据库中，直接写入
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_basic (clan_id, region_id, tag) VALUES (%s, %s, %s);",
-                    [clan_id, region_id, clan_data['tag']]
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_info (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_users (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.clan_season (clan_id) VALUES (%s);",
-                    [clan_id]
-                )
+                # 工会不存在于数据库中，已经写入默认数据，直接更新
                 cur.execute(
                     f"UPDATE {MAIN_DB}.clan_basic SET tag = %s, league = %s WHERE region_id = %s AND clan_id = %s",
                     [clan_data['tag'],clan_data['league'],region_id,clan_id]
@@ -88,6 +82,7 @@ def update_clan_info_batch(region_id: int, season_number: int, clan_data_list: l
                     ]
                 )
                 need_update_clan.append(clan_id)
+                changed_clan.append(clan_id)
             else:
                 # 数据在数据库中，且没有赛季更改，检验数据是否改变再决定是否更新数据
                 if (
@@ -101,6 +96,7 @@ def update_clan_info_batch(region_id: int, season_number: int, clan_data_list: l
                         "WHERE region_id = %s AND clan_id = %s",
                         [clan_data['tag'],clan_data['league'],region_id,clan_id]
                     )
+                    changed_clan.append(clan_id)
                 if (
                     season_number != exists_clans[clan_id]['season'] or
                     clan_data['public_rating'] != exists_clans[clan_id]['public_rating'] or
@@ -124,7 +120,7 @@ def update_clan_info_batch(region_id: int, season_number: int, clan_data_list: l
                     need_update_clan.append(clan_id)
         
         conn.commit()
-        return {'status': 'ok','code': 1000,'message': 'Success','data': need_update_clan}
+        return {'status': 'ok','code': 1000,'message': 'Success','data': {'need_update': need_update_clan, 'changed': changed_clan}}
     except Exception as e:
         conn.rollback()
         logger.error(traceback.format_exc())
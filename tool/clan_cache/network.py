@@ -4,6 +4,7 @@ from typing import Optional
 from datetime import datetime
 
 from log import log as logger
+from negative_cache import NegativeCache
 
 CLAN_API_URL_LIST = {
     1: 'https://clans.worldofwarships.asia',
@@ -100,6 +101,7 @@ clan_url_dict = {
 }
 
 class Network:
+    @NegativeCache.cached
     async def fetch_data(url, method: str = 'get', data: Optional[dict] = None):
         async with httpx.AsyncClient() as client:
             try:
@@ -1,3 +1,8 @@
+import asyncio
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
 import pymysql
 from dbutils.pooled_db import PooledDB
 
@@ -5,16 +10,23 @@ from config import settings
 from log import log as logger
 
 class DatabaseConnection:
+    '''数据库连接池
+
+    model中的函数使用阻塞的pymysql，在事件循环中需要通过 run/iterate 放到线程池中执行，避免数据库操作阻塞网络请求
+
+    线程池和连接池的大小都为 MYSQL_POOL_SIZE，每个线程最多同时占用一个连接
+    '''
     _pool = None
+    _executor = None
 
     @classmethod
     def init_pool(cls):
         try:
             cls._pool = PooledDB(
                 creator=pymysql,
-                maxconnections=2,  # 最大连接数
+                maxconnections=settings.MYSQL_POOL_SIZE,  # 最大连接数
                 mincached=1,        # 初始化时，连接池中至少创建的空闲的连接
-                maxcached=2,        # 最大缓存的连接
+                maxcached=settings.MYSQL_POOL_SIZE,       # 最大缓存的连接
                 blocking=True,      # 连接池中如果没有可用连接后，是否阻塞
                 host=settings.MYSQL_HOST,
                 user=settings.MYSQL_USERNAME,
@@ -29,6 +41,9 @@ class DatabaseConnection:
 
     @classmethod
     def close_pool(cls):
+        if cls._executor:
+            cls._executor.shutdown(wait=True)
+            cls._executor = None
         if cls._pool:
             cls._pool.close()
             logger.info(f'数据库连接关闭')
@@ -42,4 +57,56 @@ class DatabaseConnection:
             cls.init_pool()
             return cls._pool
 
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(
+                max_workers=settings.MYSQL_POOL_SIZE,
+                thread_name_prefix='db'
+            )
+        return cls._executor
+
+    @classmethod
+    async def run(cls, func, *args, **kwargs):
+        '''在线程池中执行阻塞的数据库函数
 
+        参数：
+            func: model中的函数
+            *args, **kwargs: 传给func的参数
+
+        返回：
+            func的返回值
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            cls.get_executor(),
+            functools.partial(func, *args, **kwargs)
+        )
+
+    @classmethod
+    async def iterate(cls, iterator, chunk_size: int = 100):
+        '''在线程池中读取model中阻塞的 iter_* 生成器
+
+        每次在线程池中读取 chunk_size 条数据，调用方处理当前这批数据时提前读取下一批，读取期间事件循环可以继续处理网络请求
+
+        参数：
+            iterator: 阻塞的生成器
+            chunk_size: 每次读取的数据条数
+        '''
+        iterator = iter(iterator)
+        next_rows = asyncio.ensure_future(cls.run(list, itertools.islice(iterator, chunk_size)))
+        try:
+            while True:
+                rows = await next_rows
+                if len(rows) < chunk_size:
+                    for row in rows:
+                        yield row
+                    return
+                # 同一时间只有一次读取，生成器不会被多个线程同时执行
+                next_rows = asyncio.ensure_future(cls.run(list, itertools.islice(iterator, chunk_size)))
+                for row in rows:
+                    yield row
+        finally:
+            # 调用方提前结束遍历时取消预读
+            if not next_rows.done():
+                next_rows.cancel()
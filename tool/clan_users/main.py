@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import time
+import traceback
 import asyncio
 
 from log import CLIENT_NAME
 from log import log as logger
+from config import settings
 from update import Update
 from db import DatabaseConnection
-from model import get_clan_max_number, get_clan_cache_batch
+from model import get_clan_max_number, iter_clan_cache
 
 
 
@@ -18,28 +20,42 @@ class ContinuousUserCacheUpdater:
     async def update_user(self):
         start_time = int(time.time())
 
-        limit = 10
-        request_result = get_clan_max_number()
+        request_result = await DatabaseConnection.run(get_clan_max_number)
         if request_result['code'] != 1000:
             logger.error(f"获取MaxClanID时发生错误，Error: {request_result.get('message')}")
         else:
             max_id = request_result['data']['max_id']
-            max_offset = (int(max_id / limit) + 1) * limit
-            offset = 0
-            while offset <= max_offset:
-                clans_result = get_clan_cache_batch(offset, limit)
-                if clans_result['code'] == 1000:
-                    i = 0
-                    for clan in clans_result['data']:
-                        clan_id = clan['clan_basic']['clan_id']
-                        region_id = clan['clan_basic']['region_id']
-                        logger.info(f'{region_id} - {clan_id} | ------------------[ {offset + i} / {max_id} ]')
-                        await Update.main(clan_id, region_id, clan)
-                        await asyncio.sleep(10)
-                        i += 1
-                else:
-                    logger.error(f"获取CacheClans时发生错误，Error: {clans_result.get('message')}")
-                offset += limit
+            # 每隔10s开始更新一个工会，不等待上一个工会写入数据库完成，最多同时更新 MYSQL_POOL_SIZE 个工会
+            semaphore = asyncio.Semaphore(settings.MYSQL_POOL_SIZE)
+            tasks = set()
+            try:
+                async for row in DatabaseConnection.iterate(iter_clan_cache(batch_size=100)):
+                    clan = {
+                        'clan_basic': {
+                            'region_id': row.region_id,
+                            'clan_id': row.clan_id
+                        },
+                        'clan_info': {
+                            'is_active': row.is_active,
+                            'update_time': row.info_update_time
+                        },
+                        'clan_users':{
+                            'hash_value': row.hash_value,
+                            'update_time': row.users_update_time
+                        }
+                    }
+                    await semaphore.acquire()
+                    logger.info(f'{row.region_id} - {row.clan_id} | ------------------[ {row.id} / {max_id} ]')
+                    task = asyncio.create_task(self.update_one(semaphore, row.clan_id, row.region_id, clan))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    await asyncio.sleep(10)
+            except Exception:
+                # 读取工会数据多次失败时不能当作遍历完成
+                logger.error(traceback.format_exc())
+                logger.error('遍历工会数据时发生错误，本轮更新提前结束')
+            finally:
+                await asyncio.gather(*tasks)
         end_time = int(time.time())
         # 避免测试时候的循环bug
         if end_time - start_time <= 6*60*60-10:
@@ -47,6 +63,12 @@ class ContinuousUserCacheUpdater:
             logger.info(f'更新线程休眠 {round(sleep_time,2)} s')
             await asyncio.sleep(sleep_time)
 
+    async def update_one(self, semaphore: asyncio.Semaphore, clan_id: int, region_id: int, clan: dict):
+        try:
+            await Update.main(clan_id, region_id, clan)
+        finally:
+            semaphore.release()
+
     async def continuous_update(self):
         # 持续循环更新，直到接收到停止信号
         # 似乎写不写没区别(
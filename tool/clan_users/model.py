@@ -1,7 +1,9 @@
 import time
+from collections import namedtuple
 import pymysql
 import traceback
 from db import DatabaseConnection
+from provision import ensure_users
 
 from config import settings
 from log import log as logger
@@ -10,6 +12,8 @@ from utils import BinaryGeneratorUtils, BinaryParserUtils
 MAIN_DB = settings.DB_NAME_MAIN
 BOT_DB = settings.DB_NAME_BOT
 CACHE_DB = settings.DB_NAME_SHIP
+# 流式读取时单页读取失败的重试次数，重试后仍然失败时抛出异常
+PAGE_RETRY_TIMES = 3
 
 
 def get_clan_max_number():
@@ -38,63 +42,69 @@ def get_clan_max_number():
         conn.close()
 
 
-def get_clan_cache_batch(offset: int, limit = 1000):
-    '''批量获取用户缓存的数据
+# 流式读取工会缓存数据时每行返回的字段
+ClanCacheRow = namedtuple(
+    'ClanCacheRow',
+    ['id', 'clan_id', 'region_id', 'is_active', 'info_update_time', 'hash_value', 'users_update_time']
+)
 
-    获取用户缓存数据，用于缓存的更新
+def iter_clan_cache(batch_size: int = 1000, region_id: int = None):
+    '''流式读取工会缓存的数据
+
+    按照 id 进行 keyset 分页(WHERE b.id > last_id ORDER BY b.id LIMIT n)，id 不连续时不会产生空查询
+
+    每页使用无缓冲的服务端游标读取，逐行转换为 ClanCacheRow 后释放连接再返回，更新工会时不会占用数据库连接
+
+    已解散工会的数据会在SQL中排除，避免浪费服务器资源
 
     参数:
-        offset: 从哪个id开始读取
-        limit: 每次读取多少条数据
+        batch_size: 每页读取多少条数据
+        region_id: 只读取该服务器的工会
+
+    返回:
+        ClanCacheRow 的生成器，单页读取失败时重试 PAGE_RETRY_TIMES 次，仍然失败时记录日志并抛出异常，调用方可以区分读取中断和读取完成
     '''
-    pool = DatabaseConnection.get_pool()
-    conn = pool.connection()
-    cur = None
-    try:
-        conn.begin()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        
-        data = []
-        cur.execute(
-            "SELECT b.clan_id, b.region_id, i.is_active, UNIX_TIMESTAMP(i.updated_at) AS info_update_time, "
-            "u.hash_value, UNIX_TIMESTAMP(u.updated_at) AS users_update_time "
-            f"FROM {MAIN_DB}.clan_basic AS b "
-            f"LEFT JOIN {MAIN_DB}.clan_info AS i ON b.clan_id = i.clan_id "
-            f"LEFT JOIN {MAIN_DB}.clan_users AS u ON b.clan_id = u.clan_id "
-            "WHERE b.id BETWEEN %s AND %s;", 
-            [offset + 1, offset + limit]
-        )
-        rows = cur.fetchall()
+    conditions = ["(i.updated_at IS NULL OR i.is_active <> 0)"]
+    filter_params = []
+    if region_id is not None:
+        conditions.append("b.region_id = %s")
+        filter_params.append(region_id)
+    sql = (
+        "SELECT b.id, b.clan_id, b.region_id, i.is_active, UNIX_TIMESTAMP(i.updated_at) AS info_update_time, "
+        "u.hash_value, UNIX_TIMESTAMP(u.updated_at) AS users_update_time "
+        f"FROM {MAIN_DB}.clan_basic AS b "
+        f"LEFT JOIN {MAIN_DB}.clan_info AS i ON b.clan_id = i.clan_id "
+        f"LEFT JOIN {MAIN_DB}.clan_users AS u ON b.clan_id = u.clan_id "
+        f"WHERE b.id > %s AND {' AND '.join(conditions)} "
+        "ORDER BY b.id LIMIT %s;"
+    )
+    last_id = 0
+    while True:
+        rows = None
+        for retry in range(PAGE_RETRY_TIMES + 1):
+            pool = DatabaseConnection.get_pool()
+            conn = pool.connection()
+            cur = None
+            try:
+                cur = conn.cursor(pymysql.cursors.SSCursor)
+                cur.execute(sql, [last_id] + filter_params + [batch_size])
+                rows = [ClanCacheRow(*row) for row in cur]
+                break
+            except Exception:
+                logger.error(traceback.format_exc())
+                if retry == PAGE_RETRY_TIMES:
+                    raise
+                logger.warning(f'读取id大于 {last_id} 的数据失败，{retry + 1}/{PAGE_RETRY_TIMES} 次重试')
+                time.sleep(5 * (retry + 1))
+            finally:
+                if cur:
+                    cur.close()
+                conn.close()
         for row in rows:
-            # 排除已注销账号的数据，避免浪费服务器资源
-            if row['info_update_time'] and not row['is_active']:
-                continue
-            user = {
-                'clan_basic': {
-                    'region_id': row['region_id'],
-                    'clan_id': row['clan_id']
-                },
-                'clan_info': {
-                    'is_active': row['is_active'],
-                    'update_time': row['info_update_time']
-                },
-                'clan_users':{
-                    'hash_value': row['hash_value'],
-                    'update_time': row['users_update_time']
-                }
-            }
-            data.append(user)
-        
-        conn.commit()
-        return {'status': 'ok','code': 1000,'message': 'Success','data': data}
-    except Exception as e:
-        conn.rollback()
-        logger.error(traceback.format_exc())
-        return {'status': 'error','code': 3000,'message': 'DatabaseError','data': None}
-    finally:
-        if cur:
-            cur.close()
-        conn.close()
+            yield row
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
 
 def update_clan_basic_and_info(clan_data: dict):
     '''更新clan_info表
@@ -202,32 +212,17 @@ def check_and_insert_missing_users(users: list):
         rows = cur.fetchall()
         for row in rows:
             exists_users[row['account_id']] = [row['username'],row['update_time']]
+        # 不存在的用户批量写入，每张表只需要一次数据库往返
+        ensure_users(
+            cur,
+            [(user[0], user[1], user[2]) for user in users if user[0] not in exists_users],
+            updated=True
+        )
         for user in users:
             account_id = user[0]
             region_id = user[1]
             nickname = user[2]
-            if account_id not in exists_users:
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                    [account_id, region_id, f'User_{account_id}']
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                cur.execute(
-                    f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                    [account_id]
-                )
-                cur.execute(
-                    f"UPDATE {MAIN_DB}.user_basic SET username = %s WHERE region_id = %s AND account_id = %s",
-                    [nickname, region_id, account_id]
-                )
-            else:
+            if account_id in exists_users:
                 if exists_users[account_id][1] == None:
                     cur.execute(
                         f"UPDATE {MAIN_DB}.user_basic SET username = %s WHERE region_id = %s AND account_id = %s",
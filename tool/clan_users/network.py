@@ -4,6 +4,7 @@ from typing import Optional
 from datetime import datetime
 
 from log import log as logger
+from negative_cache import NegativeCache
 
 # API_URL = 'http://127.0.0.1:8000'
 
@@ -24,6 +25,7 @@ REGION_LIST = {
 }
 
 class Network:
+    @NegativeCache.cached
     async def fetch_data(url, method: str = 'get', data: Optional[dict] = None):
         async with httpx.AsyncClient() as client:
             try:
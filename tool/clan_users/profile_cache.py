@@ -0,0 +1,52 @@
+import json
+
+from log import log as logger
+from config import settings
+
+REDIS_URL = settings.REDIS_URL
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+# 和主程序 app.middlewares.TieredCache 保持一致
+KEY_PREFIX = 'app_cache'
+CHANNEL = 'app_cache:invalidate'
+
+
+class ProfileCache:
+    '''主程序中bot用户和工会基本信息缓存的失效通知
+
+    更新用户名称、用户所在工会、工会名称或者段位后，删除Redis中的缓存并通知主程序的所有worker删除进程内的缓存
+
+    没有配置REDIS_URL时不做任何处理，主程序的缓存在数据过期时自然失效
+    '''
+    _client = None
+
+    @classmethod
+    def _get_client(cls):
+        if cls._client is None and REDIS_URL and redis is not None:
+            cls._client = redis.from_url(REDIS_URL, decode_responses=True)
+        return cls._client
+
+    @classmethod
+    async def invalidate(cls, namespace: str, keys: list[str]) -> None:
+        client = cls._get_client()
+        if client is None or not keys:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.delete(*[f'{KEY_PREFIX}:{namespace}:{key}' for key in keys])
+                pipe.publish(CHANNEL, json.dumps({'namespace': namespace, 'keys': keys}))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f'缓存删除失败，Error: {e}')
+
+    @classmethod
+    async def invalidate_users(cls, region_id: int, account_ids: list[int]) -> None:
+        await cls.invalidate('bot_user', [f'{region_id}:{account_id}' for account_id in account_ids])
+
+    @classmethod
+    async def invalidate_clans(cls, region_id: int, clan_ids: list[int]) -> None:
+        await cls.invalidate('bot_clan', [f'{region_id}:{clan_id}' for clan_id in clan_ids])
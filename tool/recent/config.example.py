@@ -11,4 +11,7 @@ MASTER_API_URL = 'http://127.0.0.1:8000'
 
 # slave配置
 SALVE_REGION = [1,2,3,4,5]
-SALVE_API_URL = 'http://127.0.0.1:8000'
\ No newline at end of file
+SALVE_API_URL = 'http://127.0.0.1:8000'
+
+# 可选，配置后和主程序共用Redis中的负缓存，例如 redis://:password@127.0.0.1:6379/0
+REDIS_URL = None
\ No newline at end of file
@@ -0,0 +1,132 @@
+import time
+import asyncio
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+
+from log import log as logger
+
+# 并发窗口配置
+MIN_WINDOW = 1
+MAX_WINDOW = 16
+INITIAL_WINDOW = 4
+QUEUE_TIMEOUT = 10
+# 两次乘性减小之间的最小间隔
+DECREASE_INTERVAL = 1.0
+# 输出并发限制状态日志的最小间隔(秒)
+SUMMARY_INTERVAL = 60.0
+
+
+class AdaptiveLimiter:
+    '''基于AIMD的自适应并发限制
+
+    请求成功时并发窗口加性增长，遇到限流(429)、服务端错误(5xx)或超时时乘性减小
+    '''
+    def __init__(self):
+        self.window = float(INITIAL_WINDOW)
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.queue_timeouts = 0
+
+    async def acquire(self) -> None:
+        self.requests += 1
+        if self.in_flight < int(self.window) and not self.waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise httpx.PoolTimeout('Timed out waiting for the upstream concurrency limiter')
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(None)
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+
+    def release(self, success: bool | None) -> None:
+        self.in_flight -= 1
+        if success is True:
+            self.window = min(MAX_WINDOW, self.window + 1 / self.window)
+        elif success is False:
+            self.throttled += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= DECREASE_INTERVAL:
+                self.window = max(MIN_WINDOW, self.window / 2)
+                self.last_decrease = now
+        while self.waiters and self.in_flight < int(self.window):
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+
+class LimiterSlot:
+    def __init__(self, limiter: AdaptiveLimiter):
+        self.limiter = limiter
+        self.success = None
+
+    def record(self, status_code: int) -> None:
+        self.success = not (status_code == 429 or status_code >= 500)
+
+    async def __aenter__(self):
+        await self.limiter.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, httpx.TimeoutException):
+            self.success = False
+        self.limiter.release(self.success)
+        return False
+
+
+class UpstreamLimiter:
+    '''按上游接口的host维护并发限制，进程内共享'''
+    _limiters: dict[str, AdaptiveLimiter] = {}
+    _last_summary = 0.0
+
+    @classmethod
+    def limit(cls, url: str) -> LimiterSlot:
+        host = urlsplit(url).hostname
+        if host not in cls._limiters:
+            cls._limiters[host] = AdaptiveLimiter()
+        return LimiterSlot(cls._limiters[host])
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        data = {}
+        for host, limiter in cls._limiters.items():
+            data[host] = {
+                'window': round(limiter.window, 2),
+                'in_flight': limiter.in_flight,
+                'queue': len(limiter.waiters),
+                'requests': limiter.requests,
+                'throttled': limiter.throttled,
+                'queue_timeouts': limiter.queue_timeouts
+            }
+        return data
+
+    @classmethod
+    def log_summary(cls) -> None:
+        '''输出每个host的并发窗口、请求数、被限流次数和排队超时次数
+
+        最多每 SUMMARY_INTERVAL 秒输出一次，计数为进程启动以来的累计值
+        '''
+        now = time.monotonic()
+        if now - cls._last_summary < SUMMARY_INTERVAL:
+            return
+        cls._last_summary = now
+        for host, stats in cls.get_stats().items():
+            logger.info(
+                f"上游并发限制 {host} | window: {stats['window']} in_flight: {stats['in_flight']} "
+                f"queue: {stats['queue']} requests: {stats['requests']} throttled: {stats['throttled']} "
+                f"queue_timeouts: {stats['queue_timeouts']}"
+            )
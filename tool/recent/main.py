@@ -5,6 +5,7 @@ import asyncio
 from log import log as logger
 from config import CLIENT_TYPE, SALVE_REGION
 from network import Network
+from limiter import UpstreamLimiter
 from update import Update
 
 
@@ -28,6 +29,8 @@ class ContinuousUserUpdater:
                     ac_value = None
                 logger.info(f'{region_id} - {account_id} | ---------------------------------')
                 await Update.main(account_id,region_id,ac_value)
+                # 最多每分钟输出一次上游并发限制的状态
+                UpstreamLimiter.log_summary()
         end_time = int(time.time())
         # 避免测试时候的循环bug
         if end_time - start_time <= 50:
@@ -0,0 +1,143 @@
+import re
+import json
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+from log import log as logger
+import config
+
+REDIS_URL = getattr(config, 'REDIS_URL', None)
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+# 负缓存的过期时间(秒)，和主程序的默认配置保持一致
+TTL_LIST = {
+    'user_not_exist': 21600,
+    'clan_not_exist': 21600,
+    'hidden_profile': 3600
+}
+
+UPSTREAM_REGION_LIST = {
+    'vortex.worldofwarships.asia': 1,
+    'vortex.worldofwarships.eu': 2,
+    'vortex.worldofwarships.com': 3,
+    'vortex.korabli.su': 4,
+    'vortex.wowsgame.cn': 5,
+    'clans.worldofwarships.asia': 1,
+    'clans.worldofwarships.eu': 2,
+    'clans.worldofwarships.com': 3,
+    'clans.korabli.su': 4,
+    'clans.wowsgame.cn': 5
+}
+
+ENDPOINT_LIST = [
+    ('user_basic', re.compile(r'^/api/accounts/(\d+)/$')),
+    ('user', re.compile(r'^/api/accounts/(\d+)/ships/')),
+    ('clan', re.compile(r'^/api/clanbase/(\d+)/claninfo/$')),
+    ('clan', re.compile(r'^/api/members/(\d+)/$')),
+]
+
+
+class NegativeCache:
+    '''上游接口的负缓存
+
+    记录 用户不存在/工会不存在/隐藏战绩 的结果，过期前不再请求上游接口
+
+    配置了REDIS_URL时和主程序共用Redis中的负缓存，否则只在进程内缓存
+    '''
+    KEY_PREFIX = 'app_network:negative_cache'
+    _client = None
+    _local: dict[str, tuple[float, dict]] = {}
+    stats = {'hits': 0, 'misses': 0, 'stored': 0}
+
+    @classmethod
+    def _get_client(cls):
+        if cls._client is None and REDIS_URL and redis is not None:
+            cls._client = redis.from_url(REDIS_URL, decode_responses=True)
+        return cls._client
+
+    @classmethod
+    async def _get(cls, key: str) -> dict | None:
+        client = cls._get_client()
+        if client is None:
+            cache = cls._local.get(key)
+            if cache is None:
+                return None
+            if cache[0] < time.time():
+                del cls._local[key]
+                return None
+            return cache[1]
+        try:
+            value = await client.get(key)
+            return json.loads(value) if value else None
+        except Exception as e:
+            logger.warning(f'负缓存读取失败，Error: {e}')
+            return None
+
+    @classmethod
+    async def _set(cls, key: str, value: dict, ttl: int) -> None:
+        cls.stats['stored'] += 1
+        client = cls._get_client()
+        if client is None:
+            cls._local[key] = (time.time() + ttl, value)
+            return
+        try:
+            await client.set(key, json.dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning(f'负缓存写入失败，Error: {e}')
+
+    def cached(func):
+        "负缓存的装饰器，被装饰函数的参数为 (url, method, data)"
+        async def wrapper(url: str, method: str = 'get', data: dict = None):
+            if method != 'get':
+                return await func(url, method, data)
+            split_url = urlsplit(url)
+            region_id = UPSTREAM_REGION_LIST.get(split_url.hostname)
+            entity = None
+            for endpoint, pattern in ENDPOINT_LIST:
+                match = pattern.match(split_url.path)
+                if match:
+                    entity = (endpoint, int(match.group(1)))
+                    break
+            if region_id is None or entity is None:
+                return await func(url, method, data)
+            endpoint, entity_id = entity
+            entity_type = 'clan' if endpoint == 'clan' else 'user'
+            public = not any(name == 'ac' for name, _ in parse_qsl(split_url.query))
+            key = f'{NegativeCache.KEY_PREFIX}:{region_id}:{entity_type}:{entity_id}'
+            cache = await NegativeCache._get(key)
+            if cache is not None:
+                outcome = cache['outcome']
+                if outcome == 'clan_not_exist':
+                    NegativeCache.stats['hits'] += 1
+                    return {'status': 'ok','code': 1002,'message': 'ClanNotExist','data' : None}
+                if outcome == 'user_not_exist':
+                    NegativeCache.stats['hits'] += 1
+                    return {'status': 'ok','code': 1001,'message': 'UserNotExist','data' : None}
+                if outcome == 'hidden_profile' and endpoint == 'user_basic' and public:
+                    NegativeCache.stats['hits'] += 1
+                    return cache['response']
+            NegativeCache.stats['misses'] += 1
+            response = await func(url, method, data)
+            outcome = None
+            if response.get('code') == 1001 and entity_type == 'user':
+                outcome = 'user_not_exist'
+            elif response.get('code') == 1002 and entity_type == 'clan':
+                outcome = 'clan_not_exist'
+            elif (
+                response.get('code') == 1000
+                and endpoint == 'user_basic'
+                and public
+                and 'hidden_profile' in ((response['data'] or {}).get(str(entity_id)) or {})
+            ):
+                outcome = 'hidden_profile'
+            if outcome:
+                value = {'outcome': outcome}
+                if outcome == 'hidden_profile':
+                    value['response'] = response
+                await NegativeCache._set(key, value, TTL_LIST[outcome])
+            return response
+        return wrapper
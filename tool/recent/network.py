@@ -1,10 +1,14 @@
+import re
 import httpx
 import time
 import asyncio
+import ijson
 from typing import Optional
 from dataclasses import dataclass
 
 from log import log as logger
+from negative_cache import NegativeCache
+from limiter import UpstreamLimiter
 from config import CLIENT_TYPE, SALVE_API_URL, MASTER_API_URL
 
 VORTEX_API_URL_LIST = {
@@ -69,20 +73,86 @@ recent_json_index = [
     json_index('shots_by_tbomb',                37),
 ]
 
+SHIPS_URL_PATTERN = re.compile(r'/api/accounts/(\d+)/ships/([a-z_0-9]+)/')
+
+
+class ResponseStream:
+    "将httpx的响应转换为ijson可以读取的异步文件对象"
+    def __init__(self, response: httpx.Response):
+        self.iterator = response.aiter_bytes()
+
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            # ijson会先调用read(0)判断返回的数据类型
+            return b''
+        try:
+            return await self.iterator.__anext__()
+        except StopAsyncIteration:
+            return b''
+
+
 class Network:
+    @NegativeCache.cached
+    async def fetch_ships_data(url, method: str = 'get', data: Optional[dict] = None):
+        """流式获取用户船只数据
+
+        边下载边解析，每艘船只保留 recent_json_index 中不为0的字段，避免完整的响应加载到内存中
+
+        返回的data格式为 {ship_id: {index: value}}
+        """
+        account_id, battle_type = SHIPS_URL_PATTERN.search(url).groups()
+        async with httpx.AsyncClient() as client:
+            try:
+                async with UpstreamLimiter.limit(url) as slot:
+                    async with client.stream('GET', url, timeout=5) as res:
+                        slot.record(res.status_code)
+                        requset_code = res.status_code
+                        if requset_code == 404:
+                            return {'status': 'ok','code': 1001,'message': 'UserNotExist','data' : None}
+                        if requset_code != 200:
+                            return {'status': 'ok','code': 2000,'message': 'NetworkError','data': None}
+                        result = {}
+                        async for ship_id, ship_data in ijson.kvitems_async(
+                            ResponseStream(res), f'data.{account_id}.statistics', use_float=True
+                        ):
+                            battle_data = ship_data.get(battle_type)
+                            if not battle_data or battle_data.get('battles_count', 0) == 0:
+                                continue
+                            result[ship_id] = {
+                                index.index: battle_data[index.keywords]
+                                for index in recent_json_index
+                                if battle_data.get(index.keywords, 0) != 0
+                            }
+                        return {'status': 'ok','code': 1000,'message': 'Success','data': result}
+            except httpx.ConnectTimeout:
+                return {'status': 'ok','code': 2001,'message': 'NetworkError','data': None}
+            except httpx.ReadTimeout:
+                return {'status': 'ok','code': 2002,'message': 'NetworkError','data': None}
+            except httpx.TimeoutException:
+                return {'status': 'ok','code': 2003,'message': 'NetworkError','data': None}
+            except httpx.ConnectError:
+                return {'status': 'ok','code': 2004,'message': 'NetworkError','data': None}
+            except httpx.ReadError:
+                return {'status': 'ok','code': 2005,'message': 'NetworkError','data': None}
+            except ijson.JSONError:
+                return {'status': 'ok','code': 2000,'message': 'NetworkError','data': None}
+
+    @NegativeCache.cached
     async def fetch_data(url, method: str = 'get', data: Optional[dict] = None):
         async with httpx.AsyncClient() as client:
             try:
-                if method == 'get':
-                    res = await client.get(url, timeout=5)
-                elif method == 'delete':
-                    res = await client.delete(url, timeout=5)
-                elif method == 'post':
-                    res = await client.post(url, json=data, timeout=5)
-                elif method == 'put':
-                    res = await client.put(url, json=data, timeout=5)
-                else:
+                if method not in ['get', 'delete', 'post', 'put']:
                     return {'status': 'ok','code': 7000,'message': 'InvalidParameter','data': None}
+                async with UpstreamLimiter.limit(url) as slot:
+                    if method == 'get':
+                        res = await client.get(url, timeout=5)
+                    elif method == 'delete':
+                        res = await client.delete(url, timeout=5)
+                    elif method == 'post':
+                        res = await client.post(url, json=data, timeout=5)
+                    else:
+                        res = await client.put(url, json=data, timeout=5)
+                    slot.record(res.status_code)
                 requset_code = res.status_code
                 requset_result = res.json()
                 if requset_code == 200:
@@ -210,11 +280,9 @@ class Network:
             f'{api_url}/api/accounts/{account_id}/' + (f'?ac={ac_value}' if ac_value else '')
         ]
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
+        for url in urls:
+            tasks.append(self.fetch_data(url))
+        responses = await asyncio.gather(*tasks)
         return responses
     
     @classmethod
@@ -232,11 +300,9 @@ class Network:
             f'{api_url}/api/accounts/{account_id}/ships/rank_solo/' + (f'?ac={ac_value}' if ac_value else '')
         ]
         tasks = []
-        responses = []
-        async with asyncio.Semaphore(len(urls)):
-            for url in urls:
-                tasks.append(self.fetch_data(url))
-            responses = await asyncio.gather(*tasks)
+        for url in urls:
+            tasks.append(self.fetch_ships_data(url))
+        responses = await asyncio.gather(*tasks)
         error = None
         for response in responses:
             if response.get('code', None) != 1000:
@@ -257,13 +323,12 @@ class Network:
         i = 0
         for response in responses:
             battle_type = battle_type_list[i]
-            for ship_id, ship_data in response['data'][str(account_id)]['statistics'].items():
-                if ship_data[battle_type] == {} or ship_data[battle_type]['battles_count'] == 0:
-                    continue
+            # fetch_ships_data已经去掉了没有战斗场次的船只和为0的字段
+            for ship_id, ship_data in response['data'].items():
                 if ship_id not in result['battles_count']:
-                    result['battles_count'][ship_id] = ship_data[battle_type]['battles_count']
+                    result['battles_count'][ship_id] = ship_data[0]
                 else:
-                    result['battles_count'][ship_id] += ship_data[battle_type]['battles_count']
+                    result['battles_count'][ship_id] += ship_data[0]
                 if ship_id not in result['ships']:
                     result['ships'][ship_id] = {
                         'pvp_solo': {},
@@ -271,12 +336,6 @@ class Network:
                         'pvp_div3': {},
                         'rank_solo':{}
                     }
-                for index in recent_json_index:
-                    key = index.keywords
-                    num = index.index
-                    if ship_data[battle_type][key] == 0:
-                        continue
-                    else:
-                        result['ships'][ship_id][battle_type][num] = ship_data[battle_type][key]
+                result['ships'][ship_id][battle_type] = ship_data
             i += 1
         return result
\ No newline at end of file
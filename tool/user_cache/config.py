@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class LoadConfig(BaseSettings):
@@ -9,15 +11,24 @@ class LoadConfig(BaseSettings):
     MYSQL_PORT: int
     MYSQL_USERNAME: str
     MYSQL_PASSWORD: str
+    # 数据库线程池和连接池的大小，即同时执行的数据库操作数量
+    MYSQL_POOL_SIZE: int = 4
 
     DB_NAME_MAIN: str
     DB_NAME_BOT: str
     DB_NAME_SHIP: str
+
+    # 船只缓存的存储方式：table 每艘船只一张 ship_<id> 表，partitioned 所有船只共用分区表 ship_cache
+    SHIP_CACHE_BACKEND: str = 'table'
     
     RABBITMQ_HOST: str
     RABBITMQ_USERNAME: str
     RABBITMQ_PASSWORD: str
 
+    # 可选，配置后和主程序共用Redis中的负缓存，并在更新数据后删除主程序中的用户和工会信息缓存
+    # 同时user_basic和user_info的更新写入主程序的写缓冲，由主程序批量写入数据库
+    REDIS_URL: Optional[str] = None
+
     class Config:
         env_file = ".env"
         extra = 'allow'
@@ -2,12 +2,14 @@
 # -*- coding: utf-8 -*-
 import asyncio.selector_events
 import time
+import traceback
 import asyncio
 from log import log as logger
 
+from config import settings
 from update import Update
 from db import DatabaseConnection
-from model import get_user_max_number, get_user_cache_batch, get_user_token
+from model import get_user_max_number, iter_user_cache, get_user_token
 
 class ContinuousUserCacheUpdater:
     def __init__(self):
@@ -16,33 +18,50 @@ class ContinuousUserCacheUpdater:
     async def update_user(self):
         start_time = int(time.time())
         # 更新用户
-        limit = 1000
-        token_result = get_user_token()
+        token_result = await DatabaseConnection.run(get_user_token)
         if token_result['code'] != 1000:
-            logger.error(f"获取UserToken时发生错误，Error: {request_result.get('message')}")
-        request_result = get_user_max_number()
+            logger.error(f"获取UserToken时发生错误，Error: {token_result.get('message')}")
+            token_data = {}
+        else:
+            token_data = token_result['data']
+        request_result = await DatabaseConnection.run(get_user_max_number)
         if request_result['code'] != 1000:
             logger.error(f"获取MaxUserID时发生错误，Error: {request_result.get('message')}")
         else:
             max_id = request_result['data']['max_id']
-            max_offset = (int(max_id / limit) + 1) * limit
-            offset = 0
-            while offset <= max_offset:
-                users_result = get_user_cache_batch(offset, limit)
-                if users_result['code'] == 1000:
-                    i = 1
-                    for user in users_result['data']:
-                        account_id = user['user_basic']['account_id']
-                        region_id = user['user_basic']['region_id']
-                        if (str(region_id)+str(account_id)) in token_result['data']:
-                            user['user_basic']['ac_value'] = token_result['data'][str(region_id)+str(account_id)]
-                        logger.info(f'{region_id} - {account_id} | ------------------[ {offset + i} / {max_id} ]')
-                        await Update.main(user)
-                        # await asyncio.sleep(1)
-                        i += 1
-                else:
-                    logger.error(f"获取CacheUsers时发生错误，Error: {users_result.get('message')}")
-                offset += limit
+            # 同时更新 MYSQL_POOL_SIZE 个用户，一个用户写入数据库时其他用户的网络请求可以继续
+            semaphore = asyncio.Semaphore(settings.MYSQL_POOL_SIZE)
+            tasks = set()
+            try:
+                async for row in DatabaseConnection.iterate(iter_user_cache(batch_size=1000)):
+                    user = {
+                        'user_basic': {
+                            'region_id': row.region_id,
+                            'account_id': row.account_id,
+                            'ac_value': token_data.get(str(row.region_id)+str(row.account_id))
+                        },
+                        'user_info': {
+                            'is_active': row.is_active,
+                            'active_level': row.active_level
+                        },
+                        'user_ships':{
+                            'battles_count': row.battles_count,
+                            'hash_value': row.hash_value,
+                            'update_time': row.update_time
+                        }
+                    }
+                    await semaphore.acquire()
+                    logger.info(f'{row.region_id} - {row.account_id} | ------------------[ {row.id} / {max_id} ]')
+                    task = asyncio.create_task(self.update_one(semaphore, user))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    # await asyncio.sleep(1)
+            except Exception:
+                # 读取用户数据多次失败时不能当作遍历完成
+                logger.error(traceback.format_exc())
+                logger.error('遍历用户数据时发生错误，本轮更新提前结束')
+            finally:
+                await asyncio.gather(*tasks)
         end_time = int(time.time())
         # 避免测试时候的循环bug
         if end_time - start_time <= 4*60*60-10:
@@ -50,6 +69,12 @@ class ContinuousUserCacheUpdater:
             logger.info(f'更新线程休眠 {round(sleep_time,2)} s')
             await asyncio.sleep(sleep_time)
 
+    async def update_one(self, semaphore: asyncio.Semaphore, user: dict):
+        try:
+            await Update.main(user)
+        finally:
+            semaphore.release()
+
     async def continuous_update(self):
         # 持续循环更新，直到接收到停止信号
         # 似乎写不写没区别(
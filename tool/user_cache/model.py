@@ -1,7 +1,9 @@
 import time
+from collections import namedtuple
 import traceback
 import pymysql
 from db import DatabaseConnection
+from provision import ensure_users
 
 from utils import BinaryParserUtils, BinaryGeneratorUtils
 from config import settings
@@ -10,6 +12,8 @@ from log import log as logger
 MAIN_DB = settings.DB_NAME_MAIN
 BOT_DB = settings.DB_NAME_BOT
 CACHE_DB = settings.DB_NAME_SHIP
+# 流式读取时单页读取失败的重试次数，重试后仍然失败时抛出异常
+PAGE_RETRY_TIMES = 3
 
 
 def get_user_max_number():
@@ -72,65 +76,73 @@ def get_user_token():
             cur.close()
         conn.close()
 
-def get_user_cache_batch(offset: int, limit = 1000):
-    '''批量获取用户缓存的数据
+# 流式读取用户缓存数据时每行返回的字段
+UserCacheRow = namedtuple(
+    'UserCacheRow',
+    ['id', 'region_id', 'account_id', 'is_active', 'active_level', 'battles_count', 'hash_value', 'update_time']
+)
 
-    获取用户缓存数据，用于缓存的更新
+def iter_user_cache(batch_size: int = 1000, region_id: int = None, active_level: list = None):
+    '''流式读取用户缓存的数据
+
+    按照 id 进行 keyset 分页(WHERE b.id > last_id ORDER BY b.id LIMIT n)，id 不连续时不会产生空查询
+
+    每页使用无缓冲的服务端游标读取，逐行转换为 UserCacheRow 后释放连接再返回，更新用户时不会占用数据库连接，内存占用只和 batch_size 有关
+
+    已注销账号的数据会在SQL中排除，避免浪费服务器资源
 
     参数:
-        offset: 从哪个id开始读取
-        limit: 每次读取多少条数据
-    '''
-    pool = DatabaseConnection.get_pool()
-    conn = pool.connection()
-    cur = None
-    try:
-        conn.begin()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
+        batch_size: 每页读取多少条数据
+        region_id: 只读取该服务器的用户
+        active_level: 只读取活跃等级在列表中的用户
 
-        data = []
-        cur.execute(
-            "SELECT b.region_id, b.account_id, i.is_active, i.active_level, UNIX_TIMESTAMP(i.updated_at) AS info_update_time, "
-            "s.battles_count, s.hash_value, UNIX_TIMESTAMP(s.updated_at) AS update_time "
-            f"FROM {MAIN_DB}.user_basic AS b "
-            f"LEFT JOIN {MAIN_DB}.user_info AS i ON i.account_id = b.account_id "
-            f"LEFT JOIN {MAIN_DB}.user_ships AS s ON s.account_id = b.account_id "
-            "WHERE b.id BETWEEN %s AND %s;", 
-            [offset+1, offset+limit]
-        )
-        rows = cur.fetchall()
+    返回:
+        UserCacheRow 的生成器，单页读取失败时重试 PAGE_RETRY_TIMES 次，仍然失败时记录日志并抛出异常，调用方可以区分读取中断和读取完成
+    '''
+    conditions = ["(i.updated_at IS NULL OR i.is_active <> 0)"]
+    filter_params = []
+    if region_id is not None:
+        conditions.append("b.region_id = %s")
+        filter_params.append(region_id)
+    if active_level:
+        conditions.append(f"i.active_level IN ({', '.join(['%s'] * len(active_level))})")
+        filter_params.extend(active_level)
+    sql = (
+        "SELECT b.id, b.region_id, b.account_id, i.is_active, i.active_level, "
+        "s.battles_count, s.hash_value, UNIX_TIMESTAMP(s.updated_at) AS update_time "
+        f"FROM {MAIN_DB}.user_basic AS b "
+        f"LEFT JOIN {MAIN_DB}.user_info AS i ON i.account_id = b.account_id "
+        f"LEFT JOIN {MAIN_DB}.user_ships AS s ON s.account_id = b.account_id "
+        f"WHERE b.id > %s AND {' AND '.join(conditions)} "
+        "ORDER BY b.id LIMIT %s;"
+    )
+    last_id = 0
+    while True:
+        rows = None
+        for retry in range(PAGE_RETRY_TIMES + 1):
+            pool = DatabaseConnection.get_pool()
+            conn = pool.connection()
+            cur = None
+            try:
+                cur = conn.cursor(pymysql.cursors.SSCursor)
+                cur.execute(sql, [last_id] + filter_params + [batch_size])
+                rows = [UserCacheRow(*row) for row in cur]
+                break
+            except Exception:
+                logger.error(traceback.format_exc())
+                if retry == PAGE_RETRY_TIMES:
+                    raise
+                logger.warning(f'读取id大于 {last_id} 的数据失败，{retry + 1}/{PAGE_RETRY_TIMES} 次重试')
+                time.sleep(5 * (retry + 1))
+            finally:
+                if cur:
+                    cur.close()
+                conn.close()
         for row in rows:
-            # 排除已注销账号的数据，避免浪费服务器资源
-            if row['info_update_time'] and not row['is_active']:
-                continue
-            user = {
-                'user_basic': {
-                    'region_id': row['region_id'],
-                    'account_id': row['account_id'],
-                    'ac_value': None
-                },
-                'user_info': {
-                    'is_active': row['is_active'],
-                    'active_level': row['active_level']
-                },
-                'user_ships':{
-                    'battles_count': row['battles_count'],
-                    'hash_value': row['hash_value'],
-                    'update_time': row['update_time']
-                }
-            }
-            data.append(user)
-        
-        conn.commit()
-        return {'status': 'ok','code': 1000,'message': 'Success','data': data}
-    except Exception:
-        conn.rollback()
-        logger.error(traceback.format_exc())
-        return {'status': 'error','code': 3000,'message': 'DatabaseError','data': None}
-    finally:
-        if cur:
-            cur.close()
-        conn.close()
+            yield row
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
 
 def check_user_basic(user_data: dict):
     '''检查用户数据是否需要更新
@@ -155,26 +167,7 @@ def check_user_basic(user_data: dict):
         )
         user = cur.fetchone()
         if not user:
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                [account_id, region_id, f'User_{account_id}']
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                [account_id]
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                [account_id]
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                [account_id]
-            )
-            cur.execute(
-                f"UPDATE {MAIN_DB}.user_basic SET username = %s WHERE region_id = %s AND account_id = %s",
-                [nickname, region_id, account_id]
-            )
+            ensure_users(cur, [(account_id, region_id, nickname)], updated=True)
         else:
             # 根据数据库的数据判断用户是否更改名称
             if user['username'] != nickname and user['update_time'] != None:
@@ -274,22 +267,7 @@ def get_user_cache(account_id: int, region_id: int):
         user = cur.fetchone()
         if user is None:
             # 用户不存在
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
-                [account_id, region_id, f'User_{account_id}']
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES (%s);",
-                [account_id]
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_ships (account_id) VALUES (%s);",
-                [account_id]
-            )
-            cur.execute(
-                f"INSERT INTO {MAIN_DB}.user_clan (account_id) VALUES (%s);",
-                [account_id]
-            )
+            ensure_users(cur, [(account_id, region_id, f'User_{account_id}')])
             data = {
                 'battles_count': None,
                 'hash_value': None,
@@ -315,8 +293,13 @@ def get_user_cache(account_id: int, region_id: int):
             cur.close()
         conn.close()
 
-def check_existing_ship(ship_id_set: set):
-    """检查ship_id是否存在于数据库"""
+def check_existing_ship(ship_id_set: set, create_table: bool = True):
+    """检查ship_id是否存在于数据库
+
+    参数:
+        ship_id_set: 需要检查的船只id
+        create_table: 是否为新的船只创建 ship_<id> 表，使用分区表 ship_cache 时不需要
+    """
     pool = DatabaseConnection.get_pool()
     conn = pool.connection()
     cur = None
@@ -336,6 +319,12 @@ def check_existing_ship(ship_id_set: set):
             if ship_id not in exists_list:
                 not_exists_set.add(ship_id)
         for ship_id in not_exists_set:
+            if not create_table:
+                cur.execute(
+                    f"INSERT IGNORE INTO {CACHE_DB}.existing_ships ( ship_id ) VALUE ( %s )",
+                    [ship_id]
+                )
+                continue
             cur.execute(
                 f'''CREATE TABLE IF NOT EXISTS {CACHE_DB}.ship_%s (
                     id               INT          AUTO_INCREMENT,
@@ -433,6 +422,54 @@ def update_user_ship(user_data: dict):
         conn.close()
 
 
+def update_ship_cache(user_data: dict):
+    '''更新分区表 ship_cache 中用户的船只数据
+
+    所有船只的数据通过一条 INSERT ... ON DUPLICATE KEY UPDATE 写入
+
+    参数:
+        user_data [dict]
+    '''
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        account_id = user_data['account_id']
+        region_id = user_data['region_id']
+        params = []
+        for ship_id, ship_data in user_data['ship_dict'].items():
+            params.extend([int(ship_id), region_id, account_id] + ship_data)
+        if params:
+            ship_count = len(user_data['ship_dict'])
+            cur.execute(
+                f"INSERT INTO {CACHE_DB}.ship_cache (ship_id, region_id, account_id, battles_count, battle_type_1, "
+                "battle_type_2, battle_type_3, wins, damage_dealt, frags, exp, survived, scouting_damage, art_agro, "
+                "planes_killed, max_exp, max_damage_dealt, max_frags) VALUES "
+                + ', '.join(['(' + ', '.join(['%s'] * 18) + ')'] * ship_count) + " "
+                "ON DUPLICATE KEY UPDATE battles_count = VALUES(battles_count), battle_type_1 = VALUES(battle_type_1), "
+                "battle_type_2 = VALUES(battle_type_2), battle_type_3 = VALUES(battle_type_3), wins = VALUES(wins), "
+                "damage_dealt = VALUES(damage_dealt), frags = VALUES(frags), exp = VALUES(exp), "
+                "survived = VALUES(survived), scouting_damage = VALUES(scouting_damage), art_agro = VALUES(art_agro), "
+                "planes_killed = VALUES(planes_killed), max_exp = VALUES(max_exp), "
+                "max_damage_dealt = VALUES(max_damage_dealt), max_frags = VALUES(max_frags);",
+                params
+            )
+        
+        conn.commit()
+        return {'status': 'ok','code': 1000,'message': 'Success','data': None}
+    except Exception:
+        conn.rollback()
+        logger.error(traceback.format_exc())
+        return {'status': 'error','code': 3000,'message': 'DatabaseError','data': None}
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
 def update_user_ships(user_data: dict):
     '''检查并更新user_ships表
 
@@ -3,6 +3,7 @@ import asyncio
 from typing import Optional
 
 from log import log as logger
+from negative_cache import NegativeCache
 
 VORTEX_API_URL_LIST = {
     1: 'http://vortex.worldofwarships.asia',
@@ -13,6 +14,7 @@ VORTEX_API_URL_LIST = {
 }
 
 class Network:
+    @NegativeCache.cached
     async def fetch_data(url, method: str = 'get', data: Optional[dict] = None):
         async with httpx.AsyncClient() as client:
             try:
@@ -0,0 +1,81 @@
+from config import settings
+
+MAIN_DB = settings.DB_NAME_MAIN
+
+# 每条INSERT语句最多写入的行数
+PROVISION_BATCH_SIZE = 1000
+
+
+def get_batches(rows: list) -> list:
+    "将数据按照 PROVISION_BATCH_SIZE 分组"
+    return [rows[i:i + PROVISION_BATCH_SIZE] for i in range(0, len(rows), PROVISION_BATCH_SIZE)]
+
+def ensure_users(cur, users: list, updated: bool = False) -> int:
+    '''确保用户在数据库中存在，不存在则插入默认数据
+
+    使用 INSERT IGNORE 批量写入 user_basic/user_info/user_ships/user_clan，已经存在的数据不会被修改
+
+    需要在调用方的事务中使用
+
+    参数:
+        cur: 事务中的游标
+        users: [(account_id, region_id, username), ...]
+        updated: 新插入的用户是否设置updated_at，username为真实名称时使用
+
+    返回:
+        新插入的用户数量
+    '''
+    inserted = 0
+    basic_row = '(%s, %s, %s, CURRENT_TIMESTAMP)' if updated else '(%s, %s, %s)'
+    basic_columns = 'account_id, region_id, username, updated_at' if updated else 'account_id, region_id, username'
+    for batch in get_batches(list(dict.fromkeys(users))):
+        params = [value for user in batch for value in user]
+        cur.execute(
+            f"INSERT IGNORE INTO {MAIN_DB}.user_basic ({basic_columns}) "
+            f"VALUES {', '.join([basic_row] * len(batch))};",
+            params
+        )
+        inserted += cur.rowcount
+        account_ids = [user[0] for user in batch]
+        for table in ['user_info', 'user_ships', 'user_clan']:
+            cur.execute(
+                f"INSERT IGNORE INTO {MAIN_DB}.{table} (account_id) "
+                f"VALUES {', '.join(['(%s)'] * len(batch))};",
+                account_ids
+            )
+    return inserted
+
+def ensure_clans(cur, clans: list, updated: bool = False) -> int:
+    '''确保工会在数据库中存在，不存在则插入默认数据
+
+    使用 INSERT IGNORE 批量写入 clan_basic/clan_info/clan_users/clan_season，已经存在的数据不会被修改
+
+    需要在调用方的事务中使用
+
+    参数:
+        cur: 事务中的游标
+        clans: [(clan_id, region_id, tag), ...]
+        updated: 新插入的工会是否设置updated_at，tag为真实名称时使用
+
+    返回:
+        新插入的工会数量
+    '''
+    inserted = 0
+    basic_row = '(%s, %s, %s, CURRENT_TIMESTAMP)' if updated else '(%s, %s, %s)'
+    basic_columns = 'clan_id, region_id, tag, updated_at' if updated else 'clan_id, region_id, tag'
+    for batch in get_batches(list(dict.fromkeys(clans))):
+        params = [value for clan in batch for value in clan]
+        cur.execute(
+            f"INSERT IGNORE INTO {MAIN_DB}.clan_basic ({basic_columns}) "
+            f"VALUES {', '.join([basic_row] * len(batch))};",
+            params
+        )
+        inserted += cur.rowcount
+        clan_ids = [clan[0] for clan in batch]
+        for table in ['clan_info', 'clan_users', 'clan_season']:
+            cur.execute(
+                f"INSERT IGNORE INTO {MAIN_DB}.{table} (clan_id) "
+                f"VALUES {', '.join(['(%s)'] * len(batch))};",
+                clan_ids
+            )
+    return inserted
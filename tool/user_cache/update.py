@@ -3,14 +3,19 @@ import hashlib
 import traceback
 
 from log import log as logger
+from config import settings
 from network import Network
+from db import DatabaseConnection
+from profile_cache import ProfileCache
+from write_buffer import WriteBuffer
 from model import (
     check_user_basic, 
     check_user_info, 
     get_user_cache, 
     check_existing_ship, 
     update_user_ship, 
-    update_user_ships
+    update_user_ships,
+    update_ship_cache
 )
 
 class Update:
@@ -79,8 +84,8 @@ class Update:
         if basic_data[0]['code'] == 1001:
             # 用户数据不存在
             user_info['is_active'] = 0
-            self.update_user_info(account_id, region_id, user_info)
-            self.update_user_cache(account_id, region_id, user_cache)
+            await self.update_user_info(account_id, region_id, user_info)
+            await self.update_user_cache(account_id, region_id, user_cache)
             return
         else:
             user_basic['nickname'] = basic_data[0]['data'][str(account_id)]['name']
@@ -88,9 +93,9 @@ class Update:
                 # 隐藏战绩
                 user_info['is_public'] = 0
                 user_info['active_level'] = self.get_active_level(user_info)
-                self.update_user_basic(account_id, region_id, user_basic)
-                self.update_user_info(account_id, region_id, user_info)
-                self.update_user_cache(account_id, region_id, user_cache)
+                await self.update_user_basic(account_id, region_id, user_basic)
+                await self.update_user_info(account_id, region_id, user_info)
+                await self.update_user_cache(account_id, region_id, user_cache)
                 return
             user_basic_data = basic_data[0]['data'][str(account_id)]['statistics']
             if (
@@ -99,18 +104,18 @@ class Update:
             ):
                 # 用户没有数据
                 user_info['is_active'] = 0
-                self.update_user_basic(account_id, region_id, user_basic)
-                self.update_user_info(account_id, region_id, user_info)
-                self.update_user_cache(account_id, region_id, user_cache)
+                await self.update_user_basic(account_id, region_id, user_basic)
+                await self.update_user_info(account_id, region_id, user_info)
+                await self.update_user_cache(account_id, region_id, user_cache)
                 return
             if user_basic_data['basic']['leveling_points'] == 0:
                 # 用户没有数据
                 user_info['total_battles'] = 0
                 user_info['last_battle_time'] = 0
                 user_info['active_level'] = self.get_active_level(user_info)
-                self.update_user_basic(account_id, region_id, user_basic)
-                self.update_user_info(account_id, region_id, user_info)
-                self.update_user_cache(account_id, region_id, user_cache)
+                await self.update_user_basic(account_id, region_id, user_basic)
+                await self.update_user_info(account_id, region_id, user_info)
+                await self.update_user_cache(account_id, region_id, user_cache)
                 return
             # 获取user_info的数据并更新数据库
             user_info['total_battles'] = user_basic_data['basic']['leveling_points']
@@ -118,9 +123,9 @@ class Update:
             user_info['active_level'] = self.get_active_level(user_info)
         if user_data['user_ships']['battles_count'] == user_info['total_battles']:
             user_cache['battles_count'] = user_info['total_battles']
-            self.update_user_basic(account_id, region_id, user_basic)
-            self.update_user_info(account_id, region_id, user_info)
-            self.update_user_cache(account_id, region_id, user_cache)
+            await self.update_user_basic(account_id, region_id, user_basic)
+            await self.update_user_info(account_id, region_id, user_info)
+            await self.update_user_cache(account_id, region_id, user_cache)
             logger.debug(f'{region_id} - {account_id} | ├── 未有更新数据，跳过更新')
             return
         user_ships_data = await Network.get_cache_data(account_id,region_id,ac_value)
@@ -132,40 +137,48 @@ class Update:
         if user_data['user_ships']['hash_value'] == new_hash_value:
             logger.debug(f'{region_id} - {account_id} | ├── 未有更新数据，跳过更新')
             user_cache['battles_count'] = user_info['total_battles']
-            self.update_user_basic(account_id, region_id, user_basic)
-            self.update_user_info(account_id, region_id, user_info)
-            self.update_user_cache(account_id, region_id, user_cache)
+            await self.update_user_basic(account_id, region_id, user_basic)
+            await self.update_user_info(account_id, region_id, user_info)
+            await self.update_user_cache(account_id, region_id, user_cache)
             return
         else:
             user_cache['battles_count'] = user_info['total_battles']
             user_cache['hash_value'] = new_hash_value
             user_cache['ships_data'] = sorted_dict
             user_cache['details_data'] = new_user_data['details']
-            self.update_user_basic(account_id, region_id, user_basic)
-            self.update_user_info(account_id, region_id, user_info)
-            self.update_user_cache(account_id, region_id, user_cache)
+            await self.update_user_basic(account_id, region_id, user_basic)
+            await self.update_user_info(account_id, region_id, user_info)
+            await self.update_user_cache(account_id, region_id, user_cache)
             return
 
-    def update_user_basic(account_id: int, region_id: int, user_data: dict):
-        # 更新user_basic表的信息
-        result = check_user_basic(user_data)
+    async def update_user_basic(account_id: int, region_id: int, user_data: dict):
+        # 更新user_basic表的信息，优先写入主程序的写缓冲批量写入
+        if await WriteBuffer.push('user_basic', user_data):
+            logger.debug(f"{region_id} - {account_id} | ├── 用户basic数据已写入写缓冲")
+            return
+        result = await DatabaseConnection.run(check_user_basic, user_data)
         if result.get('code', None) != 1000:
             logger.error(f"{region_id} - {account_id} | ├── 数据库更新失败，Error: {result.get('code')} {result.get('message')}")
             return
+        # 用户名称可能已经修改
+        await ProfileCache.invalidate_users(region_id, [account_id])
         logger.debug(f"{region_id} - {account_id} | ├── 用户basic数据更新完成")
         return
 
-    def update_user_info(account_id: int, region_id: int, user_data: dict):
-        # 更新user_info表信息
-        result = check_user_info(user_data)
+    async def update_user_info(account_id: int, region_id: int, user_data: dict):
+        # 更新user_info表信息，优先写入主程序的写缓冲批量写入
+        if await WriteBuffer.push('user_info', user_data):
+            logger.debug(f"{region_id} - {account_id} | ├── 用户info数据已写入写缓冲")
+            return
+        result = await DatabaseConnection.run(check_user_info, user_data)
         if result.get('code', None) != 1000:
             logger.error(f"{region_id} - {account_id} | ├── 数据库更新失败，Error: {result.get('code')} {result.get('message')}")
             return
         logger.debug(f"{region_id} - {account_id} | ├── 用户info数据更新完成")
         return
     
-    def update_user_cache(account_id: int, region_id: int, user_data: dict):
-        user_cache_result = get_user_cache(account_id, region_id)
+    async def update_user_cache(account_id: int, region_id: int, user_data: dict):
+        user_cache_result = await DatabaseConnection.run(get_user_cache, account_id, region_id)
         if user_cache_result.get('code', None) != 1000:
             logger.error(f"{region_id} - {account_id} | ├── 获取用户缓存数据失败，Error: {user_cache_result.get('code')} {user_cache_result.get('message')}")
             return
@@ -186,20 +199,28 @@ class Update:
                 'region_id': region_id,
                 'ship_dict': replace_ship_dict
             }
-            check_ship_id_result = check_existing_ship(ship_id_set)
+            check_ship_id_result = await DatabaseConnection.run(
+                check_existing_ship,
+                ship_id_set, 
+                create_table = settings.SHIP_CACHE_BACKEND != 'partitioned'
+            )
             if check_ship_id_result.get('code', None) != 1000:
                 return check_ship_id_result
             if delete_ship_list != [] or replace_ship_dict != {}:
                 ship_data = data
             del user_data['details_data']
         if user_data:
-            result = update_user_ships(user_data)
+            result = await DatabaseConnection.run(update_user_ships, user_data)
             if result.get('code', None) != 1000:
                 logger.error(f"{region_id} - {account_id} | ├── 数据库更新失败，Error: {result.get('code')} {result.get('message')}")
                 return
             logger.debug(f"{region_id} - {account_id} | ├── 用户ships数据更新完成")
         if ship_data:
-            result = update_user_ship(ship_data)
+            if settings.SHIP_CACHE_BACKEND == 'partitioned':
+                # 所有船只的数据一次写入
+                result = await DatabaseConnection.run(update_ship_cache, ship_data)
+            else:
+                result = await DatabaseConnection.run(update_user_ship, ship_data)
             if result.get('code', None) != 1000:
                 logger.error(f"{region_id} - {account_id} | ├── 数据库更新失败，Error: {result.get('code')} {result.get('message')}")
                 return
@@ -0,0 +1,50 @@
+import json
+
+from log import log as logger
+from config import settings
+
+REDIS_URL = settings.REDIS_URL
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+# 和主程序 app.models.UserWriteBuffer 保持一致
+STREAM_KEY = 'app_db:write_buffer:user'
+BUFFER_FIELDS = {
+    'user_basic': ('nickname',),
+    'user_info': ('is_active', 'active_level', 'is_public', 'total_battles', 'last_battle_time')
+}
+
+
+class WriteBuffer:
+    '''主程序用户数据写缓冲的写入端
+
+    user_basic和user_info的更新写入主程序的Redis Stream，由主程序的后台任务合并后批量写入数据库，名称变更时主程序会删除对应的用户缓存
+
+    没有配置REDIS_URL或者写入失败时返回False，由调用方直接写入数据库
+    '''
+    _client = None
+
+    @classmethod
+    def _get_client(cls):
+        if cls._client is None and REDIS_URL and redis is not None:
+            cls._client = redis.from_url(REDIS_URL, decode_responses=True)
+        return cls._client
+
+    @classmethod
+    async def push(cls, table: str, user_data: dict) -> bool:
+        client = cls._get_client()
+        if client is None:
+            return False
+        data = {'account_id': user_data['account_id'], 'region_id': user_data['region_id']}
+        for field in BUFFER_FIELDS[table]:
+            if user_data.get(field) is not None:
+                data[field] = user_data[field]
+        try:
+            await client.xadd(STREAM_KEY, {'data': json.dumps({table: data})})
+            return True
+        except Exception as e:
+            logger.warning(f'写缓冲写入失败，Error: {e}')
+            return False
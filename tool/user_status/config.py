@@ -11,10 +11,15 @@ class LoadConfig(BaseSettings):
     MYSQL_PORT: int
     MYSQL_USERNAME: str
     MYSQL_PASSWORD: str
+    # 数据库线程池和连接池的大小，即同时执行的数据库操作数量
+    MYSQL_POOL_SIZE: int = 4
 
     DB_NAME_MAIN: str
     DB_NAME_BOT: str
     DB_NAME_SHIP: str
+
+    # 船只缓存的存储方式：table 每艘船只一张 ship_<id> 表，partitioned 所有船只共用分区表 ship_cache
+    SHIP_CACHE_BACKEND: str = 'table'
     
     RABBITMQ_HOST: str
     RABBITMQ_USERNAME: str
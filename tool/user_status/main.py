@@ -24,9 +24,9 @@ class ContinuousUserCacheUpdater:
         #     if result['code'] != 1000:
         #         logger.error(f'{region_id} | 获取服务器最新版本失败')
         #     if result['data']['version']:
-        #         result = update_game_version(region_id, result['data']['version'])
+        #         result = await DatabaseConnection.run(update_game_version, region_id, result['data']['version'])
 
-        # result = get_game_version()
+        # result = await DatabaseConnection.run(get_game_version)
         result = {
             'status': 'ok', 
             'code': 1000, 
@@ -52,7 +52,7 @@ class ContinuousUserCacheUpdater:
         temp.close()
         for k, v in data.items():
             ship_data[int(k)] = v['tier']
-        ship_id_data = get_ship_list()
+        ship_id_data = await DatabaseConnection.run(get_ship_list)
         if result['code'] != 1000:
             logger.error(f'读取服务器版本失败')
         elif result['code'] != 1000:
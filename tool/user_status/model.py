@@ -105,74 +105,67 @@ def update_game_version(region_id: int, game_version: str):
         conn.close()
 
 
-def get_ship_max_number(ship_id: int):
-    '''获取数据库中id的最大值
+SHIP_CACHE_FIELDS = (
+    "account_id, region_id, battles_count, battle_type_1, battle_type_2, "
+    "battle_type_3, wins, damage_dealt, frags, exp, survived, scouting_damage, "
+    "art_agro, planes_killed, max_exp, max_damage_dealt, max_frags"
+)
 
-    获取id的最大值，用于数据库遍历更新时确定边界
+def iter_ship_cache(ship_id: int, batch_size: int = 1000):
+    '''流式读取船只的用户缓存数据
 
-    参数:
-        - ship_id
-    '''
-    pool = DatabaseConnection.get_pool()
-    conn = pool.connection()
-    cur = None
-    try:
-        conn.begin()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-
-        cur.execute(
-            f"SELECT MAX(id) AS max_id FROM {CACHE_DB}.ship_{ship_id};"
-        )
-        data = cur.fetchone()
-        
-        conn.commit()
-        return {'status': 'ok','code': 1000,'message': 'Success','data': data}
-    except Exception:
-        conn.rollback()
-        logger.error(traceback.format_exc())
-        return {'status': 'error','code': 3000,'message': 'DatabaseError','data': None}
-    finally:
-        if cur:
-            cur.close()
-        conn.close()
-
-def get_cache_batch(ship_id: int, offset: int, limit = 1000):
-    '''批量获取用户缓存的数据
+    使用 keyset 分页，每页通过无缓冲的服务端游标读取，释放连接后再返回数据，内存占用只和 batch_size 有关
 
-    获取用户缓存数据，用于缓存的更新
+    SHIP_CACHE_BACKEND 为 table 时按照 ship_<id> 表的 id 分页，为 partitioned 时按照分区表 ship_cache 的主键 (region_id, account_id) 分页，只会扫描该船只所在的分区
 
     参数:
-        offset: 从哪个id开始读取
-        limit: 每次读取多少条数据
-    '''
-    pool = DatabaseConnection.get_pool()
-    conn = pool.connection()
-    cur = None
-    try:
-        conn.begin()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
+        ship_id: 船只id
+        batch_size: 每页读取多少条数据
 
-        data = []
-        cur.execute(
-            "SELECT account_id, region_id, battles_count, battle_type_1, battle_type_2, "
-            "battle_type_3, wins, damage_dealt, frags, exp, survived, scouting_damage, "
-            "art_agro, planes_killed, max_exp, max_damage_dealt, max_frags "
-            f"FROM {CACHE_DB}.ship_%s "
-            "WHERE id BETWEEN %s AND %s;", 
-            [ship_id, offset+1, offset+limit]
+    返回:
+        用户数据(dict)的生成器，读取出错时记录日志并抛出异常
+    '''
+    partitioned = settings.SHIP_CACHE_BACKEND == 'partitioned'
+    if partitioned:
+        sql = (
+            f"SELECT {SHIP_CACHE_FIELDS} FROM {CACHE_DB}.ship_cache "
+            "WHERE ship_id = %s AND (region_id, account_id) > (%s, %s) "
+            "ORDER BY region_id, account_id LIMIT %s;"
         )
-        data = cur.fetchall()
-        
-        conn.commit()
-        return {'status': 'ok','code': 1000,'message': 'Success','data': data}
-    except Exception:
-        conn.rollback()
-        logger.error(traceback.format_exc())
-        return {'status': 'error','code': 3000,'message': 'DatabaseError','data': None}
-    finally:
-        if cur:
-            cur.close()
-        conn.close()
+        last_key = (0, 0)
+    else:
+        sql = (
+            f"SELECT id, {SHIP_CACHE_FIELDS} FROM {CACHE_DB}.ship_{int(ship_id)} "
+            "WHERE id > %s ORDER BY id LIMIT %s;"
+        )
+        last_key = (0,)
+    while True:
+        pool = DatabaseConnection.get_pool()
+        conn = pool.connection()
+        cur = None
+        try:
+            cur = conn.cursor(pymysql.cursors.SSDictCursor)
+            if partitioned:
+                cur.execute(sql, [ship_id, *last_key, batch_size])
+            else:
+                cur.execute(sql, [*last_key, batch_size])
+            rows = list(cur)
+        except Exception:
+            # 数据不完整时不能继续统计，由调用方结束本次更新
+            logger.error(traceback.format_exc())
+            raise
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        if partitioned:
+            last_key = (rows[-1]['region_id'], rows[-1]['account_id'])
+        else:
+            last_key = (rows[-1]['id'],)
 
 def get_user_name(user_list: list):
     pool = DatabaseConnection.get_pool()
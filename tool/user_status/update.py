@@ -6,7 +6,8 @@ import traceback
 
 from log import log as logger
 from config import settings
-from model import get_ship_max_number, get_cache_batch, get_clan_tag, get_user_name
+from db import DatabaseConnection
+from model import iter_ship_cache, get_clan_tag, get_user_name
 
 
 OLD_SHIP_ID_LIST = [
@@ -67,13 +68,6 @@ class Update:
             logger.debug(f'{ship_id} | └── 本次更新完成, 耗时: {round(cost_time,2)} s')
 
     async def service_master(self, ship_id: int, version: dict, user_cache: dict, clan_cache: dict, ship_data: dict):
-        request_result = get_ship_max_number(ship_id)
-        if request_result['code'] != 1000:
-            logger.error(f"{ship_id} | ├── 获取表MaxID时发生错误，Error: {request_result.get('message')}")
-            return
-        max_offset = request_result['data']['max_id']
-        limit = 1000
-        offset = 0
         total_result = {
             0: {}, 1: {}, 2: {}, 3: {}, 4: {}, 5: {}
         }
@@ -92,28 +86,20 @@ class Update:
             8: 40, 9: 50,
             10: 60, 11: 60
         }
-        while offset <= max_offset:
-            cache_result = get_cache_batch(ship_id, offset, limit)
-            if cache_result['code'] == 1000:
-                i = 1
-                for user in cache_result['data']:
-                    if user['battles_count'] >= leaderboard_limit.get(ship_tier, 99999):
-                        leader_list.append(user)
-                    region_id = user['region_id']
-                    if total_result[0] == {}:
-                        for key in update_keys:
-                            total_result[0][key] = 0
-                    if total_result[region_id] == {}:
-                        for key in update_keys:
-                            total_result[region_id][key] = 0
-                    else:
-                        for key in update_keys:
-                            total_result[0][key] += user[key]
-                            total_result[region_id][key] += user[key]
-                    i += 1
+        async for user in DatabaseConnection.iterate(iter_ship_cache(ship_id), chunk_size=1000):
+            if user['battles_count'] >= leaderboard_limit.get(ship_tier, 99999):
+                leader_list.append(user)
+            region_id = user['region_id']
+            if total_result[0] == {}:
+                for key in update_keys:
+                    total_result[0][key] = 0
+            if total_result[region_id] == {}:
+                for key in update_keys:
+                    total_result[region_id][key] = 0
             else:
-                logger.error(f"{ship_id} | ├── 获取cache时发生错误，Error: {cache_result.get('message')}")
-            offset += limit
+                for key in update_keys:
+                    total_result[0][key] += user[key]
+                    total_result[region_id][key] += user[key]
         for region_id in total_result.keys():
             if total_result[region_id] != {}:
                 for key in update_keys:
@@ -147,7 +133,7 @@ class Update:
         for user in leader_list:
             if user['account_id'] not in user_cache:
                 nocache_user.append([user['region_id'], user['account_id']])
-        user_cache_result = get_user_name(nocache_user)
+        user_cache_result = await DatabaseConnection.run(get_user_name, nocache_user)
         if user_cache_result['code'] != 1000:
             logger.error(f"{ship_id} | ├── 读取用户名称数据失败")
         else:
@@ -156,7 +142,7 @@ class Update:
                 if v[2] and v[2] not in clan_cache:
                     nocache_clan.append([v[1], v[2]])
             logger.debug(f"{ship_id} | ├── 读取 {len(nocache_user)} 个用户缓存")
-        clan_cache_result = get_clan_tag(nocache_clan)
+        clan_cache_result = await DatabaseConnection.run(get_clan_tag, nocache_clan)
         if clan_cache_result['code'] != 1000:
             logger.error(f"{ship_id} | ├── 读取工会名称数据失败")
         else: